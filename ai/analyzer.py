@@ -3,9 +3,16 @@ analyzer.py — Medical data analysis and AI-powered insights.
 Handles vital sign validation, conversation analysis, and suggestion generation.
 """
 
-from ai.medgemma_client import ask_medgemma
+import asyncio
+
+from ai.medgemma_client import ask_medgemma, ask_medgemma_async, stream_medgemma_async
+from ai.diagnosis_executor import run_diagnosis, stream_diagnosis
+from ai.inference_queue import QueueFullError
+from ai.context_builder import TASK_BUDGETS
+from db.records import Alert
 from ai.prompts import (
-    SYSTEM_PROMPT, CONVERSATION_ANALYSIS_PROMPT, SUGGESTION_PROMPT
+    SYSTEM_PROMPT, PATIENT_CONTEXT_PROMPT, SUMMARY_PROMPT,
+    CONVERSATION_ANALYSIS_PROMPT, SUGGESTION_PROMPT
 )
 
 # ── Vital Signs Normal Ranges ──
@@ -40,31 +47,30 @@ def check_vitals(vitals_dict, session_cache=None):
 
         # Critical values
         if v <= ranges['critical_low'] or v >= ranges['critical_high']:
-            alert = {
-                'type': 'critical',
-                'title': f"🔴 قيمة حرجة: {ranges['name']}",
-                'message': f"القيمة: {v} {ranges['unit']} — الطبيعي: {ranges['min']}–{ranges['max']} {ranges['unit']}",
-                'details': ''
-            }
             # Add context from patient history
+            details = ''
             if session_cache:
                 diseases = session_cache.get_disease_names()
                 if 'قصور في الشريان التاجي' in diseases and key in ('systolic_bp', 'heart_rate'):
-                    alert['details'] = '⚠️ المريض لديه تاريخ قصور شريان تاجي + دعامة → ECG فوري + Troponin'
+                    details = '⚠️ المريض لديه تاريخ قصور شريان تاجي + دعامة → ECG فوري + Troponin'
                 elif 'ربو' in diseases and key == 'spo2':
-                    alert['details'] = '⚠️ المريض يعاني من ربو — قد يحتاج Nebulizer فوري'
+                    details = '⚠️ المريض يعاني من ربو — قد يحتاج Nebulizer فوري'
                 elif 'Myasthenia Gravis' in diseases and key in ('spo2', 'respiratory_rate'):
-                    alert['details'] = '⚠️ المريضة تعاني MG — خطر فشل تنفسي — مراقبة FVC'
-            alerts.append(alert)
+                    details = '⚠️ المريضة تعاني MG — خطر فشل تنفسي — مراقبة FVC'
+            alerts.append(Alert(
+                type='critical',
+                title=f"🔴 قيمة حرجة: {ranges['name']}",
+                message=f"القيمة: {v} {ranges['unit']} — الطبيعي: {ranges['min']}–{ranges['max']} {ranges['unit']}",
+                details=details
+            ))
 
         # Abnormal but not critical
         elif v < ranges['min'] or v > ranges['max']:
-            alerts.append({
-                'type': 'high',
-                'title': f"🟡 قيمة غير طبيعية: {ranges['name']}",
-                'message': f"القيمة: {v} {ranges['unit']} — الطبيعي: {ranges['min']}–{ranges['max']} {ranges['unit']}",
-                'details': ''
-            })
+            alerts.append(Alert(
+                type='high',
+                title=f"🟡 قيمة غير طبيعية: {ranges['name']}",
+                message=f"القيمة: {v} {ranges['unit']} — الطبيعي: {ranges['min']}–{ranges['max']} {ranges['unit']}"
+            ))
 
     return alerts
 
@@ -91,49 +97,158 @@ def check_vitals_simple(vitals_dict):
     return "\n".join(results) if results else "لم يتم إدخال علامات حيوية"
 
 
+def patient_context(session_cache, task=None):
+    """The patient block shared by every prompt for this session (prefix-cached)."""
+    budget = TASK_BUDGETS.get(task)
+    return PATIENT_CONTEXT_PROMPT.format(patient_context=session_cache.get_context_for_ai(budget))
+
+
+def precompute_summary(session_cache):
+    """
+    Start generating the patient summary in the background (once per session).
+    Call from the event loop: the request goes through the triage priority
+    queue at the patient's priority. The result is stored in
+    session_cache.ai_summary when ready; the returned task is also kept on
+    session_cache.summary_future for later screens.
+    """
+    future = session_cache.summary_future
+    if session_cache.ai_summary is not None or (future is not None and not _failed(future)):
+        return future
+
+    future = asyncio.ensure_future(ask_medgemma_async(
+        SUMMARY_PROMPT, system_prompt=SYSTEM_PROMPT,
+        context=patient_context(session_cache, 'summary'),
+        priority=session_cache.get_priority()
+    ))
+    future.add_done_callback(lambda f: _store_summary(session_cache, f))
+    session_cache.summary_future = future
+    return future
+
+
+async def await_summary(session_cache):
+    """Wait for the session's summary (None on failure or when the queue is full)."""
+    if session_cache.ai_summary is not None:
+        return session_cache.ai_summary
+    future = precompute_summary(session_cache)
+    try:
+        # shield: a screen that stops waiting must not cancel the shared summary
+        return await asyncio.shield(future)
+    except QueueFullError:
+        print("⚠️ AI summary skipped: inference queue is full")
+        return None
+    except Exception as e:
+        print(f"⚠️ AI summary failed: {e}")
+        return None
+
+
+def _store_summary(session_cache, future):
+    # Skip futures dropped by SessionCache.refresh() — their summary is stale
+    if session_cache.summary_future is future and not _failed(future):
+        session_cache.ai_summary = future.result()
+
+
+def _failed(future):
+    return future.done() and (future.cancelled() or future.exception() is not None)
+
+
 def analyze_conversation(transcript, session_cache):
     """Analyze doctor-patient conversation using MedGemma."""
     if not transcript or not transcript.strip():
         return "لم يتم تقديم نص محادثة"
 
+    prompt, substance_alerts = _prepare_conversation_analysis(transcript, session_cache)
+    ai_analysis = ask_medgemma(prompt, system_prompt=SYSTEM_PROMPT,
+                               context=patient_context(session_cache, 'conversation'))
+    return ai_analysis, substance_alerts
+
+
+async def stream_conversation_analysis(transcript, session_cache):
+    """Yield (partial_analysis, substance_alerts) while MedGemma generates."""
+    prompt, substance_alerts = _prepare_conversation_analysis(transcript, session_cache)
+    # Rule-based alerts are ready before the first token
+    yield "", substance_alerts
+    async for text in _stream_response(prompt, session_cache, 'conversation'):
+        yield text, substance_alerts
+
+
+def _prepare_conversation_analysis(transcript, session_cache):
     # First, check for dangerous substances in the text
     substance_alerts = session_cache.check_multiple_substances(transcript)
 
     # Then use AI for deeper analysis
-    prompt = CONVERSATION_ANALYSIS_PROMPT.format(
-        transcript=transcript,
-        patient_context=session_cache.get_context_for_ai()
-    )
-
-    ai_analysis = ask_medgemma(prompt, system_prompt=SYSTEM_PROMPT)
-    return ai_analysis, substance_alerts
+    prompt = CONVERSATION_ANALYSIS_PROMPT.format(transcript=transcript)
+    return prompt, substance_alerts
 
 
 def generate_suggestions(session_cache, clinical_data="", vitals_text=""):
     """Generate AI-powered suggestions for the ER doctor."""
-    prompt = SUGGESTION_PROMPT.format(
-        patient_context=session_cache.get_context_for_ai(),
-        clinical_data=clinical_data,
-        vitals=vitals_text
-    )
+    prompt = _suggestion_prompt(clinical_data, vitals_text)
+    return ask_medgemma(prompt, system_prompt=SYSTEM_PROMPT, context=patient_context(session_cache, 'suggestions'))
+
 
-    return ask_medgemma(prompt, system_prompt=SYSTEM_PROMPT)
+async def stream_suggestions(session_cache, clinical_data="", vitals_text=""):
+    """Yield the suggestions text as it grows."""
+    prompt = _suggestion_prompt(clinical_data, vitals_text)
+    async for text in _stream_response(prompt, session_cache, 'suggestions'):
+        yield text
+
+
+def _suggestion_prompt(clinical_data, vitals_text):
+    return SUGGESTION_PROMPT.format(clinical_data=clinical_data, vitals=vitals_text)
 
 
 def run_diagnosis_loop(session_cache, chief_complaint, form_data, transcript=""):
-    """Run the deep diagnosis detective loop."""
-    from ai.prompts import DIAGNOSIS_LOOP_PROMPT
+    """Run the deep diagnosis detective loop (parallel sub-tasks + synthesis)."""
+    case, substance_alerts = _prepare_diagnosis(session_cache, chief_complaint, form_data, transcript)
+    ai_result = run_diagnosis(case, patient_context(session_cache, 'diagnosis'))
+    return ai_result, substance_alerts
 
-    prompt = DIAGNOSIS_LOOP_PROMPT.format(
-        session_cache_context=session_cache.get_context_for_ai(),
-        chief_complaint=chief_complaint,
-        form_data=form_data,
-        transcript=transcript
-    )
 
+async def stream_diagnosis_loop(session_cache, chief_complaint, form_data, transcript=""):
+    """Yield (partial_report, substance_alerts) as each section of the loop is generated."""
+    case, substance_alerts = _prepare_diagnosis(session_cache, chief_complaint, form_data, transcript)
+    yield "", substance_alerts
+    async for text in stream_diagnosis(case, patient_context(session_cache, 'diagnosis'), session_cache.get_priority()):
+        yield text, substance_alerts
+
+
+async def _stream_response(prompt, session_cache, task):
+    """
+    Yield the growing response text for a patient task.
+    The request is queued with the patient's triage level; while it waits,
+    a queue-position notice is yielded instead.
+    """
+    text = ""
+    try:
+        async for position, chunk in stream_medgemma_async(
+            prompt,
+            system_prompt=SYSTEM_PROMPT,
+            context=patient_context(session_cache, task),
+            priority=session_cache.get_priority()
+        ):
+            if chunk is None:
+                yield f"⏳ الطلب في قائمة الانتظار — عدد الطلبات قبله: {position}"
+                continue
+            text += chunk
+            yield text
+    except QueueFullError:
+        yield "⚠️ النظام مشغول حالياً — قائمة انتظار الذكاء الاصطناعي ممتلئة. حاول مرة أخرى بعد قليل."
+
+
+def _prepare_diagnosis(session_cache, chief_complaint, form_data, transcript):
     # Also check for substances mentioned
     all_text = f"{chief_complaint} {form_data} {transcript}"
     substance_alerts = session_cache.check_multiple_substances(all_text)
 
-    ai_result = ask_medgemma(prompt, system_prompt=SYSTEM_PROMPT, max_tokens=2048)
-    return ai_result, substance_alerts
+    # Past visits matching the complaint (after screening — old treatments are not new exposures)
+    history = session_cache.get_relevant_history(chief_complaint)
+    if history:
+        form_data += "\n\nزيارات سابقة مرتبطة بالشكوى:\n" + "\n".join(
+            f"- {v['visit_date']}: {v['reason']} → {v['diagnosis']} ({v['treatment']})" for v in history
+        )
+    case = {
+        'chief_complaint': chief_complaint,
+        'form_data': form_data,
+        'transcript': transcript,
+    }
+    return case, substance_alerts
@@ -0,0 +1,344 @@
+"""
+backends.py — Inference backends behind medgemma_client.
+Selected with MEDGEMMA_BACKEND:
+  transformers — MedGemma loaded in this process (GPU)
+  mock         — canned demo responses
+  http         — a separate OpenAI-compatible server (/v1/chat/completions)
+  synthetic    — mock text streamed at modelled GPU latency (load testing)
+"""
+
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+import urllib.parse
+
+from ai.mock_responses import generate_mock_response, chunk_text
+
+MODEL_NAME = "google/medgemma-4b-it"
+
+# Sampling settings shared by every generation path
+TEMPERATURE = 0.3
+TOP_P = 0.9
+DO_SAMPLE = os.environ.get("MEDGEMMA_DO_SAMPLE", "true").lower() == "true"
+
+# ── HTTP Backend Settings ──
+HTTP_URL = os.environ.get("MEDGEMMA_HTTP_URL", "http://localhost:8000")
+HTTP_MODEL = os.environ.get("MEDGEMMA_HTTP_MODEL", MODEL_NAME)
+HTTP_API_KEY = os.environ.get("MEDGEMMA_HTTP_API_KEY", "")
+HTTP_TIMEOUT = float(os.environ.get("MEDGEMMA_HTTP_TIMEOUT", "120"))
+HTTP_RETRIES = int(os.environ.get("MEDGEMMA_HTTP_RETRIES", "2"))
+HTTP_POOL_SIZE = int(os.environ.get("MEDGEMMA_HTTP_POOL_SIZE", "8"))
+
+# Statuses worth retrying: rate limiting and transient gateway/server errors
+_RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class InferenceBackend:
+    """Base class — subclasses implement stream(); generate() joins it."""
+
+    name = "base"
+    model_id = MODEL_NAME
+    model = None
+    tokenizer = None
+
+    def generate(self, prompt, system_prompt="", max_tokens=1024, context=""):
+        """Return the full response text."""
+        return "".join(self.stream(prompt, system_prompt, max_tokens, context))
+
+    def stream(self, prompt, system_prompt="", max_tokens=1024, context=""):
+        """Yield the response as text chunks."""
+        raise NotImplementedError
+
+    def cache_params(self):
+        """
+        Sampling params that identify a deterministic response, or None when
+        the output is sampled and must not be cached.
+        """
+        return None
+
+    def close(self):
+        """Release resources held by the backend."""
+
+
+def with_context(context, prompt):
+    """Place the patient context block before the task prompt."""
+    return f"{context}\n\n{prompt}" if context else prompt
+
+
+class MockBackend(InferenceBackend):
+    """Canned Arabic responses — no model needed."""
+
+    name = "mock"
+    model_id = "mock"
+    model = "mock"
+    tokenizer = "mock"
+
+    def __init__(self, loading_error=None):
+        self.loading_error = loading_error
+
+    def generate(self, prompt, system_prompt="", max_tokens=1024, context=""):
+        return generate_mock_response(with_context(context, prompt), system_prompt, self.loading_error)
+
+    def stream(self, prompt, system_prompt="", max_tokens=1024, context=""):
+        yield from chunk_text(self.generate(prompt, system_prompt, max_tokens, context))
+
+    def cache_params(self):
+        return {}
+
+
+class TransformersBackend(InferenceBackend):
+    """MedGemma 4B in this process, behind the continuous-batching scheduler."""
+
+    name = "transformers"
+
+    def __init__(self, model_name=MODEL_NAME):
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+        import torch
+
+        print(f"🧠 Loading {model_name}...")
+        self.model_id = model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            torch_dtype=torch.float16,
+            load_in_4bit=True,
+            device_map="auto"
+        )
+        self._scheduler = None
+        self._lock = threading.Lock()
+        print("✅ MedGemma loaded successfully")
+
+    def generate(self, prompt, system_prompt="", max_tokens=1024, context=""):
+        # Concurrent callers share batched forward passes
+        prefix = _prefix_segments(system_prompt, context)
+        return self._get_scheduler().submit(prompt, max_tokens, prefix=prefix).result()
+
+    def stream(self, prompt, system_prompt="", max_tokens=1024, context=""):
+        from transformers import TextIteratorStreamer
+
+        prefix = _prefix_segments(system_prompt, context)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=False, skip_special_tokens=True)
+        future = self._get_scheduler().submit(prompt, max_tokens, streamer=streamer, prefix=prefix)
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+        except GeneratorExit:
+            # Closed early (ticket cancelled) — stop generating this sequence
+            future.abandon()
+            raise
+        # Surface generation errors to the caller once the streamer is closed
+        future.result()
+
+    def cache_params(self):
+        return None if DO_SAMPLE else {'do_sample': False}
+
+    def close(self):
+        if self._scheduler is not None:
+            self._scheduler.shutdown()
+
+    def _get_scheduler(self):
+        """Create the continuous-batching scheduler on first use."""
+        with self._lock:
+            if self._scheduler is None:
+                from ai.batch_scheduler import BatchScheduler, TransformersBatchEngine
+                from ai.prefix_cache import PrefixCache
+                engine = TransformersBatchEngine(
+                    self.model, self.tokenizer,
+                    temperature=TEMPERATURE, top_p=TOP_P, do_sample=DO_SAMPLE,
+                    prefix_cache=PrefixCache()
+                )
+                self._scheduler = BatchScheduler(engine)
+        return self._scheduler
+
+
+def _prefix_segments(system_prompt, context):
+    """
+    Split the shared part of a prompt into (system prompt, patient record,
+    current visit) segments — entering vitals only re-prefills the last one.
+    """
+    from ai.context_builder import split_dynamic
+
+    record, visit = split_dynamic(context or "")
+    return (
+        f"{system_prompt}\n\n" if system_prompt else "",
+        f"{record}\n\n" if record else "",
+        f"{visit}\n\n" if visit else "",
+    )
+
+
+# ══════════════════════════════════════════════════════════════
+# HTTP backend — OpenAI-compatible inference server
+# ══════════════════════════════════════════════════════════════
+
+class _ConnectionPool:
+    """Bounded pool of keep-alive HTTP connections to one server."""
+
+    def __init__(self, base_url, size, timeout):
+        parts = urllib.parse.urlsplit(base_url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.https else 80)
+        self.base_path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self.size = size
+        self._slots = threading.BoundedSemaphore(size)
+        self.opened = 0
+
+    def acquire(self):
+        """
+        Borrow an idle connection (or open one). When the pool is exhausted,
+        waits up to the request timeout and then raises TimeoutError.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(
+                f"No free connection to the inference server after {self.timeout}s "
+                f"(all {self.size} in use — raise MEDGEMMA_HTTP_POOL_SIZE?)"
+            )
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            self.opened += 1
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            return cls(self.host, self.port, timeout=self.timeout)
+
+    def release(self, conn, reusable=True):
+        """Return a connection; broken or server-closed ones are discarded."""
+        if reusable:
+            self._idle.put(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class OpenAIHTTPBackend(InferenceBackend):
+    """Client for an OpenAI-compatible /v1/chat/completions endpoint."""
+
+    name = "http"
+
+    def __init__(self, base_url=HTTP_URL, model=HTTP_MODEL, api_key=HTTP_API_KEY,
+                 timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES, pool_size=HTTP_POOL_SIZE):
+        self.model_id = model
+        self.model = model
+        self.api_key = api_key
+        self.retries = retries
+        self._pool = _ConnectionPool(base_url, pool_size, timeout)
+        self._path = self._pool.base_path + "/v1/chat/completions"
+        print(f"🌐 Using inference server at {base_url} (model: {model})")
+
+    def generate(self, prompt, system_prompt="", max_tokens=1024, context=""):
+        payload = self._payload(prompt, system_prompt, max_tokens, context, stream=False)
+        conn, response = self._post(payload)
+        try:
+            data = json.loads(response.read().decode("utf-8"))
+        except Exception:
+            self._pool.release(conn, reusable=False)
+            raise
+        self._pool.release(conn, reusable=not response.will_close)
+        return data["choices"][0]["message"]["content"] or ""
+
+    def stream(self, prompt, system_prompt="", max_tokens=1024, context=""):
+        payload = self._payload(prompt, system_prompt, max_tokens, context, stream=True)
+        conn, response = self._post(payload)
+        reusable = False
+        try:
+            # Server-sent events: one "data: {...}" line per chunk, then "data: [DONE]"
+            for raw in response:
+                line = raw.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {})
+                if delta.get("content"):
+                    yield delta["content"]
+            response.read()
+            reusable = not response.will_close
+        finally:
+            self._pool.release(conn, reusable=reusable)
+
+    def cache_params(self):
+        return None if DO_SAMPLE else {'temperature': 0}
+
+    def close(self):
+        self._pool.close()
+
+    def _payload(self, prompt, system_prompt, max_tokens, context, stream):
+        # System prompt and patient context go first so the server's own
+        # prefix caching can reuse them across tasks.
+        system = "\n\n".join(part for part in (system_prompt, context) if part)
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": prompt})
+        payload = {
+            "model": self.model_id,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "stream": stream,
+        }
+        if DO_SAMPLE:
+            payload.update(temperature=TEMPERATURE, top_p=TOP_P)
+        else:
+            payload.update(temperature=0)
+        return payload
+
+    def _post(self, payload):
+        """POST with retries. Returns (connection, response) — the caller releases the connection."""
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(min(0.5 * 2 ** (attempt - 1), 4.0))
+            conn = self._pool.acquire()
+            try:
+                conn.request("POST", self._path, body=body, headers=headers)
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                # Includes a keep-alive connection the server already closed
+                self._pool.release(conn, reusable=False)
+                last_error = e
+                continue
+
+            if response.status in _RETRY_STATUSES and attempt < self.retries:
+                response.read()
+                self._pool.release(conn, reusable=not response.will_close)
+                last_error = RuntimeError(f"HTTP {response.status}")
+                continue
+
+            if response.status >= 400:
+                detail = response.read().decode("utf-8", errors="replace")
+                self._pool.release(conn, reusable=not response.will_close)
+                raise RuntimeError(f"Inference server returned HTTP {response.status}: {detail[:200]}")
+
+            return conn, response
+
+        raise ConnectionError(f"Inference server unreachable after {self.retries + 1} attempts: {last_error}")
+
+
+def create_backend(name):
+    """Instantiate the backend selected by name."""
+    if name == "mock":
+        return MockBackend()
+    if name == "transformers":
+        return TransformersBackend()
+    if name == "http":
+        return OpenAIHTTPBackend()
+    if name == "synthetic":
+        from ai.synthetic_backend import SyntheticBackend
+        return SyntheticBackend()
+    raise ValueError(f"Unknown MEDGEMMA_BACKEND: {name}")
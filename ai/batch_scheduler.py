@@ -0,0 +1,404 @@
+"""
+batch_scheduler.py — Continuous-batching scheduler for MedGemma inference.
+Concurrent callers submit prompts and receive a Future; a single background
+thread keeps a fixed pool of generation slots busy, admitting new sequences
+into the running batch as soon as finished ones drop out.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from ai.prefix_cache import prefix_key
+
+# ── Scheduler Settings ──
+MAX_BATCH_SIZE = int(os.environ.get("MEDGEMMA_MAX_BATCH", "8"))
+MAX_WAIT_MS = float(os.environ.get("MEDGEMMA_BATCH_WAIT_MS", "20"))
+
+
+class GenerationFuture(Future):
+    """Future whose caller can also abandon it while it is generating (consumer went away)."""
+    abandoned = False
+
+    def abandon(self):
+        self.abandoned = True
+        self.cancel()    # only effective while still queued
+
+
+class GenerationRequest:
+    """One queued prompt and the future its caller is waiting on."""
+
+    def __init__(self, prompt, max_tokens, future, streamer=None, prefix=()):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.future = future
+        self.streamer = streamer
+        self.prefix = tuple(prefix)
+
+    def finish(self, text):
+        if self.streamer is not None:
+            self.streamer.end()
+        self.future.set_result(text)
+
+    def fail(self, error):
+        if self.streamer is not None:
+            self.streamer.end()
+        self.future.set_exception(error)
+
+
+class BatchScheduler:
+    """
+    Collects concurrent prompts into padded batches.
+    The engine does the tensor work; the scheduler only decides who runs when.
+    """
+
+    def __init__(self, engine, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.engine = engine
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, prompt, max_tokens=1024, streamer=None, prefix=()):
+        """
+        Queue a prompt for generation. Returns a Future resolving to the text.
+        If a streamer is given, each new token is also pushed to it as generated.
+        prefix holds the (system prompt, patient record, current visit) segments
+        that precede the prompt and can be served from the prefix KV-cache.
+        """
+        future = GenerationFuture()
+        self._pending.put(GenerationRequest(prompt, max_tokens, future, streamer, prefix))
+        self._ensure_running()
+        return future
+
+    def shutdown(self):
+        """Stop the scheduler thread once the running batch is finished."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._pending.put(None)
+            thread, self._thread = self._thread, None
+        thread.join()
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="medgemma-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect(self, free_slots, idle):
+        """
+        Take up to free_slots pending requests.
+        When idle, block for the first one and then hold the batch open for
+        max_wait so near-simultaneous requests share the same prefill round.
+        Returns None when a shutdown sentinel is received.
+        """
+        requests = []
+        try:
+            if idle:
+                item = self._pending.get()
+                if item is None:
+                    return None
+                requests.append(item)
+                deadline = time.monotonic() + self.max_wait
+                while len(requests) < free_slots:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    item = self._pending.get(timeout=remaining)
+                    if item is None:
+                        self._pending.put(None)
+                        break
+                    requests.append(item)
+            else:
+                while len(requests) < free_slots:
+                    item = self._pending.get_nowait()
+                    if item is None:
+                        self._pending.put(None)
+                        break
+                    requests.append(item)
+        except queue.Empty:
+            pass
+        return requests
+
+    def _run(self):
+        while True:
+            active = self.engine.active_count()
+            free_slots = self.max_batch_size - active
+            if free_slots > 0:
+                new_requests = self._collect(free_slots, idle=(active == 0))
+                if new_requests is None:
+                    return
+                # Skip callers that cancelled while waiting in the queue
+                new_requests = [r for r in new_requests if r.future.set_running_or_notify_cancel()]
+                for request in new_requests:
+                    try:
+                        self.engine.add(request)
+                    except Exception as e:
+                        request.fail(e)
+
+            if self.engine.active_count() == 0:
+                continue
+
+            try:
+                for request, text in self.engine.step():
+                    request.finish(text)
+            except Exception as e:
+                for request in self.engine.drain():
+                    request.fail(e)
+
+
+# ══════════════════════════════════════════════════════════════
+# Transformers engine — padded batch with a shared KV cache
+# ══════════════════════════════════════════════════════════════
+
+def _to_legacy(past):
+    """Normalize a model cache to the tuple-of-(key, value) layout."""
+    if hasattr(past, "to_legacy_cache"):
+        return past.to_legacy_cache()
+    return past
+
+
+def _from_legacy(past):
+    """Wrap a tuple cache in the Cache class expected by newer transformers."""
+    try:
+        from transformers import DynamicCache
+        return DynamicCache.from_legacy_cache(past)
+    except ImportError:
+        return past
+
+
+class _Sequence:
+    """Per-slot state of one running generation."""
+
+    def __init__(self, request, next_token, position):
+        self.request = request
+        self.next_token = next_token
+        self.position = position
+        self.generated = []
+
+
+class TransformersBatchEngine:
+    """
+    Runs one decode step for every active slot per forward pass.
+    New sequences are prefilled on their own, then merged into the running
+    batch by left-padding the shorter KV cache; finished rows are sliced out.
+    """
+
+    def __init__(self, model, tokenizer, temperature=0.3, top_p=0.9, do_sample=True,
+                 prefix_cache=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix_cache = prefix_cache
+        self.temperature = temperature
+        self.top_p = top_p
+        self.do_sample = do_sample
+        self.sequences = []
+        self.past = None
+        self.attention_mask = None
+
+    def active_count(self):
+        return len(self.sequences)
+
+    def add(self, request):
+        """Prefill a new request and merge its cache into the running batch."""
+        past, mask, sequence = self._prefill(request)
+        self._merge(past, mask, sequence)
+
+    def step(self):
+        """Advance every slot by one token. Returns finished (request, text) pairs."""
+        finished, keep = [], []
+        for i, s in enumerate(self.sequences):
+            s.generated.append(s.next_token)
+            if s.request.streamer is not None:
+                s.request.streamer.put(_token_tensor(s.next_token))
+            # An abandoned request ends now with what it has (its slot is freed)
+            if self._is_finished(s) or s.request.future.abandoned:
+                text = self.tokenizer.decode(s.generated, skip_special_tokens=True).strip()
+                finished.append((s.request, text))
+            else:
+                keep.append(i)
+
+        if finished:
+            self._keep_rows(keep)
+        if self.sequences:
+            self._decode_step()
+        return finished
+
+    def drain(self):
+        """Drop every active sequence (after an error) and return their requests."""
+        requests = [s.request for s in self.sequences]
+        self.sequences = []
+        self.past = None
+        self.attention_mask = None
+        return requests
+
+    # ── Internals ──
+
+    def _prefill(self, request):
+        """
+        Encode a request, reusing the deepest cached prefix.
+        The first prefix segment (system prompt) is pinned in the cache; the
+        later ones (patient record, current visit) are kept under LRU eviction.
+        """
+        import torch
+
+        segments = list(request.prefix) + [request.prompt]
+        past, length, start = None, 0, 0
+
+        if self.prefix_cache is not None:
+            for depth in range(len(request.prefix), 0, -1):
+                if not request.prefix[depth - 1]:
+                    continue
+                hit = self.prefix_cache.get(prefix_key(request.prefix[:depth]))
+                if hit is not None:
+                    past, length = hit
+                    start = depth
+                    break
+
+        outputs = None
+        for i in range(start, len(segments)):
+            if not segments[i]:
+                continue
+            ids = self.tokenizer(
+                segments[i], return_tensors="pt", add_special_tokens=(length == 0)
+            )["input_ids"].to(self.model.device)
+            outputs = self._forward(ids, past, length)
+            past = _to_legacy(outputs.past_key_values)
+            length += ids.shape[1]
+            if i < len(request.prefix) and self.prefix_cache is not None:
+                self.prefix_cache.put(prefix_key(request.prefix[:i + 1]), past, length, pinned=(i == 0))
+
+        if outputs is None:
+            raise ValueError("Prompt suffix is empty — nothing to generate from")
+
+        first_token = int(self._sample(outputs.logits[:, -1, :])[0])
+        mask = torch.ones((1, length), dtype=torch.long, device=self.model.device)
+        return past, mask, _Sequence(request, first_token, position=length)
+
+    def _forward(self, input_ids, past, past_length):
+        import torch
+
+        attention_mask = torch.ones(
+            (1, past_length + input_ids.shape[1]), dtype=torch.long, device=self.model.device
+        )
+        with torch.no_grad():
+            return self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=_from_legacy(past) if past is not None else None,
+                use_cache=True,
+            )
+
+    def _decode_step(self):
+        import torch
+
+        input_ids = torch.tensor([[s.generated[-1]] for s in self.sequences], device=self.model.device)
+        position_ids = torch.tensor([[s.position] for s in self.sequences], device=self.model.device)
+        self.attention_mask = torch.cat(
+            [self.attention_mask, self.attention_mask.new_ones((len(self.sequences), 1))], dim=1
+        )
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids,
+                attention_mask=self.attention_mask,
+                position_ids=position_ids,
+                past_key_values=_from_legacy(self.past),
+                use_cache=True,
+            )
+        self.past = _to_legacy(outputs.past_key_values)
+
+        next_tokens = self._sample(outputs.logits[:, -1, :])
+        for i, s in enumerate(self.sequences):
+            s.next_token = int(next_tokens[i])
+            s.position += 1
+
+    def _merge(self, past, mask, sequence):
+        import torch
+
+        if not self.sequences:
+            self.past, self.attention_mask = past, mask
+            self.sequences = [sequence]
+            return
+
+        batch_len = self.attention_mask.shape[1]
+        new_len = mask.shape[1]
+        target = max(batch_len, new_len)
+        self.past = tuple(
+            (torch.cat([_left_pad(bk, target), _left_pad(nk, target)], dim=0),
+             torch.cat([_left_pad(bv, target), _left_pad(nv, target)], dim=0))
+            for (bk, bv), (nk, nv) in zip(self.past, past)
+        )
+        self.attention_mask = torch.cat(
+            [_left_pad_mask(self.attention_mask, target), _left_pad_mask(mask, target)], dim=0
+        )
+        self.sequences.append(sequence)
+
+    def _keep_rows(self, keep):
+        import torch
+
+        self.sequences = [self.sequences[i] for i in keep]
+        if not keep:
+            self.past = None
+            self.attention_mask = None
+            return
+
+        index = torch.tensor(keep, device=self.attention_mask.device)
+        mask = self.attention_mask.index_select(0, index)
+        # Trim padding columns that no remaining row attends to
+        start = int((mask.sum(dim=0) > 0).nonzero()[0])
+        self.attention_mask = mask[:, start:]
+        self.past = tuple(
+            (k.index_select(0, index.to(k.device))[:, :, start:, :],
+             v.index_select(0, index.to(v.device))[:, :, start:, :])
+            for k, v in self.past
+        )
+
+    def _is_finished(self, sequence):
+        eos = self.tokenizer.eos_token_id
+        eos_ids = eos if isinstance(eos, (list, tuple)) else [eos]
+        return sequence.generated[-1] in eos_ids or len(sequence.generated) >= sequence.request.max_tokens
+
+    def _sample(self, logits):
+        import torch
+
+        if not self.do_sample:
+            return logits.argmax(dim=-1)
+
+        probs = torch.softmax(logits / max(self.temperature, 1e-5), dim=-1)
+        sorted_probs, sorted_idx = probs.sort(dim=-1, descending=True)
+        cumulative = sorted_probs.cumsum(dim=-1)
+        sorted_probs[cumulative - sorted_probs > self.top_p] = 0.0
+        choice = torch.multinomial(sorted_probs / sorted_probs.sum(dim=-1, keepdim=True), 1)
+        return sorted_idx.gather(-1, choice).squeeze(-1)
+
+
+def _token_tensor(token):
+    """Wrap a single token id the way transformers streamers expect."""
+    import torch
+    return torch.tensor([token])
+
+
+def _left_pad(tensor, length):
+    """Left-pad a [batch, heads, seq, dim] cache tensor with zeros along seq."""
+    import torch
+
+    missing = length - tensor.shape[2]
+    if missing <= 0:
+        return tensor
+    pad = tensor.new_zeros((tensor.shape[0], tensor.shape[1], missing, tensor.shape[3]))
+    return torch.cat([pad, tensor], dim=2)
+
+
+def _left_pad_mask(mask, length):
+    """Left-pad a [batch, seq] attention mask with zeros."""
+    import torch
+
+    missing = length - mask.shape[1]
+    if missing <= 0:
+        return mask
+    return torch.cat([mask.new_zeros((mask.shape[0], missing)), mask], dim=1)
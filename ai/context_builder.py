@@ -0,0 +1,258 @@
+"""
+context_builder.py — Token-budgeted patient context for MedGemma prompts.
+Fills a per-task token budget from the session cache in clinical priority
+order (allergies → critical contraindications → medications → recent
+abnormal labs → older history), renders what fits in the usual record order,
+and reports what was left out. Keeps prompt size — and prefill time —
+bounded for patients with long histories.
+This visit's vitals and session updates form a separate tail (after
+DYNAMIC_HEADER) with its own allowance, so the record block stays a stable,
+memoizable prefix while the tail is re-rendered (see SessionCache).
+"""
+
+import os
+from functools import lru_cache
+
+# ── Budget Settings ──
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("MEDGEMMA_CONTEXT_TOKENS", "1024"))
+# Tasks share the same budget by default so their patient block is identical
+# and the prefix KV-cache is reused across tasks; only patients whose record
+# exceeds a task's budget get a task-specific (shorter) block.
+TASK_BUDGETS = {
+    'summary': CONTEXT_TOKEN_BUDGET,
+    'conversation': CONTEXT_TOKEN_BUDGET,
+    'suggestions': CONTEXT_TOKEN_BUDGET,
+    'diagnosis': int(os.environ.get("MEDGEMMA_DIAGNOSIS_CONTEXT_TOKENS", str(CONTEXT_TOKEN_BUDGET * 3 // 2))),
+}
+# Allowance for each dynamic section (vitals, session updates), on top of the record budget
+DYNAMIC_CONTEXT_TOKENS = int(os.environ.get("MEDGEMMA_DYNAMIC_CONTEXT_TOKENS", "192"))
+# Mock/HTTP mode estimate: Arabic medical text averages ~3.5 characters per token
+# (MEDGEMMA_SYNTH_CHARS_PER_TOKEN is the synthetic backend's older name for it)
+CHARS_PER_TOKEN = float(os.environ.get(
+    "MEDGEMMA_CHARS_PER_TOKEN", os.environ.get("MEDGEMMA_SYNTH_CHARS_PER_TOKEN", "3.5")
+))
+
+# Fill priority (lower first). Patient identity and chronic diseases are
+# always kept — every other section is interpreted against them.
+PRIORITY_ESSENTIAL = 0
+PRIORITY_ALLERGY = 1
+PRIORITY_CRITICAL_CONTRAINDICATION = 2
+PRIORITY_VITALS = 3
+PRIORITY_MEDICATION = 4
+PRIORITY_ABNORMAL_LAB = 5
+PRIORITY_CONTRAINDICATION = 6
+PRIORITY_RECENT_VISIT = 7
+PRIORITY_OLDER_HISTORY = 8
+PRIORITY_SESSION_UPDATE = 9
+
+RECENT_VISITS = 3
+
+# Arabic names used in the "dropped" note appended to a trimmed context
+SECTION_LABELS = {
+    'diseases': 'أمراض مزمنة',
+    'allergies': 'حساسيات',
+    'medications': 'أدوية',
+    'surgeries': 'عمليات سابقة',
+    'visits': 'زيارات',
+    'abnormal_labs': 'تحاليل غير طبيعية',
+    'contraindications': 'مواد ممنوعة',
+    'vitals': 'علامات حيوية',
+    'session_updates': 'مستجدات الجلسة',
+}
+
+# Starts the dynamic tail of a context (see split_dynamic)
+DYNAMIC_HEADER = "📍 مستجدات الزيارة الحالية:"
+
+SESSION_UPDATE_LABELS = {
+    'visit_reason': 'سبب الزيارة',
+    'priority': 'الأولوية',
+    'reception_notes': 'ملاحظات الاستقبال',
+}
+
+
+def estimate_tokens(text):
+    """Approximate token count without loading a tokenizer."""
+    return max(1, int(len(text) / CHARS_PER_TOKEN + 0.5)) if text else 0
+
+
+def count_tokens(text):
+    """
+    Token count with the loaded model's tokenizer, or the estimate when no
+    backend is loaded yet (building a context must never trigger a model load)
+    or in mock/HTTP mode.
+    """
+    from ai.medgemma_client import get_loaded_backend
+
+    backend = get_loaded_backend()
+    tokenizer = backend.tokenizer if backend is not None else None
+    # Mock/synthetic backends use a placeholder string; the HTTP backend has none
+    if tokenizer is None or isinstance(tokenizer, str):
+        return estimate_tokens(text)
+    return _encoded_length(tokenizer, text)
+
+
+@lru_cache(maxsize=4096)
+def _encoded_length(tokenizer, text):
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def build_context(session_cache, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Build the patient context within a token budget (uncached — see
+    SessionCache.get_context_for_ai). Returns a dict: text, tokens, budget,
+    dropped ({section: items left out}).
+    """
+    return combine_context(
+        build_static_context(session_cache, budget),
+        render_vitals(session_cache.current_vitals),
+        render_session_updates(session_cache.session_updates),
+    )
+
+
+def build_static_context(session_cache, budget=CONTEXT_TOKEN_BUDGET):
+    """The patient record part, filled by clinical priority (same dict shape as build_context)."""
+    parts, used, dropped = _fill(_collect_sections(session_cache), budget)
+    if dropped:
+        summary = "، ".join(f"{SECTION_LABELS.get(k, k)} ({n})" for k, n in dropped.items())
+        parts.append(f"(تم اختصار السجل لحدود الطول — لم تُذكر: {summary})")
+    return {
+        'text': "\n".join(parts),
+        'tokens': used,
+        'budget': budget,
+        'dropped': dropped,
+    }
+
+
+def render_vitals(vitals, budget=DYNAMIC_CONTEXT_TOKENS):
+    """Current vital signs section (dict shape of build_context, empty text when none)."""
+    section = ('vitals', "العلامات الحيوية الحالية:", False, [
+        (PRIORITY_VITALS, f"{k}: {v}") for k, v in vitals.items()
+    ])
+    return _render_part(section, budget)
+
+
+def render_session_updates(updates, budget=DYNAMIC_CONTEXT_TOKENS):
+    """Reception/ER updates of this visit, newest kept first when over budget."""
+    items = [
+        (PRIORITY_SESSION_UPDATE + len(updates) - i,
+         f"{SESSION_UPDATE_LABELS.get(u['field'], u['field'])}: {u['value']}")
+        for i, u in enumerate(updates) if u['value'] not in (None, '')
+    ]
+    return _render_part(('session_updates', "مستجدات الجلسة:", False, items), budget)
+
+
+def combine_context(static, *dynamic):
+    """Static block + DYNAMIC_HEADER + non-empty dynamic parts, with merged token/drop counts."""
+    parts = [part for part in dynamic if part['text']]
+    text = static['text']
+    if parts:
+        text += f"\n\n{DYNAMIC_HEADER}\n" + "\n".join(part['text'] for part in parts)
+    dropped = dict(static['dropped'])
+    for part in parts:
+        dropped.update(part['dropped'])
+    return {
+        'text': text,
+        'tokens': static['tokens'] + sum(part['tokens'] for part in parts),
+        'budget': static['budget'],
+        'dropped': dropped,
+    }
+
+
+def split_dynamic(context):
+    """(stable prefix, dynamic tail) of a context string; the tail is "" when there is none."""
+    index = context.find(f"\n\n{DYNAMIC_HEADER}")
+    if index < 0:
+        return context, ""
+    return context[:index], context[index + 2:]
+
+
+def _render_part(section, budget):
+    parts, used, dropped = _fill([section], budget)
+    return {'text': "\n".join(parts), 'tokens': used, 'budget': budget, 'dropped': dropped}
+
+
+def _fill(sections, budget):
+    """Keep items by priority within budget; render them in record order → (lines, tokens, dropped)."""
+    # Fill by priority; items of equal priority keep their record order
+    candidates = sorted(
+        (priority, s_index, i_index)
+        for s_index, (_, _, _, items) in enumerate(sections)
+        for i_index, (priority, _) in enumerate(items)
+    )
+    kept = set()
+    headed = set()
+    used = 0
+    for priority, s_index, i_index in candidates:
+        _, header, _, items = sections[s_index]
+        cost = count_tokens(items[i_index][1])
+        if header and s_index not in headed:
+            cost += count_tokens(header)
+        if priority > PRIORITY_ESSENTIAL and used + cost > budget:
+            continue
+        kept.add((s_index, i_index))
+        headed.add(s_index)
+        used += cost
+
+    # Render in the usual record order
+    parts = []
+    dropped = {}
+    for s_index, (key, header, inline, items) in enumerate(sections):
+        values = [value for i_index, (_, value) in enumerate(items) if (s_index, i_index) in kept]
+        if len(values) < len(items):
+            dropped[key] = len(items) - len(values)
+        if not values:
+            continue
+        if header is None:
+            parts.extend(values)
+        elif inline:
+            parts.append(f"{header} {', '.join(values)}")
+        else:
+            parts.append(header)
+            parts.extend(f"  - {value}" for value in values)
+    return parts, used, dropped
+
+
+def _collect_sections(cache):
+    """
+    The stored record as (key, header, inline, [(priority, value), ...]) in display order.
+    Inline sections render as "header a, b, c"; the others as one "  - value" line each.
+    """
+    p = cache.patient_info
+    return [
+        ('patient', None, False, [(
+            PRIORITY_ESSENTIAL,
+            f"المريض: {p.get('name', '')} — {p.get('age', '')} سنة — {p.get('gender', '')} — "
+            f"فصيلة الدم: {p.get('blood_type', '')}"
+        )]),
+        ('diseases', "الأمراض المزمنة:", True, [
+            (PRIORITY_ESSENTIAL, f"{d['disease_name']} ({d.get('severity', '')})")
+            for d in cache.chronic_diseases
+        ]),
+        ('allergies', "الحساسيات:", True, [
+            (PRIORITY_ALLERGY, f"{a['allergen']} ({a.get('reaction_type', '')})")
+            for a in cache.allergies
+        ]),
+        ('medications', "الأدوية الحالية:", True, [
+            (PRIORITY_MEDICATION, f"{m['drug_name']} {m.get('dose', '')} {m.get('frequency', '')}")
+            for m in cache.medications
+        ]),
+        ('surgeries', "العمليات السابقة:", True, [
+            (PRIORITY_OLDER_HISTORY, f"{s['surgery_name']} ({s.get('surgery_date', '')})")
+            for s in cache.surgeries
+        ]),
+        # Visits and labs come newest first from the queries
+        ('visits', "الزيارات الأخيرة:", False, [
+            (PRIORITY_RECENT_VISIT if i < RECENT_VISITS else PRIORITY_OLDER_HISTORY,
+             f"{v.get('visit_date', '')}: {v.get('reason', '')} → {v.get('diagnosis', '')}")
+            for i, v in enumerate(cache.visits)
+        ]),
+        ('abnormal_labs', "تحاليل غير طبيعية:", False, [
+            (PRIORITY_ABNORMAL_LAB, f"{lab['test_name']}: {lab['result_value']} (الطبيعي: {lab.get('normal_range', '')})")
+            for lab in cache.abnormal_labs
+        ]),
+        ('contraindications', "المواد الممنوعة:", False, [
+            (PRIORITY_CRITICAL_CONTRAINDICATION if ci['risk_level'] == 'critical' else PRIORITY_CONTRAINDICATION,
+             f"{ci['contraindicated_substance']} ({ci['risk_level']}): {ci['reason']}")
+            for ci in cache.contraindications
+        ]),
+    ]
@@ -0,0 +1,126 @@
+"""
+diagnosis_executor.py — Fan-out execution of the Diagnostic Detective Loop.
+Instead of one 2048-token generation, the loop runs as independent sub-tasks
+(history correlation, evidence/contraindications, tests, warnings) that are
+generated concurrently over the same cached patient prefix, followed by a
+short synthesis step that verifies them and states the final diagnosis.
+The report keeps the original [خطوة 1] … [🔴 تحذيرات] layout.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from ai.medgemma_client import ask_medgemma, stream_medgemma_async
+from ai.inference_queue import QueueFullError
+from ai.prompts import (
+    SYSTEM_PROMPT, DIAGNOSIS_HISTORY_PROMPT, DIAGNOSIS_EVIDENCE_PROMPT,
+    DIAGNOSIS_TESTS_PROMPT, DIAGNOSIS_WARNINGS_PROMPT, DIAGNOSIS_SYNTHESIS_PROMPT
+)
+
+# (section, prompt, max_tokens) — independent, so they run concurrently
+DIAGNOSIS_SUBTASKS = (
+    ('history', DIAGNOSIS_HISTORY_PROMPT, 512),
+    ('evidence', DIAGNOSIS_EVIDENCE_PROMPT, 512),
+    ('tests', DIAGNOSIS_TESTS_PROMPT, 384),
+    ('warnings', DIAGNOSIS_WARNINGS_PROMPT, 384),
+)
+SYNTHESIS_MAX_TOKENS = 384
+
+# Display order matches the single-prompt report
+SECTION_ORDER = ('history', 'evidence', 'synthesis', 'tests', 'warnings')
+SECTION_PLACEHOLDERS = {
+    'history': "🧠 جارٍ تحليل السجل والشكوى...",
+    'evidence': "🧠 جارٍ البحث عن أدلة ومواد ممنوعة...",
+    'synthesis': "🧠 التحقق والتشخيص النهائي بعد اكتمال التحليل...",
+    'tests': "🧠 جارٍ تحديد التحاليل المقترحة...",
+    'warnings': "🧠 جارٍ مراجعة التحذيرات...",
+}
+
+_executor = None
+
+
+def run_diagnosis(case, context):
+    """
+    Blocking fan-out: sub-tasks run in parallel threads (batched together by the
+    scheduler), then the synthesis. case holds chief_complaint, form_data, transcript.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=len(DIAGNOSIS_SUBTASKS), thread_name_prefix="diagnosis")
+
+    futures = {
+        name: _executor.submit(ask_medgemma, prompt.format(**case), system_prompt=SYSTEM_PROMPT,
+                               max_tokens=max_tokens, context=context)
+        for name, prompt, max_tokens in DIAGNOSIS_SUBTASKS
+    }
+    sections = {name: future.result().strip() for name, future in futures.items()}
+    sections['synthesis'] = ask_medgemma(
+        _synthesis_prompt(case, sections), system_prompt=SYSTEM_PROMPT,
+        max_tokens=SYNTHESIS_MAX_TOKENS, context=context
+    ).strip()
+    return assemble_report(sections)
+
+
+async def stream_diagnosis(case, context, priority=None):
+    """
+    Yield the assembled report every time any section grows. Sub-tasks stream
+    concurrently through the priority queue; the synthesis streams last.
+    """
+    sections = {}
+    updates = asyncio.Queue()
+
+    async def run(name, prompt, max_tokens):
+        try:
+            text = ""
+            async for position, chunk in stream_medgemma_async(
+                prompt, system_prompt=SYSTEM_PROMPT, max_tokens=max_tokens,
+                context=context, priority=priority
+            ):
+                if chunk is None:
+                    sections[name] = f"⏳ في قائمة الانتظار — عدد الطلبات قبله: {position}"
+                else:
+                    text += chunk
+                    sections[name] = text
+                updates.put_nowait(name)
+            sections[name] = text.strip()
+        except QueueFullError:
+            sections[name] = "⚠️ النظام مشغول حالياً — تعذّر تنفيذ هذا الجزء."
+        finally:
+            updates.put_nowait(None)
+
+    tasks = [
+        asyncio.ensure_future(run(name, prompt.format(**case), max_tokens))
+        for name, prompt, max_tokens in DIAGNOSIS_SUBTASKS
+    ]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            if await updates.get() is None:
+                remaining -= 1
+            yield assemble_report(sections)
+
+        # Surface unexpected sub-task errors before synthesising
+        for task in tasks:
+            task.result()
+
+        synthesis = asyncio.ensure_future(run(
+            'synthesis', _synthesis_prompt(case, sections), SYNTHESIS_MAX_TOKENS
+        ))
+        tasks.append(synthesis)
+        while await updates.get() is not None:
+            yield assemble_report(sections)
+        synthesis.result()
+        yield assemble_report(sections)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def assemble_report(sections):
+    """Join the sections in report order, with placeholders for pending ones."""
+    return "\n\n".join(sections.get(name) or SECTION_PLACEHOLDERS[name] for name in SECTION_ORDER)
+
+
+def _synthesis_prompt(case, sections):
+    findings = "\n\n".join(sections[name] for name, _, _ in DIAGNOSIS_SUBTASKS if sections.get(name))
+    return DIAGNOSIS_SYNTHESIS_PROMPT.format(findings=findings, **case)
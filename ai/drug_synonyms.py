@@ -0,0 +1,127 @@
+"""
+drug_synonyms.py — Arabic/English/brand synonym index for substance screening.
+Maps Arabic names, common transliterations, English generics and brand names
+(Egyptian market) to one canonical substance id. Every synonym is normalized
+with normalize_arabic and compiled into a hash map at import, so resolving a
+name is a single dict lookup.
+"""
+
+from utils.helpers import normalize_arabic
+
+# Canonical id → names that refer to the same substance (or substance group).
+# Class membership (e.g. Bisoprolol is a beta-blocker) is not a synonym.
+DRUG_SYNONYMS = {
+    'magnesium': [
+        "Magnesium", "Magnesium sulfate", "Magnesium oxide", "Magnesium hydroxide", "Milk of magnesia",
+        "Epsom salt", "مغنيسيوم", "ماغنيسيوم", "مغنسيوم", "مغنيزيوم", "ماغنسيوم",
+        "كبريتات المغنيسيوم", "لبن المغنيسيا", "ملح إبسوم",
+    ],
+    'aminoglycosides': [
+        "Aminoglycosides", "Aminoglycoside", "أمينوجليكوسيدات", "أمينوجليكوسيد", "امينوغليكوزيد",
+        "أمينوغليكوزيدات",
+    ],
+    'beta_blockers': [
+        "Beta-blockers", "Beta blocker", "Beta-adrenergic blockers", "بيتا بلوكر", "بيتا بلوكرز",
+        "حاصرات بيتا", "حاصر بيتا", "مثبطات بيتا",
+    ],
+    'fluoroquinolones': [
+        "Fluoroquinolones", "Fluoroquinolone", "Quinolones", "فلوروكينولون", "فلوروكينولونات",
+        "فلوروكوينولون", "كينولون",
+    ],
+    'succinylcholine': [
+        "Succinylcholine", "Suxamethonium", "Scoline", "Anectine", "سكسينيل كولين", "سكسينيلكولين",
+        "سوكساميثونيوم",
+    ],
+    'telithromycin': ["Telithromycin", "Ketek", "تيليثروميسين", "تليثرومايسين", "كيتك"],
+    'd_penicillamine': [
+        "D-Penicillamine", "Penicillamine", "Cuprimine", "Artamin", "بنسيلامين", "بنسلامين", "كوبريمين",
+    ],
+    'corticosteroids': [
+        "Corticosteroids", "Corticosteroid", "Steroids", "كورتيكوستيرويدات", "كورتيكوستيرويد",
+        "كورتيزون",
+    ],
+    'nsaids': [
+        "NSAIDs", "NSAID", "Non-steroidal anti-inflammatory", "مضادات الالتهاب غير الستيرويدية",
+        "مضاد التهاب غير ستيرويدي", "مسكنات غير ستيرويدية",
+    ],
+    'aspirin': [
+        "Aspirin", "Acetylsalicylic acid", "Aspocid", "Aspegic", "Jusprin",
+        "أسبرين", "اسبرين", "أسبيرين", "أسبوسيد", "اسبوسيد", "جسبرين",
+    ],
+    'metformin': [
+        "Metformin", "Glucophage", "Cidophage", "ميتفورمين", "متفورمين", "جلوكوفاج", "سيدوفاج",
+    ],
+    'pseudoephedrine': [
+        "Pseudoephedrine", "Sudafed", "سودوإفيدرين", "سودوافدرين", "سودوايفيدرين", "سودافيد",
+    ],
+    'thiazide_diuretics': [
+        "Thiazide Diuretics", "Thiazides", "Thiazide", "ثيازيد", "ثيازيدات",
+        "مدرات البول الثيازيدية", "مدر ثيازيدي",
+    ],
+    'triptans': ["Triptans", "Triptan", "تريبتان", "تريبتانات"],
+    'penicillin': [
+        "Penicillin", "Penicillin G", "Penicillin V", "Benzathine penicillin", "Retarpen",
+        "بنسلين", "بنيسلين", "البنسلين", "ريتاربين",
+    ],
+    'sulfa_drugs': [
+        # No bare "سلفا": Arabic names match word starts, and "سلفات" is a sulfate salt
+        "Sulfa drugs", "Sulfa", "Sulfonamides", "Sulfonamide", "Sulfamethoxazole", "Septrin", "Bactrim",
+        "أدوية السلفا", "سلفوناميد", "سلفوناميدات", "سبترين", "باكتريم",
+    ],
+    'dust': ["Dust", "House dust", "غبار", "الغبار", "أتربة", "تراب"],
+
+    # Individual drugs that belong to a contraindicated class (see drug_classes)
+    'ibuprofen': ["Ibuprofen", "Brufen", "Advil", "Nurofen", "إيبوبروفين", "ايبوبروفين"],
+    'diclofenac': [
+        "Diclofenac", "Voltaren", "Cataflam", "ديكلوفيناك", "فولتارين", "كتافلام", "كاتافلام",
+    ],
+    'naproxen': ["Naproxen", "Naprosyn", "نابروكسين"],
+    'ketoprofen': ["Ketoprofen", "Ketofan", "كيتوبروفين", "كيتوفان"],
+    'celecoxib': ["Celecoxib", "Celebrex", "سيليكوكسيب", "سيليبريكس"],
+    'bisoprolol': ["Bisoprolol", "Concor", "بيسوبرولول", "كونكور"],
+    'atenolol': ["Atenolol", "Tenormin", "أتينولول", "اتينولول", "تينورمين"],
+    'propranolol': ["Propranolol", "Inderal", "بروبرانولول", "إندرال", "اندرال"],
+    'metoprolol': ["Metoprolol", "Betaloc", "ميتوبرولول", "بيتالوك"],
+    'carvedilol': ["Carvedilol", "Dilatrend", "كارفيديلول", "ديلاترند"],
+    'ciprofloxacin': ["Ciprofloxacin", "Ciprobay", "Cipro", "سيبروفلوكساسين", "سيبروباي"],
+    'levofloxacin': ["Levofloxacin", "Tavanic", "ليفوفلوكساسين", "تافانيك"],
+    'gentamicin': ["Gentamicin", "Garamycin", "جنتاميسين", "جنتامايسين", "جاراميسين"],
+    'amikacin': ["Amikacin", "Amikin", "أميكاسين", "اميكاسين"],
+    'prednisolone': ["Prednisolone", "Solupred", "بريدنيزولون", "سولوبريد"],
+    'dexamethasone': ["Dexamethasone", "Decadron", "ديكساميثازون", "ديكادرون"],
+    'hydrocortisone': ["Hydrocortisone", "Solu-Cortef", "هيدروكورتيزون", "سولوكورتيف"],
+    'hydrochlorothiazide': ["Hydrochlorothiazide", "HCTZ", "هيدروكلوروثيازيد"],
+    'sumatriptan': ["Sumatriptan", "Imigran", "سوماتريبتان", "إيميجران"],
+    'amoxicillin': ["Amoxicillin", "Amoxil", "Ibiamox", "أموكسيسيلين", "اموكسيسيلين", "أموكسيل"],
+    'amoxicillin_clavulanate': [
+        "Amoxicillin-Clavulanate", "Co-amoxiclav", "Augmentin", "Hibiotic", "أوجمنتين", "اوجمنتين",
+        "هاي بيوتك",
+    ],
+    'ampicillin': ["Ampicillin", "أمبيسيلين", "امبيسيلين"],
+}
+
+
+def _compile(synonyms):
+    index = {}
+    for canonical_id, names in synonyms.items():
+        index[normalize_arabic(canonical_id)] = canonical_id
+        for name in names:
+            index[normalize_arabic(name)] = canonical_id
+    return index
+
+
+# normalized name → canonical id
+SYNONYM_INDEX = _compile(DRUG_SYNONYMS)
+
+
+def canonical_substance(name):
+    """Canonical id for a substance name (its normalized form when unknown)."""
+    key = normalize_arabic(name)
+    return SYNONYM_INDEX.get(key, key)
+
+
+def synonyms_for(name):
+    """Normalized spellings that refer to the same substance as name (including itself)."""
+    canonical_id = canonical_substance(name)
+    names = DRUG_SYNONYMS.get(canonical_id, [])
+    return list(dict.fromkeys([normalize_arabic(name)] + [normalize_arabic(n) for n in names]))
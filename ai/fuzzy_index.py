@@ -0,0 +1,106 @@
+"""
+fuzzy_index.py — Typo-tolerant term lookup (SymSpell symmetric-delete index).
+Every indexed term is stored under all strings reachable from it by up to
+max_distance character deletions. A query generates its own deletes and looks
+them up, so candidates come from a handful of dict lookups instead of a
+comparison against every term; each candidate is then verified with the
+Damerau-Levenshtein (optimal string alignment) distance.
+"""
+
+# Words shorter than this are never fuzzy-matched (too many false positives)
+MIN_FUZZY_LENGTH = 5
+# Query results kept per index — live screening re-checks mostly the same words
+LOOKUP_CACHE_SIZE = 4096
+
+
+def allowed_distance(term, max_distance=2):
+    """Edit distance tolerated for a word of this length."""
+    if len(term) < MIN_FUZZY_LENGTH:
+        return 0
+    if len(term) < 8:
+        return min(1, max_distance)
+    return max_distance
+
+
+def damerau_levenshtein(a, b, max_distance=None):
+    """
+    Optimal-string-alignment distance (insert/delete/substitute/transpose).
+    Returns max_distance + 1 as soon as the distance is known to exceed it.
+    """
+    if max_distance is not None and abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if max_distance is not None and min(cur) > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _deletes(term, distance):
+    """All strings obtained from term by deleting up to distance characters."""
+    results = {term}
+    frontier = {term}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+class SymSpellIndex:
+    """Symmetric-delete dictionary: term → value, queried with bounded edit distance."""
+
+    def __init__(self, max_distance=2):
+        self.max_distance = max_distance
+        self._deletes = {}
+        self._terms = {}
+        self._cache = {}
+
+    def add(self, term, value):
+        if not term or term in self._terms:
+            return
+        self._cache.clear()
+        self._terms[term] = value
+        for variant in _deletes(term, allowed_distance(term, self.max_distance)):
+            self._deletes.setdefault(variant, set()).add(term)
+
+    def lookup(self, word):
+        """
+        Indexed terms within the allowed edit distance of word, closest first,
+        as (term, value, distance) tuples.
+        """
+        cached = self._cache.get(word)
+        if cached is not None:
+            return cached
+        matches = self._lookup(word)
+        if len(self._cache) >= LOOKUP_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[word] = matches
+        return matches
+
+    def _lookup(self, word):
+        distance = allowed_distance(word, self.max_distance)
+        if distance == 0:
+            return []
+        candidates = set()
+        for variant in _deletes(word, distance):
+            candidates |= self._deletes.get(variant, set())
+
+        matches = []
+        for term in candidates:
+            limit = min(distance, allowed_distance(term, self.max_distance))
+            d = damerau_levenshtein(word, term, limit)
+            if d <= limit:
+                matches.append((term, self._terms[term], d))
+        matches.sort(key=lambda m: (m[2], m[0]))
+        return matches
+
+    def __len__(self):
+        return len(self._terms)
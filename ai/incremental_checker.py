@@ -0,0 +1,83 @@
+"""
+incremental_checker.py — Live substance screening for textboxes that change on every keystroke.
+Keeps each field's previous text split into segments (lines / comma-separated
+items) with the alerts found in each, so an edit only re-screens the segments
+it touched and the rest are merged back from memory. Events are debounced
+(only the last one of a typing burst is screened) and the UI is only updated
+when the merged alert set actually changed.
+"""
+
+import os
+import re
+
+SCREEN_DEBOUNCE_SECONDS = float(os.environ.get("MEDGEMMA_SCREEN_DEBOUNCE_MS", "250")) / 1000
+
+# Entries are written one per line or separated by Arabic/Latin commas and semicolons
+_SEGMENT_SPLIT = re.compile(r"[\n,،;؛]+")
+
+
+class IncrementalChecker:
+    """Per-field screening state: segment → alerts, plus the merged alert set shown last."""
+
+    def __init__(self, match):
+        self._match = match           # text → alerts (SessionCache.check_multiple_substances)
+        self._segment_alerts = {}
+        self._seq = 0
+        self.text = ""
+        self.alerts = []
+        self.screened_segments = 0
+
+    def begin(self):
+        """Register an incoming change event; returns its sequence number."""
+        self._seq += 1
+        return self._seq
+
+    def is_latest(self, seq):
+        """False once a newer event for this field has arrived (debounce)."""
+        return seq == self._seq
+
+    def update(self, text):
+        """
+        Screen text, re-running the matcher only on new or edited segments.
+        Returns True when what the field should display changed.
+        """
+        text = text or ""
+        if text == self.text:
+            return False
+
+        segment_alerts = {}
+        for segment in _segments(text):
+            if segment in segment_alerts:
+                continue
+            alerts = self._segment_alerts.get(segment)
+            if alerts is None:
+                alerts = self._match(segment)
+                self.screened_segments += 1
+            segment_alerts[segment] = alerts
+
+        alerts = _merge(segment_alerts.values())
+        changed = alerts != self.alerts or bool(text.strip()) != bool(self.text.strip())
+        self._segment_alerts = segment_alerts
+        self.text = text
+        self.alerts = alerts
+        return changed
+
+
+def _segments(text):
+    return [s.strip() for s in _SEGMENT_SPLIT.split(text) if s.strip()]
+
+
+def _merge(groups):
+    """
+    Alerts of all segments, deduplicated by title: exact matches first, then
+    near matches (dropped when the same contraindication/allergy matched exactly).
+    """
+    exact, near, seen = [], [], set()
+    for alerts in groups:
+        for alert in alerts:
+            if alert['title'] in seen:
+                continue
+            seen.add(alert['title'])
+            (near if alert.get('confidence') == 'low' else exact).append(alert)
+    exact_messages = {alert['message'] for alert in exact}
+    return exact + [alert for alert in near if alert['message'] not in exact_messages]
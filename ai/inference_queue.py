@@ -0,0 +1,237 @@
+"""
+inference_queue.py — asyncio priority queue in front of MedGemma.
+Requests are ordered by the triage level that reception records for the
+patient ("⚫ حرج" first) and served by a bounded pool of workers, so a critical
+patient never waits behind routine work — and at least one worker only ever
+serves critical requests, so long routine jobs cannot occupy every worker.
+Cancelled streams stop generating. Overload is reported explicitly:
+non-critical requests are rejected with QueueFullError when the queue is full,
+and every ticket can report its position in the queue.
+"""
+
+import asyncio
+import itertools
+import os
+
+from ai.batch_scheduler import MAX_BATCH_SIZE
+
+# ── Queue Settings ──
+# One worker per generation slot keeps the batch scheduler full without
+# letting requests bypass the priority order.
+ASYNC_WORKERS = int(os.environ.get("MEDGEMMA_ASYNC_WORKERS", str(MAX_BATCH_SIZE)))
+MAX_PENDING = int(os.environ.get("MEDGEMMA_QUEUE_MAX", "32"))
+# Workers (out of ASYNC_WORKERS) that only take critical requests
+CRITICAL_WORKERS = int(os.environ.get("MEDGEMMA_CRITICAL_WORKERS", "1"))
+
+# Triage labels stored by reception_ui.on_transfer_to_er (lower runs first)
+TRIAGE_PRIORITY = {
+    "⚫ حرج": 0,
+    "🔴 طوارئ": 1,
+    "🟡 متوسط": 2,
+    "🟢 عادي": 3,
+}
+CRITICAL_PRIORITY = 0
+DEFAULT_PRIORITY = 2    # patient without a recorded triage level
+CHAT_PRIORITY = 4       # free chat is always served last
+
+_END = object()
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the queue is at capacity and the request is not critical."""
+
+
+def triage_rank(priority):
+    """Map a triage label (or an explicit rank) to a queue rank."""
+    if priority is None:
+        return DEFAULT_PRIORITY
+    if isinstance(priority, int):
+        return priority
+    return TRIAGE_PRIORITY.get(priority, DEFAULT_PRIORITY)
+
+
+class Ticket:
+    """Handle for one queued request: position, start signal, and its output."""
+
+    def __init__(self, inference_queue, seq, rank, fn, args, kwargs, stream):
+        loop = asyncio.get_running_loop()
+        self._queue = inference_queue
+        self.seq = seq
+        self.rank = rank
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.stream = stream
+        self.started = asyncio.Event()
+        self.cancelled = False
+        self.claimed = False    # taken by a worker (critical tickets sit in two queues)
+        self._future = loop.create_future()
+        self._chunks = asyncio.Queue() if stream else None
+
+    def position(self):
+        """Number of queued requests that will run before this one (0 once started)."""
+        return self._queue.position(self)
+
+    async def wait_started(self, timeout=None):
+        """Wait until a worker picks this ticket up. Returns False on timeout."""
+        try:
+            await asyncio.wait_for(self.started.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def result(self):
+        """Final response text (non-streaming tickets)."""
+        return await self._future
+
+    def cancel(self):
+        """Drop the ticket if it has not started yet, or stop its stream if it has."""
+        self.cancelled = True
+
+    def __aiter__(self):
+        return self._iter_chunks()
+
+    async def _iter_chunks(self):
+        try:
+            while True:
+                item = await self._chunks.get()
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.cancel()
+
+
+class InferenceQueue:
+    """
+    asyncio.PriorityQueue of Tickets served by a fixed number of workers; the
+    reserved ones wait on a second queue that only receives critical tickets.
+    """
+
+    def __init__(self, workers=ASYNC_WORKERS, max_pending=MAX_PENDING, critical_workers=CRITICAL_WORKERS):
+        self.workers = max(1, workers)
+        # Keep at least one general worker
+        self.critical_workers = min(max(0, critical_workers), self.workers - 1)
+        self.max_pending = max_pending
+        self._queue = asyncio.PriorityQueue()
+        self._critical = asyncio.Queue()
+        self._pending = {}
+        self._counter = itertools.count()
+        self._tasks = []
+        self.running = 0
+        self.rejected = 0
+
+    def submit(self, priority, fn, *args, stream=False, **kwargs):
+        """
+        Queue fn(*args, **kwargs) to run in a worker thread.
+        fn returns the full text, or yields chunks when stream=True.
+        Critical requests are always accepted; others raise QueueFullError
+        once max_pending requests are waiting.
+        """
+        rank = triage_rank(priority)
+        if len(self._pending) >= self.max_pending and rank > CRITICAL_PRIORITY:
+            self.rejected += 1
+            raise QueueFullError(f"Inference queue is full ({len(self._pending)} waiting)")
+
+        self._ensure_workers()
+        ticket = Ticket(self, next(self._counter), rank, fn, args, kwargs, stream)
+        self._pending[ticket.seq] = ticket.rank
+        self._queue.put_nowait((ticket.rank, ticket.seq, ticket))
+        if ticket.rank <= CRITICAL_PRIORITY and self.critical_workers:
+            self._critical.put_nowait(ticket)
+        return ticket
+
+    def position(self, ticket):
+        if ticket.seq not in self._pending:
+            return 0
+        key = (ticket.rank, ticket.seq)
+        return sum(1 for seq, rank in self._pending.items() if (rank, seq) < key)
+
+    def stats(self):
+        """Queue depth per triage rank, running jobs and rejections."""
+        by_rank = {}
+        for rank in self._pending.values():
+            by_rank[rank] = by_rank.get(rank, 0) + 1
+        return {
+            'waiting': len(self._pending),
+            'waiting_by_rank': by_rank,
+            'running': self.running,
+            'workers': self.workers,
+            'critical_workers': self.critical_workers,
+            'rejected': self.rejected,
+        }
+
+    def _ensure_workers(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.ensure_future(self._worker(reserved=i < self.critical_workers))
+                for i in range(self.workers)
+            ]
+
+    async def _worker(self, reserved=False):
+        while True:
+            if reserved:
+                ticket = await self._critical.get()
+            else:
+                _, _, ticket = await self._queue.get()
+            # A critical ticket is in both queues — whichever worker gets it first runs it
+            if ticket.claimed:
+                continue
+            ticket.claimed = True
+            self._pending.pop(ticket.seq, None)
+            if ticket.cancelled:
+                continue
+            self.running += 1
+            ticket.started.set()
+            try:
+                await self._run(ticket)
+            finally:
+                self.running -= 1
+
+    async def _run(self, ticket):
+        if not ticket.stream:
+            try:
+                result = await asyncio.to_thread(ticket.fn, *ticket.args, **ticket.kwargs)
+                if not ticket._future.done():
+                    ticket._future.set_result(result)
+            except Exception as e:
+                if not ticket._future.done():
+                    ticket._future.set_exception(e)
+            return
+
+        loop = asyncio.get_running_loop()
+
+        def pump():
+            chunks = ticket.fn(*ticket.args, **ticket.kwargs)
+            try:
+                for chunk in chunks:
+                    # The client went away: stop here instead of generating to max_tokens
+                    if ticket.cancelled:
+                        break
+                    loop.call_soon_threadsafe(ticket._chunks.put_nowait, chunk)
+            finally:
+                # Closing the generator lets the backend release its generation slot
+                chunks.close()
+
+        try:
+            await asyncio.to_thread(pump)
+            ticket._chunks.put_nowait(_END)
+        except Exception as e:
+            ticket._chunks.put_nowait(e)
+
+
+_queue = None
+_queue_loop = None
+
+
+def get_inference_queue():
+    """The queue bound to the running event loop (created on first use)."""
+    global _queue, _queue_loop
+
+    loop = asyncio.get_running_loop()
+    if _queue is None or _queue_loop is not loop:
+        _queue = InferenceQueue()
+        _queue_loop = loop
+    return _queue
@@ -0,0 +1,157 @@
+"""
+knowledge_base.py — Process-wide contraindication knowledge base.
+The contraindications table is loaded once into immutable, indexed records
+(db.records.Contraindication; disease → records, substance → records, ordered
+by risk) that every session
+shares without copying; a session only keeps the view for its own diseases.
+Drug classes are loaded with it as a precomputed closure (drug → class →
+parent class), so a class-level contraindication such as NSAIDs applies to
+Ibuprofen through a dict lookup.
+The version changes whenever the table content changes, so anything compiled
+from the knowledge base can be cached per version.
+"""
+
+import hashlib
+import threading
+from types import MappingProxyType
+
+from ai.drug_synonyms import canonical_substance
+from db.queries import get_contraindication_table, get_drug_class_table
+
+RISK_ORDER = MappingProxyType({'critical': 0, 'high': 1, 'moderate': 2})
+
+
+def risk_rank(risk_level):
+    """Sort key for a risk level (unknown levels last)."""
+    return RISK_ORDER.get(risk_level, len(RISK_ORDER))
+
+
+class KnowledgeBase:
+    """Immutable contraindication records with disease, substance and drug-class indexes."""
+
+    def __init__(self, rows, class_links=()):
+        # Most dangerous first; table order within a risk level
+        ranked = sorted(enumerate(rows), key=lambda item: (risk_rank(item[1]['risk_level']), item[0]))
+        self.records = tuple(record for _, record in ranked)
+
+        by_disease = {}
+        by_substance = {}
+        for record in self.records:
+            by_disease.setdefault(record['disease_name'], []).append(record)
+            substance_id = canonical_substance(record['contraindicated_substance'])
+            by_substance.setdefault(substance_id, []).append(record)
+        self.by_disease = MappingProxyType({k: tuple(v) for k, v in by_disease.items()})
+        self.by_substance = MappingProxyType({k: tuple(v) for k, v in by_substance.items()})
+
+        # canonical id → every class it belongs to (transitively) / every member name below a class
+        parents = {}
+        children = {}
+        for link in class_links:
+            member_id = canonical_substance(link['member_name'])
+            class_id = canonical_substance(link['class_name'])
+            parents.setdefault(member_id, set()).add(class_id)
+            children.setdefault(class_id, {})[link['member_name']] = member_id
+        self.classes_of = MappingProxyType({m: frozenset(_closure(m, parents)) for m in parents})
+        self._members = MappingProxyType({c: tuple(_member_names(c, children)) for c in children})
+
+        digest = hashlib.sha1()
+        for record in self.records:
+            digest.update(repr(record.items()).encode("utf-8"))
+        for link in class_links:
+            digest.update(f"{link['member_name']}\x00{link['class_name']}".encode("utf-8"))
+        self.version = digest.hexdigest()[:12]
+
+    def for_diseases(self, disease_names):
+        """Records for the given diseases, most dangerous first (shared objects, no copies)."""
+        records = [r for name in dict.fromkeys(disease_names) for r in self.by_disease.get(name, ())]
+        records.sort(key=lambda r: risk_rank(r['risk_level']))
+        return tuple(records)
+
+    def lookup(self, substance_name, disease_names=None):
+        """
+        Records for a substance (any spelling/synonym) and for every class it
+        belongs to, most dangerous first; optionally limited to some diseases.
+        """
+        substance_id = canonical_substance(substance_name)
+        records = self.by_substance.get(substance_id, ())
+        classes = self.classes_of.get(substance_id)
+        if classes:
+            records = records + tuple(r for c in sorted(classes) for r in self.by_substance.get(c, ()))
+            records = tuple(sorted(records, key=lambda r: risk_rank(r['risk_level'])))
+        if disease_names is None:
+            return records
+        diseases = set(disease_names)
+        return tuple(r for r in records if r['disease_name'] in diseases)
+
+    def is_member(self, substance_name, class_name):
+        """Whether a substance belongs (directly or through a parent class) to a class."""
+        return canonical_substance(class_name) in self.classes_of.get(canonical_substance(substance_name), ())
+
+    def members_of(self, class_name):
+        """Names of every drug/sub-class under a class (empty for a plain substance)."""
+        return self._members.get(canonical_substance(class_name), ())
+
+    def diseases_for_substance(self, substance_name):
+        """Diseases in which a substance is contraindicated."""
+        return tuple(dict.fromkeys(r['disease_name'] for r in self.lookup(substance_name)))
+
+    def __len__(self):
+        return len(self.records)
+
+
+_knowledge_base = None
+_lock = threading.Lock()
+
+
+def get_knowledge_base():
+    """The shared knowledge base (loaded from SQLite on first use)."""
+    global _knowledge_base
+
+    if _knowledge_base is None:
+        with _lock:
+            if _knowledge_base is None:
+                _knowledge_base = _load()
+    return _knowledge_base
+
+
+def reload_knowledge_base():
+    """Re-read the contraindications table (e.g. after editing it); returns the new knowledge base."""
+    global _knowledge_base
+
+    with _lock:
+        _knowledge_base = _load()
+    return _knowledge_base
+
+
+def _closure(member_id, parents):
+    """All classes above member_id (cycle-safe)."""
+    seen = set()
+    stack = list(parents.get(member_id, ()))
+    while stack:
+        class_id = stack.pop()
+        if class_id in seen or class_id == member_id:
+            continue
+        seen.add(class_id)
+        stack.extend(parents.get(class_id, ()))
+    return seen
+
+
+def _member_names(class_id, children):
+    """Member names under class_id, direct members first (cycle-safe)."""
+    names = {}
+    seen = {class_id}
+    queue = [class_id]
+    while queue:
+        for name, member_id in children.get(queue.pop(0), {}).items():
+            names.setdefault(name, None)
+            if member_id not in seen:
+                seen.add(member_id)
+                queue.append(member_id)
+    return names
+
+
+def _load():
+    kb = KnowledgeBase(get_contraindication_table(), get_drug_class_table())
+    print(f"📚 Knowledge base loaded: {len(kb)} contraindications, "
+          f"{len(kb.classes_of)} drug-class members (version {kb.version})")
+    return kb
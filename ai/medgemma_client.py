@@ -1,306 +1,168 @@
 """
-medgemma_client.py — MedGemma 4B model loading and inference.
-Includes a mock mode for local development without GPU.
+medgemma_client.py — MedGemma inference entry points.
+Delegates to a pluggable backend (see backends.py), including a mock mode
+for local development without GPU.
 """
 
 import os
+import threading
+
+from ai.backends import MockBackend, create_backend
 
 # Check if we should use mock mode (no GPU / local development)
 USE_MOCK = os.environ.get("MEDGEMMA_MOCK", "true").lower() == "true"
 
+# Inference backend: transformers (in-process), mock, http (OpenAI-compatible
+# server) or synthetic (mock text at modelled GPU latency, for load tests)
+BACKEND = os.environ.get("MEDGEMMA_BACKEND", "mock" if USE_MOCK else "transformers").lower()
+
+_backend = None
 _model = None
 _tokenizer = None
 _loading_error = None
+_init_lock = threading.Lock()
+_response_cache = None
 
 
 def load_medgemma():
-    """Load MedGemma 4B model with 4-bit quantization."""
-    global _model, _tokenizer, _loading_error
+    """Create the configured inference backend (MedGemma 4B, mock, or remote server)."""
+    global _backend, _model, _tokenizer, _loading_error
 
-    if USE_MOCK:
+    if BACKEND == "mock":
         print("🧪 Running in MOCK mode — MedGemma responses will be simulated")
         print("   Set MEDGEMMA_MOCK=false to use real model (requires GPU)")
-        _model = "mock"
-        _tokenizer = "mock"
-        return _model, _tokenizer
-
-    try:
-        from transformers import AutoTokenizer, AutoModelForCausalLM
-        import torch
-
-        model_name = "google/medgemma-4b-it"
-        print(f"🧠 Loading {model_name}...")
-
-        _tokenizer = AutoTokenizer.from_pretrained(model_name)
-        _model = AutoModelForCausalLM.from_pretrained(
-            model_name,
-            torch_dtype=torch.float16,
-            load_in_4bit=True,
-            device_map="auto"
-        )
-        print("✅ MedGemma loaded successfully")
-        return _model, _tokenizer
-    except Exception as e:
-        print(f"⚠️ Failed to load MedGemma: {e}")
-        print("🧪 Falling back to MOCK mode")
-        _loading_error = str(e)
-        _model = "mock"
-        _tokenizer = "mock"
-        return _model, _tokenizer
-
-
-def ask_medgemma(prompt, system_prompt="", max_tokens=1024):
-    """Send a prompt to MedGemma and get a response."""
-    global _model, _tokenizer
-
-    if _model is None:
+        _backend = MockBackend()
+    else:
+        try:
+            _backend = create_backend(BACKEND)
+        except Exception as e:
+            print(f"⚠️ Failed to load MedGemma: {e}")
+            print("🧪 Falling back to MOCK mode")
+            _loading_error = str(e)
+            _backend = MockBackend(_loading_error)
+
+    _model, _tokenizer = _backend.model, _backend.tokenizer
+    return _model, _tokenizer
+
+
+def get_backend():
+    """The active inference backend (loaded on first use)."""
+    if _backend is None:
         load_medgemma()
+    return _backend
 
-    if _model == "mock":
-        return _generate_mock_response(prompt, system_prompt)
 
-    # Real model inference
-    from transformers import AutoTokenizer, AutoModelForCausalLM
+def get_loaded_backend():
+    """The inference backend if it is already loaded, else None (never loads it)."""
+    return _backend
 
-    full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
 
-    inputs = _tokenizer(full_prompt, return_tensors="pt").to(_model.device)
-    outputs = _model.generate(
-        **inputs,
-        max_new_tokens=max_tokens,
-        temperature=0.3,
-        do_sample=True,
-        top_p=0.9
-    )
-    response = _tokenizer.decode(outputs[0], skip_special_tokens=True)
+def ask_medgemma(prompt, system_prompt="", max_tokens=1024, context=""):
+    """
+    Send a prompt to MedGemma and get a response.
+    context is the patient block placed between the system prompt and the
+    task prompt; it is cached separately so repeated tasks skip its prefill.
+    """
+    backend = get_backend()
 
-    # Remove the input prompt from the response
-    if response.startswith(full_prompt):
-        response = response[len(full_prompt):].strip()
+    cache_key = _response_cache_key(backend, prompt, system_prompt, max_tokens, context)
+    if cache_key:
+        cached = _get_response_cache().get(cache_key)
+        if cached is not None:
+            return cached
 
+    response = backend.generate(prompt, system_prompt, max_tokens, context)
+
+    if cache_key:
+        _get_response_cache().put(cache_key, response)
     return response
 
 
-def _generate_mock_response(prompt, system_prompt=""):
-    """Generate realistic mock responses for demo/testing."""
-    prompt_lower = prompt.lower()
-
-    # Patient summary mock
-    if "ملخص" in prompt or "summary" in prompt_lower:
-        if "سارة" in prompt or "myasthenia" in prompt_lower:
-            return """📋 ملخص الحالة:
-- مريضة 34 سنة تعاني من Myasthenia Gravis مشخّصة منذ 2022
-- تتناول Pyridostigmine 60mg ثلاث مرات يومياً
-- سابقة دخول طوارئ بسبب تفاقم MG (يناير 2025) بعد إيقاف الدواء
-
-⚠️ تنبيهات مهمة:
-- 🔴 موانع حرجة: Magnesium, Aminoglycosides, Succinylcholine
-- 🔴 موانع عالية: Beta-blockers, Fluoroquinolones
-- ⚠️ يجب مراقبة وظائف التنفس عن كثب
-
-💊 الأدوية الحالية:
-- Pyridostigmine 60mg × 3 يومياً (مثبط كولينستراز)"""
-
-        elif "عبد الله" in prompt:
-            return """📋 ملخص الحالة:
-- مريض 56 سنة يعاني من قصور في الشريان التاجي + ارتفاع ضغط الدم
-- تم تركيب دعامة قلبية (LAD) في 2023
-- سابقة دخول طوارئ بذبحة صدرية غير مستقرة (نوفمبر 2024)
-
-⚠️ تنبيهات مهمة:
-- 🔴 يمنع NSAIDs (خطر قلبي وعائي)
-- ⚠️ LDL مرتفع (145 mg/dL) — يحتاج متابعة
-
-💊 الأدوية الحالية:
-- Aspirin 75mg يومياً — Atorvastatin 20mg — Bisoprolol 5mg"""
-
-        elif "أحمد" in prompt:
-            return """📋 ملخص الحالة:
-- مريض 58 سنة يعاني من ارتفاع ضغط الدم + سكري نوع 2
-- السكري غير منضبط (HbA1c: 7.2%)
-- 🔴 حساسية شديدة من البنسلين (صدمة تحسسية سابقة)
-
-⚠️ تنبيهات مهمة:
-- 🔴 ممنوع وصف Penicillin أو مشتقاته — تاريخ Anaphylaxis
-- ⚠️ تجنب Corticosteroids (ترفع السكر)
-
-💊 الأدوية الحالية:
-- Amlodipine 5mg — Metformin 500mg × 2"""
-
-        elif "محمود" in prompt:
-            return """📋 ملخص الحالة:
-- مريض 41 سنة يعاني من الربو
-- سابقة دخول طوارئ بنوبة ربو حادة (ديسمبر 2024)
-- 🔴 حساسية شديدة من Aspirin (تشنج قصبي)
-
-⚠️ تنبيهات مهمة:
-- 🔴 ممنوع Beta-blockers (تضيق شعبي)
-- 🔴 ممنوع Aspirin و NSAIDs (تفاقم الربو)
-
-💊 الأدوية الحالية:
-- Salbutamol بخاخ عند الحاجة"""
-
-        else:
-            return """📋 ملخص الحالة:
-- مريضة 31 سنة — لا أمراض مزمنة
-- حساسية خفيفة من أدوية Sulfa (طفح جلدي)
-- تاريخ عائلي: الأم مصابة بالسكري
-
-⚠️ تنبيهات مهمة:
-- ⚠️ تجنب أدوية Sulfa
-- معلوماتي: تاريخ عائلي للسكري — يُنصح بفحص دوري
-
-💊 الأدوية الحالية:
-- لا توجد أدوية حالية"""
-
-    # Diagnosis loop mock
-    if "محقق طبي" in prompt or "تشخيص معمق" in prompt or "detective" in prompt_lower:
-        if "myasthenia" in prompt_lower or "ضعف عام" in prompt or "مغنيسيوم" in prompt:
-            return """[خطوة 1]: جمع البيانات من السجل الطبي...
-   ← المريضة سارة خالد، 34 سنة
-   ← مصابة بـ Myasthenia Gravis منذ 2022
-   ← تتناول Pyridostigmine 60mg × 3 يومياً
-   ← سابقة تفاقم MG في يناير 2025 بعد إيقاف الدواء
-
-[خطوة 2]: تحليل العلاقة بين الشكوى والتاريخ...
-   ← الشكوى "ضعف عام + صعوبة بلع" متوافقة مع تفاقم MG
-   ← Anti-AChR Antibodies سابقاً: 15.2 nmol/L (إيجابية قوية)
-   ← احتمال: أزمة Myasthenic Crisis (ثقة مبدئية: 65%)
-
-[خطوة 3]: البحث عن أدلة إضافية...
-   ← من المحادثة/المدخلات: المريضة تناولت مغنيسيوم
-   ← 🔴 تطابق مع جدول contraindications:
-      Magnesium + Myasthenia Gravis = CRITICAL
-      السبب: يثبط النقل العصبي العضلي (NMJ)
-   ← هذا يفسر التفاقم المفاجئ
-   ← ثقة الآن: 90%
-
-[خطوة 4]: التحقق والتأكيد...
-   ← التسلسل الزمني منطقي: تناول مغنيسيوم ← تثبيط NMJ ← تفاقم الضعف
-   ← الأعراض (ضعف عام + صعوبة بلع) تتوافق مع Myasthenic Crisis
-   ← لا توجد تفسيرات بديلة أقوى
-
-[النتيجة]: تفاقم Myasthenia Gravis بسبب تناول مغنيسيوم — نسبة الثقة: 90%
-
-[🔴 اقتراحات حمراء — تحاليل/أشعة]:
-• Anti-AChR Antibodies — لتقييم نشاط المرض
-• Electrolytes Panel — لقياس مستوى المغنيسيوم الفعلي
-• ABG — غازات دم شرياني لتقييم التنفس
-• Pulmonary Function Test — لتقييم الوظيفة التنفسية
-• مراقبة Forced Vital Capacity كل ساعة
-
-[🔴 تحذيرات]:
-⚠️ تحذير حرج: المريضة تناولت مغنيسيوم وهي تعاني MG
-   → المغنيسيوم يثبط NMJ ويفاقم الضعف بشكل خطير
-   → خطر فشل تنفسي — مراقبة تنفسية مستمرة مطلوبة
-
-⚠️ تجنب وصف أي من المواد التالية:
-   • Aminoglycosides (critical)
-   • Succinylcholine (critical)
-   • Beta-blockers (high)
-   • Fluoroquinolones (high)"""
-
-        return """[خطوة 1]: جمع البيانات من السجل الطبي...
-   ← تم سحب السجل الكامل وتحليل البيانات
-
-[خطوة 2]: تحليل العلاقة بين الشكوى والتاريخ...
-   ← جارٍ تحليل العلاقة بين الأعراض والتاريخ المرضي
-
-[خطوة 3]: البحث عن أدلة إضافية...
-   ← لم يتم العثور على تعارضات حرجة
-
-[خطوة 4]: التحقق والتأكيد...
-   ← يحتاج مزيد من المعلومات للتشخيص الدقيق
-
-[النتيجة]: يُنصح بإجراء فحوصات إضافية للوصول لتشخيص نهائي — نسبة الثقة: 40%
-
-[🔴 اقتراحات حمراء — تحاليل/أشعة]:
-• CBC — تعداد دم شامل
-• CMP — لوحة أيض شاملة
-
-[🔴 تحذيرات]:
-لا توجد تحذيرات حرجة حالياً"""
-
-    # Conversation analysis mock
-    if "حلل المحادثة" in prompt or "محادثة" in prompt:
-        if "مغنيسيوم" in prompt:
-            return """1. **الأعراض المذكورة:**
-   - ضعف عام في الجسم
-   - صعوبة في البلع
-   - إرهاق شديد
-
-2. **مواد/أدوية ذُكرت:**
-   - 🔴 مغنيسيوم (تناولته المريضة بجرعة عالية)
-
-3. **معلومات لم تُسجَّل:**
-   - المريضة قد تكون أوقفت أو قللت جرعة Pyridostigmine
-
-4. **اقتراحات ملء الحقول:**
-   - الشكوى الرئيسية: ضعف عام + صعوبة بلع
-   - ما تناوله قبل الحضور: مغنيسيوم بجرعة عالية
-
-5. **🔴 تنبيهات عاجلة:**
-   - المغنيسيوم + Myasthenia Gravis = خطر حرج!
-   - يثبط النقل العصبي العضلي — خطر أزمة تنفسية"""
-
-        return """1. **الأعراض المذكورة:**
-   - تم تحليل المحادثة
-
-2. **مواد/أدوية ذُكرت:**
-   - لم يتم ذكر مواد خطرة
-
-3. **معلومات لم تُسجَّل:**
-   - لا توجد معلومات جديدة
-
-4. **اقتراحات ملء الحقول:**
-   - يرجى مراجعة الحقول يدوياً
-
-5. **تنبيهات عاجلة:**
-   - لا توجد تنبيهات عاجلة"""
-
-    # Suggestions mock
-    if "اقتراحات" in prompt or "suggestion" in prompt_lower:
-        return """1. **تحاليل إضافية مقترحة:**
-   - CBC — تعداد دم شامل (أساسي)
-   - CRP — بروتين التفاعلي (لتقييم الالتهاب)
-   - Electrolytes — لتقييم توازن الأملاح
-
-2. **تشخيصات محتملة:**
-   - التشخيص الأولي يحتاج مزيد من المعلومات (ثقة: 50%)
-
-3. **أسئلة يجب أن يسألها الطبيب:**
-   - هل تناولت أي أدوية أو مكملات مؤخراً؟
-   - منذ متى بدأت الأعراض بالضبط؟
-   - هل هناك تاريخ عائلي لأمراض مشابهة؟
-
-4. **تحذيرات:**
-   - لا توجد تحذيرات إضافية حالياً"""
-    
-    # First Aid / Choking Mock (Added for user request)
-    if "اختناق" in prompt or "choking" in prompt_lower or "اسعافات" in prompt:
-         return """🚑 **الإسعافات الأولية للاختناق (Choking):**
-    
-    1. **شجع المصاب على السعال** إذا كان يستطيع التنفس جزئياً.
-    2. **ضربات الظهر (Back Blows):**
-       - قف خلف المصاب واسنده بيد واحدة.
-       - اضرب بقوة 5 مرات بين لوحي الكتف بكعب يدك الأخرى.
-    3. **ضغطات البطن (مناورة هيمليك - Heimlich Maneuver):**
-       - قف خلف المصاب ولف ذراعيك حول خصره.
-       - اقبض يدك وضعها فوق السرة (تحت القفص الصدري).
-       - اضغط بقوة للداخل ولأعلى 5 مرات.
-    4. **كرر:** 5 ضربات ظهر ثم 5 ضغطات بطن حتى يخرج الجسم الغريب.
-    
-    ⚠️ **إذا فقد المصاب الوعي:** ابدأ الإنعاش القلبي الرئوي (CPR) فوراً واتصل بالطوارئ."""
-
-    # Generic Mock Response with Loading Status Check
-    status_msg = ""
-    # Check if _loading_error global exists (it might not if imported partially)
+def stream_medgemma(prompt, system_prompt="", max_tokens=1024, context=""):
+    """Yield MedGemma's response as text chunks while it is being generated."""
+    backend = get_backend()
+
+    cache_key = _response_cache_key(backend, prompt, system_prompt, max_tokens, context)
+    if cache_key:
+        cached = _get_response_cache().get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    chunks = []
+    for chunk in backend.stream(prompt, system_prompt, max_tokens, context):
+        chunks.append(chunk)
+        yield chunk
+
+    if cache_key:
+        _get_response_cache().put(cache_key, "".join(chunks))
+
+
+async def ask_medgemma_async(prompt, system_prompt="", max_tokens=1024, context="", priority=None):
+    """
+    Awaitable ask_medgemma that waits its turn in the triage priority queue.
+    priority is a reception triage label (e.g. "⚫ حرج") or a queue rank.
+    Raises QueueFullError when the queue is full and the request is not critical.
+    """
+    from ai.inference_queue import get_inference_queue
+
+    ticket = get_inference_queue().submit(
+        priority, ask_medgemma, prompt, system_prompt, max_tokens, context
+    )
+    try:
+        return await ticket.result()
+    finally:
+        ticket.cancel()
+
+
+async def stream_medgemma_async(prompt, system_prompt="", max_tokens=1024, context="", priority=None):
+    """
+    stream_medgemma behind the triage priority queue.
+    Yields (position, chunk) pairs: while queued, (requests ahead, None) about
+    once a second; once running, (0, text chunk).
+    """
+    from ai.inference_queue import get_inference_queue
+
+    ticket = get_inference_queue().submit(
+        priority, stream_medgemma, prompt, system_prompt, max_tokens, context, stream=True
+    )
     try:
-        if _loading_error:
-            status_msg = f"\n\n⚠️ **تنبيه:** فشل تحميل الموديل الحقيقي ({_loading_error}).\nأعمل حالياً بوضع المحاكاة (Demo Mode)."
-        else:
-             status_msg = "\n\n⚠️ **تنبيه:** أعمل بوضع المحاكاة (Demo Mode) لأن الاتصال بالنموذج غير نشط."
-    except NameError:
-        status_msg = "\n\n⚠️ **تنبيه:** أعمل بوضع المحاكاة (Demo Mode)."
-
-    return f"⚠️ **وضع المحاكاة:** لم أتمكن من فهم هذا السؤال في الوضع التجريبي.\n\nالسؤال: {prompt}\n\nيرجى التأكد من تشغيل النموذج الحقيقي على Colab للحصول على إجابات غير محدودة.{status_msg}"
+        while not await ticket.wait_started(timeout=1.0):
+            yield ticket.position(), None
+        async for chunk in ticket:
+            yield 0, chunk
+    finally:
+        ticket.cancel()
+
+
+def get_response_cache_stats():
+    """Hit/miss counters of the response cache (None when it is disabled)."""
+    if _response_cache is None:
+        return None
+    return _response_cache.stats()
+
+
+def _response_cache_key(backend, prompt, system_prompt, max_tokens, context):
+    """
+    Cache key for a request, or None when caching does not apply.
+    Sampled decoding gives a different answer each call, so only the mock and
+    greedy decoding (MEDGEMMA_DO_SAMPLE=false) are cached.
+    """
+    from ai.response_cache import RESPONSE_CACHE_ENABLED, make_key
+
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    sampling = backend.cache_params()
+    if sampling is None:
+        return None
+    return make_key(backend.model_id, system_prompt, context, prompt, max_tokens, sampling)
+
+
+def _get_response_cache():
+    global _response_cache
+
+    with _init_lock:
+        if _response_cache is None:
+            from ai.response_cache import ResponseCache
+            _response_cache = ResponseCache()
+    return _response_cache
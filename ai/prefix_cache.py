@@ -0,0 +1,92 @@
+"""
+prefix_cache.py — Reusable KV-cache for shared prompt prefixes.
+Keeps the past-key-values of the system prompt (once per process) and of each
+patient's context block (once per session) so only the task-specific suffix
+has to be prefilled. Bounded by a memory budget with LRU eviction.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+PREFIX_CACHE_MB = float(os.environ.get("MEDGEMMA_PREFIX_CACHE_MB", "512"))
+
+
+def prefix_key(segments):
+    """Stable key for a sequence of prompt segments."""
+    digest = hashlib.sha1()
+    for segment in segments:
+        digest.update(segment.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def cache_nbytes(past):
+    """Memory held by a tuple-of-(key, value) cache."""
+    return sum(t.numel() * t.element_size() for layer in past for t in layer)
+
+
+class PrefixCache:
+    """LRU map of prefix key → (past_key_values, token_length)."""
+
+    def __init__(self, max_mb=PREFIX_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._pinned = set()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return (past, length) for a cached prefix, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, past, length, pinned=False):
+        """
+        Store a prefix cache. Pinned entries (the system prompt) are never
+        evicted; everything else is dropped least-recently-used first.
+        """
+        nbytes = cache_nbytes(past)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            if not pinned and nbytes > self.max_bytes:
+                return
+            self._entries[key] = (past, length, nbytes)
+            self._bytes += nbytes
+            if pinned:
+                self._pinned.add(key)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pinned.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _evict(self):
+        for key in list(self._entries):
+            if self._bytes <= self.max_bytes:
+                break
+            if key in self._pinned:
+                continue
+            self._bytes -= self._entries.pop(key)[2]
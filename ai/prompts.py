@@ -14,10 +14,12 @@ SYSTEM_PROMPT = """أنت مساعد طبي ذكي في قسم الطوارئ. 
 5. استخدم اللغة العربية الطبية
 6. ميّز بين أنواع التنبيهات: 🔴 حرج / 🟡 مهم / 🔵 معلوماتي"""
 
-SUMMARY_PROMPT = """بناءً على السجل الطبي التالي للمريض، أنشئ ملخصاً سريعاً لطبيب الطوارئ.
+# Shared patient block — placed right after the system prompt in every request
+# so the model can reuse its cached prefix across tasks for the same patient.
+PATIENT_CONTEXT_PROMPT = """السجل الطبي للمريض:
+{patient_context}"""
 
-السجل الطبي:
-{patient_context}
+SUMMARY_PROMPT = """بناءً على السجل الطبي للمريض أعلاه، أنشئ ملخصاً سريعاً لطبيب الطوارئ.
 
 قدم الملخص بالتنسيق التالي:
 📋 ملخص الحالة:
@@ -31,10 +33,12 @@ SUMMARY_PROMPT = """بناءً على السجل الطبي التالي للم
 💊 الأدوية الحالية:
 - قائمة الأدوية"""
 
-DIAGNOSIS_LOOP_PROMPT = """أنت محقق طبي. مهمتك الدخول في حلقة تشخيص معمق.
-
-البيانات المتاحة:
-{session_cache_context}
+# ── Diagnosis fan-out (see diagnosis_executor.py) ──
+# The detective loop split into independent sub-tasks that run concurrently over
+# the cached patient prefix, followed by a short synthesis step. Each sub-task
+# produces only its own sections of the report ([خطوة 1] … [🔴 تحذيرات]);
+# diagnosis_executor.assemble_report puts them back in order.
+DIAGNOSIS_CASE_PROMPT = """أنت محقق طبي في حلقة تشخيص معمق. البيانات المتاحة: السجل الطبي للمريض أعلاه.
 
 الشكوى الحالية:
 {chief_complaint}
@@ -44,30 +48,49 @@ DIAGNOSIS_LOOP_PROMPT = """أنت محقق طبي. مهمتك الدخول في
 
 نص المحادثة (إن وُجد):
 {transcript}
+"""
 
-اعمل بالخطوات:
-1. اجمع كل البيانات ذات الصلة من السجل
-2. حلل العلاقة بين الشكوى والتاريخ
-3. ابحث عن أدلة تدعم أو تنفي التشخيصات المحتملة
-4. تحقق من وجود مواد ممنوعة ذُكرت في المحادثة أو المدخلات
-5. قدم التشخيص النهائي مع نسبة ثقة
+DIAGNOSIS_HISTORY_PROMPT = DIAGNOSIS_CASE_PROMPT + """
+مهمتك الآن فقط: اجمع البيانات ذات الصلة من السجل، ثم حلل العلاقة بين الشكوى والتاريخ المرضي مع ثقة مبدئية.
 
 قدم مخرجاتك بهذا التنسيق:
 [خطوة 1]: جمع البيانات...
-[خطوة 2]: تحليل السياق...
-[خطوة 3]: البحث عن أدلة...
-[خطوة 4]: التحقق والتأكيد...
-[النتيجة]: التشخيص + نسبة الثقة
-[🔴 اقتراحات حمراء — تحاليل/أشعة]: ...
+[خطوة 2]: تحليل السياق..."""
+
+DIAGNOSIS_EVIDENCE_PROMPT = DIAGNOSIS_CASE_PROMPT + """
+مهمتك الآن فقط: ابحث عن أدلة تدعم أو تنفي التشخيصات المحتملة، وتحقق من أي مواد ممنوعة ذُكرت في المحادثة أو المدخلات مقابل موانع المريض.
+
+قدم مخرجاتك بهذا التنسيق:
+[خطوة 3]: البحث عن أدلة..."""
+
+DIAGNOSIS_TESTS_PROMPT = DIAGNOSIS_CASE_PROMPT + """
+مهمتك الآن فقط: اقترح التحاليل والأشعة اللازمة مع سبب كل منها.
+
+قدم مخرجاتك بهذا التنسيق:
+[🔴 اقتراحات حمراء — تحاليل/أشعة]: ..."""
+
+DIAGNOSIS_WARNINGS_PROMPT = DIAGNOSIS_CASE_PROMPT + """
+مهمتك الآن فقط: اذكر التحذيرات الحرجة والمواد التي يجب تجنب وصفها لهذا المريض.
+
+قدم مخرجاتك بهذا التنسيق:
 [🔴 تحذيرات]: ..."""
 
+DIAGNOSIS_SYNTHESIS_PROMPT = DIAGNOSIS_CASE_PROMPT + """
+نتائج التحليل الجزئي:
+{findings}
+
+مهمتك الآن فقط: راجع النتائج السابقة، تحقق من تسلسلها الزمني ومن عدم وجود تفسيرات بديلة أقوى، ثم قدم التشخيص النهائي مع نسبة ثقة. لا تكرر النتائج.
+
+قدم مخرجاتك بهذا التنسيق:
+[خطوة 4]: التحقق والتأكيد...
+[النتيجة]: التشخيص + نسبة الثقة"""
+
 CONVERSATION_ANALYSIS_PROMPT = """حلل المحادثة التالية بين الطبيب والمريض واستخلص:
 
 نص المحادثة:
 {transcript}
 
-السجل الطبي للمريض:
-{patient_context}
+(السجل الطبي للمريض مذكور أعلاه)
 
 استخلص:
 1. **الأعراض المذكورة:** قائمة بكل الأعراض التي ذكرها المريض
@@ -76,10 +99,7 @@ CONVERSATION_ANALYSIS_PROMPT = """حلل المحادثة التالية بين
 4. **اقتراحات ملء الحقول:** أي حقول في النموذج يمكن ملؤها من المحادثة
 5. **تنبيهات عاجلة:** أي مادة ممنوعة أو خطر اكتشفته"""
 
-SUGGESTION_PROMPT = """بناءً على البيانات التالية، قدم اقتراحات ذكية لطبيب الطوارئ:
-
-بيانات المريض:
-{patient_context}
+SUGGESTION_PROMPT = """بناءً على السجل الطبي للمريض أعلاه والبيانات التالية، قدم اقتراحات ذكية لطبيب الطوارئ:
 
 الشكوى والفحص:
 {clinical_data}
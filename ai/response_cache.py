@@ -0,0 +1,160 @@
+"""
+response_cache.py — Content-addressed cache for MedGemma responses.
+Keyed by a hash of (model id, system prompt, context, prompt, max_tokens,
+sampling params). An in-memory LRU tier answers repeats instantly; an on-disk
+SQLite tier survives restarts, with TTL and size-based eviction.
+Only used when decoding is deterministic — see medgemma_client.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# ── Cache Settings ──
+RESPONSE_CACHE_ENABLED = os.environ.get("MEDGEMMA_RESPONSE_CACHE", "false").lower() == "true"
+RESPONSE_CACHE_PATH = os.environ.get(
+    "MEDGEMMA_RESPONSE_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), "response_cache.db")
+)
+RESPONSE_CACHE_TTL = float(os.environ.get("MEDGEMMA_RESPONSE_CACHE_TTL", str(24 * 3600)))
+RESPONSE_CACHE_MEMORY_ENTRIES = int(os.environ.get("MEDGEMMA_RESPONSE_CACHE_ENTRIES", "256"))
+RESPONSE_CACHE_DISK_MB = float(os.environ.get("MEDGEMMA_RESPONSE_CACHE_MB", "64"))
+
+# Run disk eviction every N writes instead of on every put
+_EVICT_EVERY = 50
+
+
+def make_key(model_id, system_prompt, context, prompt, max_tokens, sampling):
+    """Hash every input that can change the generated text."""
+    payload = json.dumps(
+        [model_id, system_prompt, context, prompt, max_tokens, sampling],
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + SQLite) response cache with hit/miss counters."""
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl=RESPONSE_CACHE_TTL,
+                 memory_entries=RESPONSE_CACHE_MEMORY_ENTRIES, max_disk_mb=RESPONSE_CACHE_DISK_MB):
+        self.path = path
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.commit()
+
+    def get(self, key):
+        """Return the cached response text, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, created_at = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return response
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] <= self.ttl:
+                    self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                    self._conn.commit()
+                    self._remember(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, response):
+        """Store a response in both tiers."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now)
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 0:
+                self._evict_disk(now)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+
+    def stats(self):
+        """Hit/miss counters and tier sizes."""
+        with self._lock:
+            disk_entries = disk_bytes = 0
+            if self._conn is not None:
+                disk_entries, disk_bytes = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_entries': disk_entries,
+                'disk_bytes': disk_bytes,
+            }
+
+    def _remember(self, key, response, created_at):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_disk_bytes:
+            # Drop least-recently-used rows until the tier fits its budget
+            excess = total - self.max_disk_bytes
+            freed = 0
+            victims = []
+            for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+                victims.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._conn.commit()
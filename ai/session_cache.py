@@ -1,13 +1,32 @@
 """
 session_cache.py — In-memory cache for patient data during a session.
 Loads all patient data once from SQLite, then all checks run from memory.
+refresh() re-fetches only the tables whose patient_versions counter moved.
 """
 
-from db.queries import (
-    get_patient_info, get_chronic_diseases, get_allergies,
-    get_medications, get_surgeries, get_visits, get_lab_results,
-    get_abnormal_labs, get_all_contraindications
-)
+import threading
+
+from db.queries import load_patient_record, get_patient_versions, get_relevant_history, PATIENT_RECORD_TABLES
+from db.records import Alert, RiskLevel
+from ai.knowledge_base import get_knowledge_base
+from ai.substance_matcher import SubstanceMatcher
+from ai.drug_synonyms import canonical_substance, synonyms_for
+from utils.helpers import normalize_arabic
+
+# load_patient_record key → cache attribute
+_RECORD_ATTRIBUTES = {
+    'patient': 'patient_info',
+    'chronic_diseases': 'chronic_diseases',
+    'allergies': 'allergies',
+    'medications': 'medications',
+    'surgeries': 'surgeries',
+    'visits': 'visits',
+    'lab_results': 'lab_results',
+    'abnormal_labs': 'abnormal_labs',
+}
+
+# Past visits matched to the complaint for the diagnosis prompt
+RELEVANT_VISITS = 3
 
 
 class SessionCache:
@@ -18,160 +37,260 @@ class SessionCache:
 
     def __init__(self, patient_id):
         self.patient_id = patient_id
+        # refresh() swaps tables while handlers on other threads read them
+        self._lock = threading.RLock()
+
+        # Load everything once from SQLite (one connection, one consistent snapshot)
+        record = load_patient_record(patient_id)
+        self._apply_record(record)
+        self.versions = record['versions']
 
-        # Load everything once from SQLite
-        self.patient_info = get_patient_info(patient_id)
-        self.chronic_diseases = get_chronic_diseases(patient_id)
-        self.allergies = get_allergies(patient_id)
-        self.medications = get_medications(patient_id)
-        self.surgeries = get_surgeries(patient_id)
-        self.visits = get_visits(patient_id)
-        self.lab_results = get_lab_results(patient_id)
-        self.abnormal_labs = get_abnormal_labs(patient_id)
-
-        # Load all contraindications related to this patient's diseases
-        disease_names = [d['disease_name'] for d in self.chronic_diseases]
-        self.contraindications = get_all_contraindications(disease_names)
-
-        # AI summary (generated once)
+        # View of the shared knowledge base for this patient's diseases (no query, no copies)
+        self.knowledge_base = get_knowledge_base()
+        self.contraindications = self.knowledge_base.for_diseases(self.get_disease_names())
+
+        # AI summary (generated once, in the background — see analyzer.precompute_summary)
         self.ai_summary = None
+        self.summary_future = None
 
         # Session updates log
         self.session_updates = []
 
         # Current form data
-        self.current_vitals = {}
+        self._current_vitals = {}
         self.current_complaint = ""
         self.current_transcript = ""
 
+        # Memoized context: record block per budget (cleared by refresh()), vitals and
+        # session updates re-rendered only when marked dirty
+        self._static_context = {}
+        self._vitals_context = None
+        self._updates_context = None
+        self._vitals_dirty = True
+        self._updates_dirty = True
+
+        # Compiled substance/allergen matcher (see check_multiple_substances)
+        self._substance_matcher = None
+        # Live-screening state per UI field (see get_incremental_checker)
+        self._incremental_checkers = {}
+
+        # complaint → past visits matching it (see get_relevant_history)
+        self._relevant_history = {}
+
+        # What the last get_context_for_ai() kept and dropped
+        self.last_context_report = None
+
+        # Called with the cache after refresh() reloaded tables (the registry re-measures it)
+        self.on_refresh = None
+
         print(f"✅ Session cache created for patient: {self.patient_info.get('name', 'Unknown')}")
         print(f"   Diseases: {len(self.chronic_diseases)} | Allergies: {len(self.allergies)} | "
               f"Medications: {len(self.medications)} | Contraindications: {len(self.contraindications)}")
 
+    def refresh(self):
+        """
+        Re-fetch the tables changed since they were loaded (one version query
+        when nothing changed) and drop what was derived from them: context
+        report, substance matcher and AI summary. Returns the changed tables.
+        A new visit alone keeps the summary — it is in the context anyway.
+        """
+        versions = get_patient_versions(self.patient_id)
+        changed = [
+            table for table, _, _, _ in PATIENT_RECORD_TABLES
+            if versions.get(table, 0) != self.versions.get(table, 0)
+        ]
+        if not changed:
+            return []
+
+        record = load_patient_record(self.patient_id, tables=changed)
+        with self._lock:
+            self._apply_record(record)
+            # Only the reloaded tables advance, to the versions read before loading them:
+            # a table bumped in between keeps its old version and is reloaded next time
+            self.versions = {**self.versions, **{table: versions.get(table, 0) for table in changed}}
+
+            if 'chronic_diseases' in changed:
+                self.contraindications = self.knowledge_base.for_diseases(self.get_disease_names())
+            if 'chronic_diseases' in changed or 'allergies' in changed:
+                self._substance_matcher = None
+                self._incremental_checkers = {}
+            if 'visits' in changed:
+                self._relevant_history = {}
+            self._static_context = {}
+            self.last_context_report = None
+            if set(changed) - {'visits'}:
+                # The summary was written from the old record; a late result of the old future is ignored
+                self.ai_summary = None
+                self.summary_future = None
+
+        print(f"🔄 Session cache refreshed for patient {self.patient_id}: {', '.join(changed)}")
+        if self.on_refresh is not None:
+            self.on_refresh(self)
+        return changed
+
+    def _apply_record(self, record):
+        """Store the tables of a load_patient_record() result."""
+        for key, attribute in _RECORD_ATTRIBUTES.items():
+            if key in record:
+                setattr(self, attribute, record[key])
+
+    def get_full_record(self):
+        """The cached record in get_patient_full_record()'s shape (for the patient card)."""
+        with self._lock:
+            return {key: getattr(self, attribute) for key, attribute in _RECORD_ATTRIBUTES.items()}
+
+    def get_relevant_history(self, complaint, limit=RELEVANT_VISITS):
+        """
+        Diagnosed past visits most relevant to the complaint (full-text, bm25),
+        memoized per complaint until the visits change.
+        """
+        key = (complaint or "").strip()
+        if not key:
+            return []
+        visits = self._relevant_history.get(key)
+        if visits is None:
+            # The visit opened for this complaint has no diagnosis yet — not history
+            visits = [v for v in get_relevant_history(self.patient_id, [key]) if v['diagnosis']][:limit]
+            self._relevant_history[key] = visits
+        return visits
+
     def check_substance(self, substance_name):
         """
         Instant check — no database query needed.
-        Returns list of alerts (dicts with type, title, message, details).
+        Returns list of alerts (db.records.Alert: type, title, message, details).
         """
         if not substance_name or not substance_name.strip():
             return []
 
         alerts = []
-        substance_lower = substance_name.lower().strip()
-
-        # Check against contraindications (disease-substance interactions)
-        for ci in self.contraindications:
-            ci_substance = ci['contraindicated_substance'].lower()
-            if ci_substance in substance_lower or substance_lower in ci_substance:
-                risk = ci['risk_level']
-                alert_type = 'critical' if risk == 'critical' else ('high' if risk == 'high' else 'moderate')
-                alerts.append({
-                    'type': alert_type,
-                    'title': f"خطر {'حرج' if risk == 'critical' else 'عالي' if risk == 'high' else 'متوسط'}: "
-                             f"تعارض {substance_name} مع {ci['disease_name']}",
-                    'message': ci['reason'],
-                    'details': f"المصدر: {ci.get('source', 'N/A')} | مستوى الخطر: {risk}",
-                    'risk_level': risk
-                })
+        substance_norm = normalize_arabic(substance_name)
+        substance_id = canonical_substance(substance_name)
+
+        # Check against contraindications (disease-substance interactions):
+        # index lookup by canonical substance and its drug classes, substring
+        # scan of this patient's view only for names the indexes do not know
+        kb = self.knowledge_base
+        matches = kb.lookup(substance_name, self.get_disease_names())
+        if not matches:
+            matches = [
+                ci for ci in self.contraindications
+                if normalize_arabic(ci['contraindicated_substance']) in substance_norm
+                or substance_norm in normalize_arabic(ci['contraindicated_substance'])
+            ]
+        for ci in matches:
+            risk = ci['risk_level']
+            alert_type = 'critical' if risk == 'critical' else ('high' if risk == 'high' else 'moderate')
+            details = f"المصدر: {ci.get('source', 'N/A')} | مستوى الخطر: {risk}"
+            if kb.is_member(substance_name, ci['contraindicated_substance']):
+                details += f" | ينتمي إلى فئة: {ci['contraindicated_substance']}"
+            alerts.append(Alert(
+                type=alert_type,
+                title=f"خطر {'حرج' if risk == 'critical' else 'عالي' if risk == 'high' else 'متوسط'}: "
+                      f"تعارض {substance_name} مع {ci['disease_name']}",
+                message=ci['reason'],
+                details=details,
+                risk_level=risk
+            ))
 
         # Check against allergies
         for allergy in self.allergies:
-            allergen_lower = allergy['allergen'].lower()
-            if allergen_lower in substance_lower or substance_lower in allergen_lower:
-                alerts.append({
-                    'type': 'critical',
-                    'title': f"🚨 حساسية مسجلة: {allergy['allergen']}",
-                    'message': f"المريض لديه حساسية من {allergy['allergen']} — "
-                               f"رد فعل سابق: {allergy.get('reaction_type', 'غير محدد')}",
-                    'details': f"شدة الحساسية: {allergy.get('severity', 'غير محدد')}",
-                    'risk_level': 'critical'
-                })
+            allergen = normalize_arabic(allergy['allergen'])
+            in_class = kb.is_member(substance_name, allergen)
+            if (in_class or canonical_substance(allergen) == substance_id
+                    or allergen in substance_norm or substance_norm in allergen):
+                details = f"شدة الحساسية: {allergy.get('severity', 'غير محدد')}"
+                if in_class:
+                    details += f" | {substance_name} من فئة {allergy['allergen']}"
+                alerts.append(Alert(
+                    type='critical',
+                    title=f"🚨 حساسية مسجلة: {allergy['allergen']}",
+                    message=f"المريض لديه حساسية من {allergy['allergen']} — "
+                            f"رد فعل سابق: {allergy.get('reaction_type', 'غير محدد')}",
+                    details=details,
+                    risk_level=RiskLevel.CRITICAL
+                ))
 
         return alerts
 
+    def check_current_medications(self):
+        """Alerts for the patient's own current medications (e.g. a beta-blocker in asthma)."""
+        alerts = {}
+        for medication in self.medications:
+            for alert in self.check_substance(medication['drug_name']):
+                alerts.setdefault(alert['title'], alert)
+        return list(alerts.values())
+
     def check_multiple_substances(self, text):
         """Check a text field for any mentioned substances against the patient's data."""
-        all_alerts = []
-
-        # All known dangerous substances from contraindications
-        known_substances = set()
-        for ci in self.contraindications:
-            known_substances.add(ci['contraindicated_substance'])
-        for al in self.allergies:
-            known_substances.add(al['allergen'])
-
-        # Check each known substance against the text
-        text_lower = text.lower()
-        for substance in known_substances:
-            if substance.lower() in text_lower:
-                alerts = self.check_substance(substance)
-                all_alerts.extend(alerts)
-
-        # Deduplicate
-        seen = set()
-        unique_alerts = []
-        for a in all_alerts:
-            key = a['title']
-            if key not in seen:
-                seen.add(key)
-                unique_alerts.append(a)
-
-        return unique_alerts
-
-    def get_context_for_ai(self):
-        """Compile all cached data into a text context for MedGemma."""
-        parts = []
-
-        # Patient info
-        p = self.patient_info
-        parts.append(f"المريض: {p.get('name', '')} — {p.get('age', '')} سنة — {p.get('gender', '')} — "
-                     f"فصيلة الدم: {p.get('blood_type', '')}")
-
-        # Chronic diseases
-        if self.chronic_diseases:
-            diseases_str = ", ".join([f"{d['disease_name']} ({d.get('severity', '')})" for d in self.chronic_diseases])
-            parts.append(f"الأمراض المزمنة: {diseases_str}")
-
-        # Allergies
-        if self.allergies:
-            allergy_str = ", ".join([f"{a['allergen']} ({a.get('reaction_type', '')})" for a in self.allergies])
-            parts.append(f"الحساسيات: {allergy_str}")
-
-        # Current medications
-        if self.medications:
-            med_str = ", ".join([f"{m['drug_name']} {m.get('dose', '')} {m.get('frequency', '')}" for m in self.medications])
-            parts.append(f"الأدوية الحالية: {med_str}")
-
-        # Surgeries
-        if self.surgeries:
-            surg_str = ", ".join([f"{s['surgery_name']} ({s.get('surgery_date', '')})" for s in self.surgeries])
-            parts.append(f"العمليات السابقة: {surg_str}")
-
-        # Recent visits
-        if self.visits:
-            parts.append("الزيارات الأخيرة:")
-            for v in self.visits[:3]:
-                parts.append(f"  - {v.get('visit_date', '')}: {v.get('reason', '')} → {v.get('diagnosis', '')}")
-
-        # Abnormal labs
-        if self.abnormal_labs:
-            parts.append("تحاليل غير طبيعية:")
-            for lab in self.abnormal_labs:
-                parts.append(f"  - {lab['test_name']}: {lab['result_value']} (الطبيعي: {lab.get('normal_range', '')})")
-
-        # Contraindications
-        if self.contraindications:
-            parts.append("المواد الممنوعة:")
-            for ci in self.contraindications:
-                parts.append(f"  - {ci['contraindicated_substance']} ({ci['risk_level']}): {ci['reason']}")
-
-        # Current vitals if available 
-        if self.current_vitals:
-            parts.append("العلامات الحيوية الحالية:")
-            for k, v in self.current_vitals.items():
-                parts.append(f"  - {k}: {v}")
-
-        return "\n".join(parts)
+        if not text:
+            return []
+        return self._get_substance_matcher().match(text)
+
+    def get_incremental_checker(self, field):
+        """Line-incremental screening state for a live text field (created on first use)."""
+        from ai.incremental_checker import IncrementalChecker
+
+        checker = self._incremental_checkers.get(field)
+        if checker is None:
+            checker = self._incremental_checkers[field] = IncrementalChecker(self.check_multiple_substances)
+        return checker
+
+    def _get_substance_matcher(self):
+        """
+        Automaton over every contraindicated substance and allergen, the drugs
+        in their classes, and all their Arabic/English/brand synonyms (built on
+        first check).
+        """
+        with self._lock:
+            if self._substance_matcher is None:
+                known_substances = [ci['contraindicated_substance'] for ci in self.contraindications]
+                known_substances += [al['allergen'] for al in self.allergies]
+                known_substances += [m for name in known_substances for m in self.knowledge_base.members_of(name)]
+                self._substance_matcher = SubstanceMatcher(
+                    known_substances, self.check_substance,
+                    normalize=normalize_arabic, expand=synonyms_for
+                )
+            return self._substance_matcher
+
+    def get_context_for_ai(self, budget=None):
+        """
+        Compile the cached data into a text context for MedGemma, trimmed to a
+        token budget by clinical priority (see context_builder). The record
+        block is rendered once per budget; vitals and session updates only
+        when they changed.
+        """
+        from ai.context_builder import (
+            build_static_context, render_vitals, render_session_updates, combine_context,
+            CONTEXT_TOKEN_BUDGET
+        )
+
+        budget = budget or CONTEXT_TOKEN_BUDGET
+        with self._lock:
+            static = self._static_context.get(budget)
+            if static is None:
+                static = self._static_context[budget] = build_static_context(self, budget)
+            if self._vitals_dirty:
+                self._vitals_context = render_vitals(self._current_vitals)
+                self._vitals_dirty = False
+            if self._updates_dirty:
+                self._updates_context = render_session_updates(self.session_updates)
+                self._updates_dirty = False
+
+            built = combine_context(static, self._vitals_context, self._updates_context)
+            if built['dropped']:
+                print(f"✂️ Context trimmed to {built['tokens']}/{built['budget']} tokens — dropped: {built['dropped']}")
+            self.last_context_report = built
+            return built['text']
+
+    @property
+    def current_vitals(self):
+        """Vitals entered this visit — assign a new dict (not in-place edits) to update the context."""
+        return self._current_vitals
+
+    @current_vitals.setter
+    def current_vitals(self, vitals):
+        self._current_vitals = vitals
+        self._vitals_dirty = True
 
     def add_session_update(self, field, value):
         """Log a new update in this session."""
@@ -181,6 +300,14 @@ class SessionCache:
             'value': value,
             'timestamp': get_timestamp()
         })
+        self._updates_dirty = True
+
+    def get_priority(self):
+        """Latest triage level recorded by reception (None if not transferred yet)."""
+        for update in reversed(self.session_updates):
+            if update['field'] == 'priority':
+                return update['value']
+        return None
 
     def get_disease_names(self):
         """Get list of disease names for this patient."""
@@ -0,0 +1,161 @@
+"""
+session_registry.py — SessionCache registry for several workstations.
+Caches are keyed by (browser session, patient) so each receptionist/doctor
+works on their own patient, and re-selecting a patient reuses its warm cache.
+Least-recently-used caches are evicted beyond a count and a memory budget.
+A cache's size is measured when it is added and re-measured after each
+SessionCache.refresh() that reloaded tables, never on plain lookups.
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from db.records import Record
+
+# ── Registry Settings ──
+MAX_SESSIONS = int(os.environ.get("MEDGEMMA_MAX_SESSIONS", "64"))
+SESSION_CACHE_MB = float(os.environ.get("MEDGEMMA_SESSION_CACHE_MB", "64"))
+
+# Session id used outside Gradio (scripts, notebook, tests)
+LOCAL_SESSION = "local"
+
+# Per-session data counted against the memory budget; the knowledge base and
+# other shared structures are not owned by a session and are left out.
+_SIZED_ATTRIBUTES = (
+    'patient_info', 'chronic_diseases', 'allergies', 'medications', 'surgeries', 'visits',
+    'lab_results', 'abnormal_labs', 'ai_summary', 'session_updates', 'current_vitals',
+    'current_complaint', 'current_transcript',
+)
+
+
+def session_id(request):
+    """Stable id of the browser session behind a Gradio request."""
+    return getattr(request, "session_hash", None) or LOCAL_SESSION
+
+
+def estimate_nbytes(cache):
+    """Approximate memory held by one SessionCache (its own records and text)."""
+    return sum(_deep_sizeof(getattr(cache, name, None)) for name in _SIZED_ATTRIBUTES)
+
+
+def _deep_sizeof(obj):
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k) + _deep_sizeof(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_deep_sizeof(item) for item in obj)
+    elif isinstance(obj, Record):
+        size += sum(_deep_sizeof(value) for value in obj.values())
+    return size
+
+
+class SessionRegistry:
+    """Thread-safe LRU of SessionCaches keyed by (session id, patient id)."""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, max_mb=SESSION_CACHE_MB):
+        self.max_sessions = max(1, max_sessions)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._caches = OrderedDict()    # (session, patient) → (cache, nbytes)
+        self._active = {}               # session → patient currently selected
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def select(self, session, patient_id, factory):
+        """
+        Make patient_id the session's current patient and return its cache,
+        reusing a warm one or building it with factory(patient_id).
+        """
+        key = (session, patient_id)
+        with self._lock:
+            entry = self._caches.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._active[session] = patient_id
+                self._touch(key)
+                return entry[0]
+
+        # Build outside the lock — loading a patient must not block other sessions
+        cache = factory(patient_id)
+        with self._lock:
+            entry = self._caches.get(key)
+            if entry is not None:
+                cache = entry[0]
+            else:
+                self.misses += 1
+                self._caches[key] = (cache, 0)
+                self._measure(key)
+                cache.on_refresh = partial(self._refreshed, key)
+            self._active[session] = patient_id
+            self._touch(key)
+            self._evict(keep=key)
+            return cache
+
+    def current(self, session):
+        """The session's current patient cache, or None (nothing selected / evicted)."""
+        with self._lock:
+            patient_id = self._active.get(session)
+            if patient_id is None:
+                return None
+            key = (session, patient_id)
+            if key not in self._caches:
+                return None
+            self._touch(key)
+            return self._caches[key][0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._active),
+                'caches': len(self._caches),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _touch(self, key):
+        """Mark as most recently used (O(1))."""
+        self._caches.move_to_end(key)
+
+    def _refreshed(self, key, cache):
+        """SessionCache.on_refresh: re-measure the reloaded cache, then enforce the budget."""
+        with self._lock:
+            entry = self._caches.get(key)
+            if entry is None or entry[0] is not cache:
+                return
+            self._measure(key)
+            self._evict(keep=key)
+
+    def _measure(self, key):
+        """(Re-)measure a cache: on insert and after each refresh() that reloaded tables."""
+        cache, old_bytes = self._caches[key]
+        nbytes = estimate_nbytes(cache)
+        self._caches[key] = (cache, nbytes)
+        self._bytes += nbytes - old_bytes
+
+    def _evict(self, keep):
+        while len(self._caches) > self.max_sessions or self._bytes > self.max_bytes:
+            key = next(iter(self._caches))
+            if key == keep:
+                break
+            _, nbytes = self._caches.pop(key)
+            self._bytes -= nbytes
+            self.evictions += 1
+            session, patient_id = key
+            if self._active.get(session) == patient_id:
+                del self._active[session]
+
+
+_registry = SessionRegistry()
+
+
+def get_session_registry():
+    """The process-wide registry shared by all UI screens."""
+    return _registry
@@ -0,0 +1,190 @@
+"""
+substance_matcher.py — Aho-Corasick automaton for substance screening.
+Compiles every contraindicated substance and allergen into one automaton so a
+free-text field is scanned in a single pass, however many patterns there are,
+and each match maps straight to its precomputed alert records. Latin names
+match whole words only and Arabic ones at a word start, after clitic prefixes
+— "industrial" does not mention dust, nor "reciprocal" Cipro. Words that
+match nothing exactly are looked up in a typo-tolerant index and reported as
+lower-confidence alerts.
+"""
+
+import os
+import re
+from collections import deque
+from dataclasses import replace
+
+from ai.fuzzy_index import SymSpellIndex
+
+# Maximum edit distance for near-matches ("Magnesuim" → Magnesium); 0 disables
+FUZZY_MAX_DISTANCE = int(os.environ.get("MEDGEMMA_FUZZY_DISTANCE", "2"))
+
+# Exact alert level → level shown for a near-match
+_NEAR_MATCH_TYPE = {'critical': 'high', 'high': 'moderate', 'moderate': 'moderate'}
+
+_WORD = re.compile(r"\w+")
+# What may precede an Arabic name inside its word: و/ف, ب/ك/ل and the article ("وبالغبار")
+_ARABIC_CLITICS = re.compile(r"[وف]?[بكل]?(?:ال)?|[وف]?لل")
+
+
+class AhoCorasick:
+    """Multi-pattern exact matcher (pure Python, case-sensitive — lowercase input first)."""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._built = False
+
+    def add(self, pattern, value):
+        """Register a pattern; every match reports (start, end, value)."""
+        if not pattern:
+            return
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(pattern), value))
+        self._built = False
+
+    def build(self):
+        """Compute failure links (breadth-first) and merge outputs along them."""
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        self._built = True
+        return self
+
+    def iter_matches(self, text):
+        """Yield (start, end, value) for every occurrence of every pattern in text."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, value in out[node]:
+                yield i - length + 1, i + 1, value
+
+    def __len__(self):
+        return len(self._goto)
+
+
+class SubstanceMatcher:
+    """
+    Maps free text to alert records in one pass.
+    alerts_for(substance) is evaluated once per known substance at build time;
+    expand(substance) lists the extra spellings (synonyms) that should match it.
+    Patterns and text go through the same normalize function.
+    """
+
+    def __init__(self, substances, alerts_for, normalize=str.lower, expand=None,
+                 fuzzy_distance=FUZZY_MAX_DISTANCE):
+        self._normalize = normalize
+        self._automaton = AhoCorasick()
+        self._fuzzy = SymSpellIndex(fuzzy_distance) if fuzzy_distance > 0 else None
+        self._alerts = {}
+        patterns = set()
+        for substance in substances:
+            key = normalize(substance).strip()
+            if not key or key in self._alerts:
+                continue
+            self._alerts[key] = alerts_for(substance)
+            spellings = [key] + (list(expand(substance)) if expand else [])
+            for pattern in spellings:
+                if pattern and (pattern, key) not in patterns:
+                    patterns.add((pattern, key))
+                    self._automaton.add(pattern, key)
+                    if self._fuzzy is not None:
+                        self._fuzzy.add(pattern, key)
+        self._automaton.build()
+
+    def match(self, text):
+        """
+        Alerts for every known substance mentioned in text (deduplicated, in text
+        order), followed by lower-confidence alerts for near-miss spellings.
+        """
+        if not text:
+            return []
+        normalized = self._normalize(text)
+        alerts = []
+        seen = set()
+        matched = set()
+        covered = []    # spans of the exact matches
+        for start, end, key in self._automaton.iter_matches(normalized):
+            if not _is_word_match(normalized, start, end):
+                continue
+            matched.add(key)
+            covered.append((start, end))
+            for alert in self._alerts[key]:
+                if alert['title'] not in seen:
+                    seen.add(alert['title'])
+                    alerts.append(alert)
+
+        if self._fuzzy is not None:
+            for typed, term, key in self._near_matches(normalized, matched, covered):
+                for alert in self._alerts[key]:
+                    near = _near_match_alert(alert, typed, term)
+                    if near['title'] not in seen:
+                        seen.add(near['title'])
+                        alerts.append(near)
+        return alerts
+
+    def _near_matches(self, normalized, matched, covered):
+        """
+        (typed, term, key) for words and word pairs within edit distance of a term.
+        Words inside an exact match are skipped: "prednisone" is not ≈ prednisolone.
+        """
+        words = [
+            (m.group(), any(start < m.end() and m.start() < end for start, end in covered))
+            for m in _WORD.finditer(normalized)
+        ]
+        queries = [word for word, exact in words if not exact]
+        queries += [f"{a} {b}" for (a, a_exact), (b, b_exact) in zip(words, words[1:]) if not (a_exact or b_exact)]
+        for query in queries:
+            for term, key, distance in self._fuzzy.lookup(query):
+                if distance and key not in matched:
+                    matched.add(key)
+                    yield query, term, key
+                    break
+
+
+def _is_word_match(text, start, end):
+    """
+    Whether text[start:end] is a whole Latin word, or an Arabic word start after
+    clitic prefixes only (Arabic suffixes such as ات/ين are allowed).
+    """
+    word_start = start
+    while word_start and text[word_start - 1].isalpha():
+        word_start -= 1
+    if text[start].isascii():
+        return word_start == start and not (end < len(text) and text[end].isalpha())
+    return _ARABIC_CLITICS.fullmatch(text, word_start, start) is not None
+
+
+def _near_match_alert(alert, typed, term):
+    """Copy of an alert for a probable misspelling, one level lower and marked low confidence."""
+    return replace(
+        alert,
+        type=_NEAR_MATCH_TYPE.get(alert['type'], alert['type']),
+        title=f"❓ تطابق تقريبي «{typed}» ≈ {term} — {alert['title']}",
+        details=f"{alert.get('details', '')} | ثقة منخفضة: تأكد من اسم المادة".strip(" |"),
+        confidence='low'
+    )
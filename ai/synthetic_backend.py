@@ -0,0 +1,101 @@
+"""
+synthetic_backend.py — Latency-modelled stand-in for MedGemma (load testing).
+Streams the mock responses at the pace a real GPU deployment would: a prefill
+cost per prompt token, a decode cost per output token that grows with the
+number of sequences sharing the batch, and a hard limit on concurrent
+sequences beyond which requests wait. Lets workers, queues and timeouts be
+sized on a CPU-only machine.
+"""
+
+import os
+import threading
+import time
+
+from ai.backends import InferenceBackend, with_context
+from ai.batch_scheduler import MAX_BATCH_SIZE
+from ai.context_builder import CHARS_PER_TOKEN, estimate_tokens
+from ai.mock_responses import generate_mock_response, chunk_text
+
+# ── Latency Model Settings ──
+PREFILL_MS_PER_TOKEN = float(os.environ.get("MEDGEMMA_SYNTH_PREFILL_MS", "0.4"))
+DECODE_MS_PER_TOKEN = float(os.environ.get("MEDGEMMA_SYNTH_DECODE_MS", "35"))
+# Extra decode time per additional sequence in the batch (0.05 → +5% each)
+BATCH_PENALTY = float(os.environ.get("MEDGEMMA_SYNTH_BATCH_PENALTY", "0.05"))
+MAX_CONCURRENCY = int(os.environ.get("MEDGEMMA_SYNTH_MAX_BATCH", str(MAX_BATCH_SIZE)))
+
+
+class SyntheticBackend(InferenceBackend):
+    """Mock content, realistic timing."""
+
+    name = "synthetic"
+    model_id = "synthetic"
+    model = "synthetic"
+    tokenizer = "synthetic"
+
+    def __init__(self, prefill_ms=PREFILL_MS_PER_TOKEN, decode_ms=DECODE_MS_PER_TOKEN,
+                 batch_penalty=BATCH_PENALTY, max_concurrency=MAX_CONCURRENCY):
+        self.prefill_ms = prefill_ms
+        self.decode_ms = decode_ms
+        self.batch_penalty = batch_penalty
+        self.max_concurrency = max(1, max_concurrency)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.completed = 0
+        self.tokens_generated = 0
+        print(f"⏱️ Synthetic backend: prefill {prefill_ms}ms/token, decode {decode_ms}ms/token, "
+              f"max {self.max_concurrency} concurrent")
+
+    def stream(self, prompt, system_prompt="", max_tokens=1024, context=""):
+        response = generate_mock_response(with_context(context, prompt), system_prompt)
+        prompt_tokens = estimate_tokens(system_prompt) + estimate_tokens(context) + estimate_tokens(prompt)
+
+        with self._lock:
+            self.waiting += 1
+        self._slots.acquire()
+        with self._lock:
+            self.waiting -= 1
+            self.active += 1
+        try:
+            time.sleep(prompt_tokens * self.prefill_ms / 1000)
+
+            budget = max_tokens
+            for chunk in chunk_text(response):
+                tokens = estimate_tokens(chunk)
+                if tokens > budget:
+                    # Output cut at max_tokens, like a real generate() call
+                    chunk = chunk[:int(budget * CHARS_PER_TOKEN)]
+                    tokens = budget
+                time.sleep(tokens * self.decode_ms * self._batch_factor() / 1000)
+                budget -= tokens
+                with self._lock:
+                    self.tokens_generated += tokens
+                if chunk:
+                    yield chunk
+                if budget <= 0:
+                    break
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+            self._slots.release()
+
+    def cache_params(self):
+        # Never cached: a load test must pay the modelled latency on every request
+        return None
+
+    def stats(self):
+        """Current load on the modelled GPU."""
+        with self._lock:
+            return {
+                'active': self.active,
+                'waiting': self.waiting,
+                'completed': self.completed,
+                'tokens_generated': self.tokens_generated,
+                'max_concurrency': self.max_concurrency,
+            }
+
+    def _batch_factor(self):
+        # Sequences share each forward pass, so per-token time grows with batch size
+        return 1 + self.batch_penalty * max(0, self.active - 1)
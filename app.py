@@ -11,8 +11,9 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import gradio as gr
 from db.init_db import init_database
-from db.seed_data import seed_all
+from db.seed_data import seed_if_empty
 from ai.medgemma_client import load_medgemma
+from ai.knowledge_base import get_knowledge_base
 from ui.components import CUSTOM_CSS, get_gradio_theme
 from ui.reception_ui import create_reception_ui
 from ui.emergency_ui import create_emergency_ui
@@ -30,7 +31,8 @@ def main():
     # ── Step 1: Initialize Database ──
     print("\n📦 Step 1: Initializing database...")
     init_database()
-    seed_all()
+    seed_if_empty()
+    get_knowledge_base()
 
     # ── Step 2: Load AI Model ──
     print("\n🧠 Step 2: Loading MedGemma...")
@@ -0,0 +1,258 @@
+"""
+importer.py — Streaming bulk import of patients from CSV or JSONL files.
+Records are read one at a time (the file is never loaded whole), validated,
+and written in chunks: one transaction per chunk with one executemany per
+table, and the file's checkpoint updated in that same transaction — an
+interrupted import resumes after its last committed chunk. Patients whose
+national_id is already in the database (or earlier in the file) are skipped.
+
+    python -m db.importer patients.jsonl [--chunk-size 5000] [--restart]
+
+JSONL: one object per line with add_new_patient's fields —
+    {"national_id", "name", "age", "gender", "blood_type", "phone", "emergency_contact",
+     "diseases": [{"name", "severity"}], "allergies": [{"allergen", "reaction", "severity"}],
+     "medications": [{"name", "dose", "frequency", "reason"}]}
+CSV: a header row with the same columns; diseases/allergies/medications hold
+a JSON list or names separated by ';'.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from db.init_db import get_connection
+from db.queries import (
+    INSERT_PATIENT, INSERT_DISEASE, INSERT_ALLERGY, INSERT_MEDICATION,
+    patient_row, disease_rows, allergy_rows, medication_rows
+)
+
+# ── Import Settings ──
+CHUNK_SIZE = int(os.environ.get("MEDGEMMA_IMPORT_CHUNK", "5000"))
+MAX_REPORTED_ERRORS = 20
+
+BLOOD_TYPES = {"A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"}
+# List column → the key holding each item's name
+LIST_FIELDS = (('diseases', 'name'), ('allergies', 'allergen'), ('medications', 'name'))
+
+
+def read_records(path):
+    """Yield raw records: dicts for CSV, unparsed lines for JSONL (parsed in validate_record)."""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+def validate_record(raw):
+    """
+    Raw record → (patient fields in patient_row order, diseases, allergies, medications).
+    Raises ValueError for a record that cannot be imported.
+    """
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+        if not isinstance(raw, dict):
+            raise ValueError("not a JSON object")
+
+    national_id = _text(raw.get('national_id'), 'national_id')
+    name = _text(raw.get('name'), 'name')
+    if not national_id:
+        raise ValueError("missing national_id")
+    if not name:
+        raise ValueError("missing name")
+
+    age = raw.get('age')
+    try:
+        age = int(age) if age not in (None, "") else 0
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid age: {age!r}")
+    if not 0 <= age <= 150:
+        raise ValueError(f"invalid age: {age}")
+
+    blood_type = _text(raw.get('blood_type'), 'blood_type').upper()
+    if blood_type and blood_type not in BLOOD_TYPES:
+        raise ValueError(f"invalid blood_type: {blood_type!r}")
+
+    fields = (
+        national_id, name, age, _text(raw.get('gender'), 'gender') or 'غير محدد', blood_type,
+        _text(raw.get('phone'), 'phone'), _text(raw.get('emergency_contact'), 'emergency_contact')
+    )
+    lists = tuple(_parse_list(raw.get(column), key, column) for column, key in LIST_FIELDS)
+    return (fields,) + lists
+
+
+def _text(value, field=""):
+    """A scalar as stripped text; nested objects/lists are rejected (sqlite cannot bind them)."""
+    if value is None:
+        return ""
+    if not isinstance(value, (str, int, float)):
+        raise ValueError(f"{field or 'value'}: expected text, got {type(value).__name__}")
+    return str(value).strip()
+
+
+def _parse_list(value, key, column):
+    """A list column as dicts: JSON list (of dicts or names) or ';'-separated names."""
+    if value in (None, ""):
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        value = json.loads(value) if value.startswith("[") else value.split(";")
+    if not isinstance(value, list):
+        raise ValueError(f"{column}: expected a list")
+    items = []
+    for item in value:
+        if isinstance(item, str):
+            item = {key: item}
+        if not isinstance(item, dict):
+            raise ValueError(f"{column}: invalid item {item!r}")
+        item = {field: _text(text, f"{column}.{field}") for field, text in item.items()}
+        if item.get(key):
+            items.append(item)
+    return items
+
+
+def get_checkpoint(source, conn=None):
+    """Records of source already committed (0 if never imported)."""
+    own = conn is None
+    conn = conn or get_connection()
+    try:
+        row = conn.execute("SELECT records_done FROM import_checkpoints WHERE source = ?", (source,)).fetchone()
+    finally:
+        if own:
+            conn.close()
+    return row[0] if row else 0
+
+
+def import_file(path, chunk_size=CHUNK_SIZE, restart=False):
+    """Import a CSV/JSONL file of patients; returns the import statistics."""
+    from db.migrations import migrate
+
+    migrate()
+    source = os.path.abspath(path)
+    conn = get_connection()
+    stats = {'records': 0, 'resumed': 0, 'imported': 0, 'duplicates': 0, 'invalid': 0, 'rows': 0}
+    started = time.perf_counter()
+    try:
+        done = 0 if restart else get_checkpoint(source, conn)
+        known = {row[0] for row in conn.execute("SELECT national_id FROM patients WHERE national_id IS NOT NULL")}
+        if done:
+            print(f"⏩ Resuming {path} after record {done:,}")
+
+        pending = []
+        committed = done
+        for number, raw in enumerate(read_records(path), 1):
+            stats['records'] = number
+            if number <= done:
+                stats['resumed'] += 1
+                continue
+            try:
+                record = validate_record(raw)
+            except ValueError as e:
+                stats['invalid'] += 1
+                if stats['invalid'] <= MAX_REPORTED_ERRORS:
+                    print(f"⚠️ Record {number} skipped: {e}")
+            else:
+                national_id = record[0][0]
+                if national_id in known:
+                    stats['duplicates'] += 1
+                else:
+                    known.add(national_id)
+                    pending.append(record)
+
+            if number - committed >= chunk_size:
+                _write_chunk(conn, source, pending, number, stats)
+                committed, pending = number, []
+                _report(stats, started)
+
+        if stats['records'] > committed:
+            _write_chunk(conn, source, pending, stats['records'], stats)
+        conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"✅ Import finished: {stats['imported']:,} patients ({stats['rows']:,} rows) in {elapsed:.1f}s "
+          f"— {stats['rows'] / elapsed:,.0f} rows/s | {stats['duplicates']:,} duplicates, "
+          f"{stats['invalid']:,} invalid, {stats['resumed']:,} already imported")
+    return stats
+
+
+def _write_chunk(conn, source, records, records_done, stats):
+    """
+    Insert one chunk and move the checkpoint, in one transaction. If the batch
+    violates a constraint (e.g. a national_id inserted meanwhile by the app),
+    the chunk is redone record by record and only the offending records skipped.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        try:
+            rows = _insert_records(conn, records)
+            imported = len(records)
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            conn.execute("BEGIN IMMEDIATE")
+            rows = imported = 0
+            for record in records:
+                conn.execute("SAVEPOINT import_record")
+                try:
+                    rows += _insert_records(conn, [record])
+                    imported += 1
+                except sqlite3.IntegrityError as e:
+                    conn.execute("ROLLBACK TO import_record")
+                    stats['duplicates' if 'national_id' in str(e) else 'invalid'] += 1
+                    print(f"⚠️ Patient {record[0][0]} skipped: {e}")
+                conn.execute("RELEASE import_record")
+        conn.execute("""
+            INSERT INTO import_checkpoints (source, records_done, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (source) DO UPDATE SET records_done = excluded.records_done, updated_at = excluded.updated_at
+        """, (source, records_done, datetime.now().isoformat(timespec='seconds')))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    stats['imported'] += imported
+    stats['rows'] += rows
+
+
+def _insert_records(conn, records):
+    """executemany the records' rows into every table; returns the number of rows."""
+    # Ids are assigned here (under the write lock) so child rows need no lastrowid
+    patient_id = conn.execute("""
+        SELECT MAX(COALESCE((SELECT MAX(patient_id) FROM patients), 0),
+                   COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'patients'), 0)) + 1
+    """).fetchone()[0]
+    patients, diseases, allergies, medications = [], [], [], []
+    for fields, record_diseases, record_allergies, record_medications in records:
+        patients.append(patient_row(patient_id, *fields))
+        diseases += disease_rows(patient_id, record_diseases)
+        allergies += allergy_rows(patient_id, record_allergies)
+        medications += medication_rows(patient_id, record_medications)
+        patient_id += 1
+
+    conn.executemany(INSERT_PATIENT, patients)
+    conn.executemany(INSERT_DISEASE, diseases)
+    conn.executemany(INSERT_ALLERGY, allergies)
+    conn.executemany(INSERT_MEDICATION, medications)
+    return len(patients) + len(diseases) + len(allergies) + len(medications)
+
+
+def _report(stats, started):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"📥 {stats['records']:,} records read — {stats['imported']:,} imported — "
+          f"{stats['rows'] / elapsed:,.0f} rows/s ({stats['records'] / elapsed:,.0f} records/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import patients from a CSV or JSONL file.")
+    parser.add_argument("path")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    args = parser.parse_args()
+    import_file(args.path, chunk_size=args.chunk_size, restart=args.restart)
@@ -1,134 +1,131 @@
 """
-init_db.py — Database schema for Gemma-Health Sentinel
-Creates SQLite database with 8 tables for the hospital system.
+init_db.py — Database setup for Gemma-Health Sentinel
+Creates/upgrades the SQLite database through versioned migrations (db/migrations.py).
+Connections come from a small pool of pre-configured connections (WAL,
+tuned pragmas); conn.close() returns a connection to the pool.
 """
 
+import atexit
 import sqlite3
 import os
+import threading
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "hospital.db")
 
-
-def get_connection():
-    """Get a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_PATH)
+# ── Connection Settings (per deployment) ──
+POOL_SIZE = int(os.environ.get("MEDGEMMA_DB_POOL_SIZE", "8"))
+JOURNAL_MODE = os.environ.get("MEDGEMMA_DB_JOURNAL_MODE", "WAL")
+SYNCHRONOUS = os.environ.get("MEDGEMMA_DB_SYNCHRONOUS", "NORMAL")
+CACHE_SIZE_KB = int(os.environ.get("MEDGEMMA_DB_CACHE_KB", "16384"))
+MMAP_SIZE_MB = int(os.environ.get("MEDGEMMA_DB_MMAP_MB", "64"))
+BUSY_TIMEOUT_MS = int(os.environ.get("MEDGEMMA_DB_BUSY_TIMEOUT_MS", "5000"))
+STATEMENT_CACHE = int(os.environ.get("MEDGEMMA_DB_STATEMENT_CACHE", "512"))
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to the pool that opened it."""
+    owner = None
+    released = False
+
+    def close(self):
+        # A second close() must not put the same connection in the pool twice
+        if self.released:
+            return
+        self.released = True
+        self.owner.release(self)
+
+    def close_for_real(self):
+        super().close()
+
+
+class ConnectionPool:
+    """Idle connections reused LIFO; at most max_idle are kept, extra ones are closed."""
+
+    def __init__(self, path=DB_PATH, max_idle=POOL_SIZE):
+        self.path = path
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.opened = 0
+
+    def acquire(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self.opened += 1
+        if conn is None:
+            conn = _open(self.path)
+            conn.owner = self
+        conn.released = False
+        return conn
+
+    def release(self, conn):
+        # Never hand out a connection in the middle of someone else's transaction
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = sqlite3.Row
+        with self._lock:
+            if not self._closed and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close_for_real()
+
+    def close(self):
+        """Close every idle connection (the last close also checkpoints the WAL)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._closed = True
+        for conn in idle:
+            conn.close_for_real()
+
+    def stats(self):
+        with self._lock:
+            return {'idle': len(self._idle), 'opened': self.opened, 'max_idle': self.max_idle}
+
+
+def _open(path):
+    conn = sqlite3.connect(
+        path, factory=PooledConnection, check_same_thread=False,
+        timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=STATEMENT_CACHE
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE_MB * 1024 * 1024}")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
     conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
 
+_pool = ConnectionPool()
+
+
+def get_connection():
+    """Get a connection to the SQLite database (from the pool; close() returns it)."""
+    return _pool.acquire()
+
+
+def get_pool_stats():
+    return _pool.stats()
+
+
+def close_pool():
+    """Close pooled connections — on shutdown, or before replacing the database file."""
+    global _pool
+    _pool.close()
+    _pool = ConnectionPool()
+
+
+atexit.register(lambda: _pool.close())
+
+
 def init_database():
-    """Create all tables in the database."""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # ── جدول المرضى ──
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS patients (
-            patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            national_id TEXT UNIQUE,
-            name TEXT NOT NULL,
-            age INTEGER,
-            gender TEXT,
-            blood_type TEXT,
-            phone TEXT,
-            emergency_contact TEXT
-        )
-    """)
-
-    # ── جدول الأمراض المزمنة ──
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS chronic_diseases (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER NOT NULL,
-            disease_name TEXT NOT NULL,
-            diagnosed_date TEXT,
-            severity TEXT,
-            notes TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
-        )
-    """)
-
-    # ── جدول الحساسيات ──
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS allergies (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER NOT NULL,
-            allergen TEXT NOT NULL,
-            reaction_type TEXT,
-            severity TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
-        )
-    """)
-
-    # ── جدول الأدوية الحالية ──
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS current_medications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER NOT NULL,
-            drug_name TEXT NOT NULL,
-            dose TEXT,
-            frequency TEXT,
-            reason TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
-        )
-    """)
-
-    # ── جدول العمليات السابقة ──
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS surgeries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER NOT NULL,
-            surgery_name TEXT NOT NULL,
-            surgery_date TEXT,
-            notes TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
-        )
-    """)
-
-    # ── جدول الزيارات السابقة ──
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS visits (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER NOT NULL,
-            visit_date TEXT,
-            department TEXT,
-            reason TEXT,
-            diagnosis TEXT,
-            treatment TEXT,
-            doctor_notes TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
-        )
-    """)
-
-    # ── جدول التحاليل ──
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS lab_results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER NOT NULL,
-            test_name TEXT NOT NULL,
-            result_value TEXT,
-            normal_range TEXT,
-            test_date TEXT,
-            is_abnormal BOOLEAN DEFAULT 0,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
-        )
-    """)
-
-    # ── جدول موانع الأدوية والتفاعلات ──
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS contraindications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            disease_name TEXT NOT NULL,
-            contraindicated_substance TEXT NOT NULL,
-            risk_level TEXT NOT NULL,
-            reason TEXT,
-            source TEXT
-        )
-    """)
-
-    conn.commit()
-    conn.close()
+    """Create or upgrade the schema (see db/migrations.py)."""
+    from db.migrations import migrate
+
+    migrate()
     print("✅ Database initialized successfully at:", DB_PATH)
 
 
@@ -0,0 +1,282 @@
+"""
+migrations.py — Versioned schema migrations for hospital.db.
+Each migration runs once, in order, inside its own write transaction, and is
+recorded in the schema_version table. Databases created before versioning
+(tables made with CREATE ... IF NOT EXISTS) simply re-run the idempotent early
+steps. Add a migration by appending to MIGRATIONS — never edit an applied one.
+"""
+
+from datetime import datetime
+
+from db.init_db import get_connection
+
+# Patient tables whose changes bump patient_versions (see SessionCache.refresh)
+VERSIONED_TABLES = (
+    'patients', 'chronic_diseases', 'allergies', 'current_medications',
+    'surgeries', 'visits', 'lab_results',
+)
+
+
+def _baseline(cursor):
+    """The original eight tables."""
+    # ── جدول المرضى ──
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS patients (
+            patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            national_id TEXT UNIQUE,
+            name TEXT NOT NULL,
+            age INTEGER,
+            gender TEXT,
+            blood_type TEXT,
+            phone TEXT,
+            emergency_contact TEXT
+        )
+    """)
+
+    # ── جدول الأمراض المزمنة ──
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chronic_diseases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL,
+            disease_name TEXT NOT NULL,
+            diagnosed_date TEXT,
+            severity TEXT,
+            notes TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+        )
+    """)
+
+    # ── جدول الحساسيات ──
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS allergies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL,
+            allergen TEXT NOT NULL,
+            reaction_type TEXT,
+            severity TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+        )
+    """)
+
+    # ── جدول الأدوية الحالية ──
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS current_medications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL,
+            drug_name TEXT NOT NULL,
+            dose TEXT,
+            frequency TEXT,
+            reason TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+        )
+    """)
+
+    # ── جدول العمليات السابقة ──
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS surgeries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL,
+            surgery_name TEXT NOT NULL,
+            surgery_date TEXT,
+            notes TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+        )
+    """)
+
+    # ── جدول الزيارات السابقة ──
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS visits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL,
+            visit_date TEXT,
+            department TEXT,
+            reason TEXT,
+            diagnosis TEXT,
+            treatment TEXT,
+            doctor_notes TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+        )
+    """)
+
+    # ── جدول التحاليل ──
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lab_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL,
+            test_name TEXT NOT NULL,
+            result_value TEXT,
+            normal_range TEXT,
+            test_date TEXT,
+            is_abnormal BOOLEAN DEFAULT 0,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+        )
+    """)
+
+    # ── جدول موانع الأدوية والتفاعلات ──
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS contraindications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            disease_name TEXT NOT NULL,
+            contraindicated_substance TEXT NOT NULL,
+            risk_level TEXT NOT NULL,
+            reason TEXT,
+            source TEXT
+        )
+    """)
+
+
+def _patient_versions(cursor):
+    """Per-(patient, table) change counters, bumped by triggers on every write."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS patient_versions (
+            patient_id INTEGER NOT NULL,
+            table_name TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (patient_id, table_name)
+        )
+    """)
+
+    bump = """
+        INSERT INTO patient_versions (patient_id, table_name, version) VALUES ({row}.patient_id, '{table}', 1)
+        ON CONFLICT (patient_id, table_name) DO UPDATE SET version = version + 1;"""
+    for table in VERSIONED_TABLES:
+        for event, rows in (('INSERT', ('NEW',)), ('UPDATE', ('OLD', 'NEW')), ('DELETE', ('OLD',))):
+            body = "".join(bump.format(row=row, table=table) for row in rows)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN{body}
+                END
+            """)
+
+
+def _drug_classes(cursor):
+    """Drug → class links for class-level contraindications."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS drug_classes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            member_name TEXT NOT NULL,
+            class_name TEXT NOT NULL
+        )
+    """)
+
+
+def _indexes(cursor):
+    """Indexes for every per-patient lookup and for contraindications by disease."""
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS idx_chronic_diseases_patient ON chronic_diseases (patient_id)",
+        "CREATE INDEX IF NOT EXISTS idx_allergies_patient ON allergies (patient_id)",
+        "CREATE INDEX IF NOT EXISTS idx_current_medications_patient ON current_medications (patient_id)",
+        "CREATE INDEX IF NOT EXISTS idx_surgeries_patient ON surgeries (patient_id)",
+        "CREATE INDEX IF NOT EXISTS idx_visits_patient_date ON visits (patient_id, visit_date DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_lab_results_patient_date ON lab_results (patient_id, test_date DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_lab_results_patient_abnormal "
+        "ON lab_results (patient_id, is_abnormal, test_date DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_contraindications_disease ON contraindications (disease_name, risk_level)",
+    ):
+        cursor.execute(statement)
+
+
+def _visits_fts(cursor):
+    """
+    Full-text index over visit text, stored normalized (normalize_search_text)
+    so Arabic spelling variants and the definite article do not matter; rowid =
+    visits.id. The triggers are plain SQL, so any SQLite client can write visits:
+    they queue inserted/updated visits in visits_fts_pending, which
+    db.queries.sync_visits_fts indexes in Python. Existing visits are queued too.
+    """
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS visits_fts USING fts5 (
+            patient_id UNINDEXED, reason, diagnosis, treatment, doctor_notes,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS visits_fts_pending (
+            visit_id INTEGER PRIMARY KEY
+        )
+    """)
+    enqueue = """
+        INSERT OR IGNORE INTO visits_fts_pending (visit_id) VALUES (NEW.id);"""
+    unindex = """
+        DELETE FROM visits_fts WHERE rowid = OLD.id;"""
+    dequeue = """
+        DELETE FROM visits_fts_pending WHERE visit_id = OLD.id;"""
+    for event, body in (('INSERT', enqueue), ('UPDATE', unindex + enqueue), ('DELETE', unindex + dequeue)):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS visits_fts_queue_{event.lower()}
+            AFTER {event} ON visits
+            BEGIN{body}
+            END
+        """)
+    cursor.execute("DELETE FROM visits_fts")
+    cursor.execute("INSERT OR IGNORE INTO visits_fts_pending (visit_id) SELECT id FROM visits")
+
+
+def _import_checkpoints(cursor):
+    """Committed progress of bulk imports (see db/importer.py), one row per source file."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            source TEXT PRIMARY KEY,
+            records_done INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+
+
+# (version, description, step) — applied in order
+MIGRATIONS = (
+    (1, "baseline tables", _baseline),
+    (2, "patient_versions + triggers", _patient_versions),
+    (3, "drug_classes", _drug_classes),
+    (4, "patient_id / contraindication indexes", _indexes),
+    (5, "visits_fts full-text index", _visits_fts),
+    (6, "import_checkpoints", _import_checkpoints),
+)
+
+
+def current_version(conn):
+    """Highest applied migration (0 for a new or pre-versioning database)."""
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(target=None):
+    """Apply pending migrations up to target (default: all); returns the versions applied."""
+    conn = get_connection()
+    applied = []
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            )
+        """)
+        conn.commit()
+        for version, description, step in MIGRATIONS:
+            if target is not None and version > target:
+                break
+            # IMMEDIATE: take the write lock before re-checking, so two processes
+            # starting together do not both apply the same migration
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if version <= current_version(conn):
+                    conn.rollback()
+                    continue
+                step(conn.cursor())
+                conn.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now().isoformat(timespec='seconds'))
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(version)
+            print(f"🗄️ Migration {version} applied: {description}")
+        if applied:
+            conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+    return applied
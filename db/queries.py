@@ -1,9 +1,23 @@
 """
 queries.py — Database query functions for Gemma-Health Sentinel.
-All queries return dictionaries for easy consumption.
+Patient data and contraindications come back as read-only records (db.records)
+built straight from the rows; other queries return dictionaries.
 """
 
+import re
+
 from db.init_db import get_connection
+from db.records import (
+    Patient, ChronicDisease, Allergy, Medication, Surgery, Visit, LabResult, Contraindication,
+    DrugClassLink
+)
+from utils.helpers import normalize_search_text
+
+# bm25 column weights for visits_fts (patient_id, reason, diagnosis, treatment, doctor_notes)
+RELEVANCE_WEIGHTS = "0, 2.0, 2.0, 1.0, 1.0"
+_SEARCH_TERM = re.compile(r"\w+")
+# Normalized prepositions that would match almost every visit
+_SEARCH_STOPWORDS = {'في', 'من', 'علي', 'الي', 'عن', 'مع', 'منذ'}
 
 
 def _rows_to_dicts(rows):
@@ -11,71 +25,78 @@ def _rows_to_dicts(rows):
     return [dict(row) for row in rows]
 
 
-def get_patient_info(patient_id):
-    """Get basic patient information."""
+def _fetch_records(record_type, where, params=()):
+    """Run SELECT <record columns> FROM ... <where> and build records directly from the rows."""
     conn = get_connection()
-    row = conn.execute("SELECT * FROM patients WHERE patient_id = ?", (patient_id,)).fetchone()
+    cursor = conn.cursor()
+    cursor.row_factory = record_type.from_row
+    rows = cursor.execute(f"SELECT {record_type.columns()} FROM {where}", params).fetchall()
     conn.close()
-    return dict(row) if row else None
+    return rows
+
+
+def get_patient_info(patient_id):
+    """Get basic patient information."""
+    rows = _fetch_records(Patient, "patients WHERE patient_id = ?", (patient_id,))
+    return rows[0] if rows else None
 
 
 def get_chronic_diseases(patient_id):
     """Get patient's chronic diseases."""
-    conn = get_connection()
-    rows = conn.execute("SELECT * FROM chronic_diseases WHERE patient_id = ?", (patient_id,)).fetchall()
-    conn.close()
-    return _rows_to_dicts(rows)
+    return _fetch_records(ChronicDisease, "chronic_diseases WHERE patient_id = ?", (patient_id,))
 
 
 def get_allergies(patient_id):
     """Get patient's allergies."""
-    conn = get_connection()
-    rows = conn.execute("SELECT * FROM allergies WHERE patient_id = ?", (patient_id,)).fetchall()
-    conn.close()
-    return _rows_to_dicts(rows)
+    return _fetch_records(Allergy, "allergies WHERE patient_id = ?", (patient_id,))
 
 
 def get_medications(patient_id):
     """Get patient's current medications."""
-    conn = get_connection()
-    rows = conn.execute("SELECT * FROM current_medications WHERE patient_id = ?", (patient_id,)).fetchall()
-    conn.close()
-    return _rows_to_dicts(rows)
+    return _fetch_records(Medication, "current_medications WHERE patient_id = ?", (patient_id,))
 
 
 def get_surgeries(patient_id):
     """Get patient's surgical history."""
-    conn = get_connection()
-    rows = conn.execute("SELECT * FROM surgeries WHERE patient_id = ?", (patient_id,)).fetchall()
-    conn.close()
-    return _rows_to_dicts(rows)
+    return _fetch_records(Surgery, "surgeries WHERE patient_id = ?", (patient_id,))
 
 
 def get_visits(patient_id):
     """Get patient's visit history."""
-    conn = get_connection()
-    rows = conn.execute("SELECT * FROM visits WHERE patient_id = ? ORDER BY visit_date DESC", (patient_id,)).fetchall()
-    conn.close()
-    return _rows_to_dicts(rows)
+    return _fetch_records(Visit, "visits WHERE patient_id = ? ORDER BY visit_date DESC", (patient_id,))
 
 
 def get_lab_results(patient_id):
     """Get patient's lab results."""
-    conn = get_connection()
-    rows = conn.execute("SELECT * FROM lab_results WHERE patient_id = ? ORDER BY test_date DESC", (patient_id,)).fetchall()
-    conn.close()
-    return _rows_to_dicts(rows)
+    return _fetch_records(LabResult, "lab_results WHERE patient_id = ? ORDER BY test_date DESC", (patient_id,))
 
 
 def get_abnormal_labs(patient_id):
     """Get only abnormal lab results."""
+    return _fetch_records(
+        LabResult, "lab_results WHERE patient_id = ? AND is_abnormal = 1 ORDER BY test_date DESC",
+        (patient_id,)
+    )
+
+
+def get_contraindication_table():
+    """The whole contraindications table (loaded once into the knowledge base)."""
+    return _fetch_records(Contraindication, "contraindications ORDER BY id")
+
+
+def get_drug_class_table():
+    """All drug → class links (loaded once into the knowledge base)."""
+    return _fetch_records(DrugClassLink, "drug_classes ORDER BY id")
+
+
+def get_patient_versions(patient_id):
+    """Change counters per table for a patient ({table_name: version}; missing = 0)."""
     conn = get_connection()
     rows = conn.execute(
-        "SELECT * FROM lab_results WHERE patient_id = ? AND is_abnormal = 1 ORDER BY test_date DESC",
-        (patient_id,)
+        "SELECT table_name, version FROM patient_versions WHERE patient_id = ?", (patient_id,)
     ).fetchall()
     conn.close()
-    return _rows_to_dicts(rows)
+    return {row['table_name']: row['version'] for row in rows}
 
 
 def get_all_contraindications(disease_names):
@@ -83,13 +104,11 @@ def get_all_contraindications(disease_names):
     if not disease_names:
         return []
     placeholders = ','.join('?' * len(disease_names))
-    conn = get_connection()
-    rows = conn.execute(
-        f"SELECT * FROM contraindications WHERE disease_name IN ({placeholders}) ORDER BY risk_level",
+    return _fetch_records(
+        Contraindication,
+        f"contraindications WHERE disease_name IN ({placeholders}) ORDER BY risk_level",
         disease_names
-    ).fetchall()
-    conn.close()
-    return _rows_to_dicts(rows)
+    )
 
 
 def search_contraindications(patient_diseases, substance):
@@ -97,9 +116,9 @@ def search_contraindications(patient_diseases, substance):
     if not patient_diseases:
         return []
     placeholders = ','.join('?' * len(patient_diseases))
-    conn = get_connection()
-    rows = conn.execute(
-        f"""SELECT * FROM contraindications 
+    return _fetch_records(
+        Contraindication,
+        f"""contraindications
             WHERE disease_name IN ({placeholders}) 
             AND LOWER(contraindicated_substance) LIKE LOWER(?)
             ORDER BY 
@@ -109,40 +128,117 @@ def search_contraindications(patient_diseases, substance):
                     WHEN 'moderate' THEN 3 
                 END""",
         patient_diseases + ['%' + substance + '%']
-    ).fetchall()
-    conn.close()
-    return _rows_to_dicts(rows)
+    )
 
 
-def get_relevant_history(patient_id, complaint_keywords):
-    """Search visits by keyword relevance to the current complaint."""
-    if not complaint_keywords:
+def get_relevant_history(patient_id, complaint_keywords, limit=None):
+    """
+    Search visits by keyword relevance to the current complaint: full-text
+    match on visits_fts (normalized, any keyword, word prefixes), best bm25 first.
+    """
+    match = _fts_query(complaint_keywords)
+    if not match:
         return get_visits(patient_id)
+    sync_visits_fts()
+    where = (
+        f"(SELECT rowid AS visit_id, bm25(visits_fts, {RELEVANCE_WEIGHTS}) AS rank FROM visits_fts "
+        "WHERE visits_fts MATCH ? AND patient_id = ?) AS hits "
+        "JOIN visits ON visits.id = hits.visit_id ORDER BY hits.rank, visits.visit_date DESC"
+    )
+    params = [match, patient_id]
+    if limit:
+        where += " LIMIT ?"
+        params.append(limit)
+    return _fetch_records(Visit, where, params)
+
+
+def sync_visits_fts(conn=None):
+    """
+    Index the visits queued in visits_fts_pending by the triggers (any writer,
+    the sqlite3 CLI included), normalized with normalize_search_text.
+    Returns the number of visits indexed; a no-op read when nothing is queued.
+    """
+    own = conn is None
+    conn = conn or get_connection()
+    try:
+        if not conn.execute("SELECT EXISTS (SELECT 1 FROM visits_fts_pending)").fetchone()[0]:
+            return 0
+        if own:
+            conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute("""
+            SELECT visits.id, visits.patient_id, visits.reason, visits.diagnosis, visits.treatment, visits.doctor_notes
+            FROM visits_fts_pending JOIN visits ON visits.id = visits_fts_pending.visit_id
+        """).fetchall()
+        conn.executemany("DELETE FROM visits_fts WHERE rowid = ?", [(row[0],) for row in rows])
+        conn.executemany(
+            "INSERT INTO visits_fts (rowid, patient_id, reason, diagnosis, treatment, doctor_notes) VALUES (?, ?, ?, ?, ?, ?)",
+            [(row[0], row[1]) + tuple(normalize_search_text(value) for value in row[2:]) for row in rows]
+        )
+        conn.execute("DELETE FROM visits_fts_pending")
+        if own:
+            conn.commit()
+        return len(rows)
+    finally:
+        if own:
+            conn.close()
+
+
+def _fts_query(keywords):
+    """FTS5 MATCH expression: every normalized term as a quoted prefix, OR-ed."""
+    terms = []
+    for keyword in keywords or ():
+        for term in _SEARCH_TERM.findall(normalize_search_text(keyword)):
+            if len(term) > 1 and term not in _SEARCH_STOPWORDS and term not in terms:
+                terms.append(term)
+    return " OR ".join(f'"{term}"*' for term in terms)
+
+
+# Per-patient tables in a full record: (versioned table, record key, record type, FROM/WHERE clause)
+PATIENT_RECORD_TABLES = (
+    ('patients', 'patient', Patient, "patients WHERE patient_id = ?"),
+    ('chronic_diseases', 'chronic_diseases', ChronicDisease, "chronic_diseases WHERE patient_id = ?"),
+    ('allergies', 'allergies', Allergy, "allergies WHERE patient_id = ?"),
+    ('current_medications', 'medications', Medication, "current_medications WHERE patient_id = ?"),
+    ('surgeries', 'surgeries', Surgery, "surgeries WHERE patient_id = ?"),
+    ('visits', 'visits', Visit, "visits WHERE patient_id = ? ORDER BY visit_date DESC"),
+    ('lab_results', 'lab_results', LabResult, "lab_results WHERE patient_id = ? ORDER BY test_date DESC"),
+)
+
+
+def load_patient_record(patient_id, tables=None):
+    """
+    Load a patient's tables (all, or only the named ones) over one connection
+    in one read transaction, so they form a consistent snapshot together with
+    the returned 'versions'. abnormal_labs is derived from lab_results in memory.
+    """
     conn = get_connection()
-    conditions = " OR ".join(["reason LIKE ? OR diagnosis LIKE ? OR treatment LIKE ?"] * len(complaint_keywords))
-    params = []
-    for kw in complaint_keywords:
-        params.extend([f'%{kw}%', f'%{kw}%', f'%{kw}%'])
-    rows = conn.execute(
-        f"SELECT * FROM visits WHERE patient_id = ? AND ({conditions}) ORDER BY visit_date DESC",
-        [patient_id] + params
-    ).fetchall()
-    conn.close()
-    return _rows_to_dicts(rows)
+    try:
+        conn.execute("BEGIN")
+        record = {}
+        for table, key, record_type, where in PATIENT_RECORD_TABLES:
+            if tables is not None and table not in tables:
+                continue
+            cursor = conn.cursor()
+            cursor.row_factory = record_type.from_row
+            record[key] = cursor.execute(f"SELECT {record_type.columns()} FROM {where}", (patient_id,)).fetchall()
+        rows = conn.execute(
+            "SELECT table_name, version FROM patient_versions WHERE patient_id = ?", (patient_id,)
+        ).fetchall()
+        conn.commit()
+    finally:
+        conn.close()
+
+    record['versions'] = {row['table_name']: row['version'] for row in rows}
+    if 'patient' in record:
+        record['patient'] = record['patient'][0] if record['patient'] else None
+    if 'lab_results' in record:
+        record['abnormal_labs'] = [lab for lab in record['lab_results'] if lab['is_abnormal']]
+    return record
 
 
 def get_patient_full_record(patient_id):
-    """Get the complete medical record for a patient (all tables)."""
-    return {
-        'patient': get_patient_info(patient_id),
-        'chronic_diseases': get_chronic_diseases(patient_id),
-        'allergies': get_allergies(patient_id),
-        'medications': get_medications(patient_id),
-        'surgeries': get_surgeries(patient_id),
-        'visits': get_visits(patient_id),
-        'lab_results': get_lab_results(patient_id),
-        'abnormal_labs': get_abnormal_labs(patient_id),
-    }
+    """Get the complete medical record for a patient (all tables, one round trip)."""
+    return load_patient_record(patient_id)
 
 
 def get_all_patients_summary():
@@ -153,39 +249,51 @@ def get_all_patients_summary():
     return _rows_to_dicts(rows)
 
 
+# Patient inserts shared by add_new_patient and the bulk importer (db/importer.py)
+INSERT_PATIENT = """INSERT INTO patients (patient_id, national_id, name, age, gender, blood_type, phone, emergency_contact)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+INSERT_DISEASE = "INSERT INTO chronic_diseases (patient_id, disease_name, severity) VALUES (?, ?, ?)"
+INSERT_ALLERGY = "INSERT INTO allergies (patient_id, allergen, reaction_type, severity) VALUES (?, ?, ?, ?)"
+INSERT_MEDICATION = "INSERT INTO current_medications (patient_id, drug_name, dose, frequency, reason) VALUES (?, ?, ?, ?, ?)"
+
+
+def patient_row(patient_id, national_id, name, age, gender, blood_type, phone, emergency_contact):
+    """INSERT_PATIENT parameters (patient_id None = next AUTOINCREMENT id)."""
+    return (patient_id, national_id, name, age, gender, blood_type, phone, emergency_contact)
+
+
+def disease_rows(patient_id, diseases):
+    return [(patient_id, d.get('name', ''), d.get('severity', 'متوسط')) for d in diseases or ()]
+
+
+def allergy_rows(patient_id, allergies_list):
+    return [
+        (patient_id, a.get('allergen', ''), a.get('reaction', ''), a.get('severity', 'متوسط'))
+        for a in allergies_list or ()
+    ]
+
+
+def medication_rows(patient_id, medications):
+    return [
+        (patient_id, m.get('name', ''), m.get('dose', ''), m.get('frequency', ''), m.get('reason', ''))
+        for m in medications or ()
+    ]
+
+
 def add_new_patient(national_id, name, age, gender, blood_type, phone, emergency_contact,
                     diseases=None, allergies_list=None, medications=None):
     """Add a new patient with optional medical data. Returns the new patient_id."""
     conn = get_connection()
     cursor = conn.cursor()
 
-    cursor.execute(
-        """INSERT INTO patients (national_id, name, age, gender, blood_type, phone, emergency_contact)
-           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-        (national_id, name, age, gender, blood_type, phone, emergency_contact)
-    )
+    cursor.execute(INSERT_PATIENT, patient_row(
+        None, national_id, name, age, gender, blood_type, phone, emergency_contact
+    ))
     patient_id = cursor.lastrowid
 
-    if diseases:
-        for d in diseases:
-            cursor.execute(
-                "INSERT INTO chronic_diseases (patient_id, disease_name, severity) VALUES (?, ?, ?)",
-                (patient_id, d.get('name', ''), d.get('severity', 'متوسط'))
-            )
-
-    if allergies_list:
-        for a in allergies_list:
-            cursor.execute(
-                "INSERT INTO allergies (patient_id, allergen, reaction_type, severity) VALUES (?, ?, ?, ?)",
-                (patient_id, a.get('allergen', ''), a.get('reaction', ''), a.get('severity', 'متوسط'))
-            )
-
-    if medications:
-        for m in medications:
-            cursor.execute(
-                "INSERT INTO current_medications (patient_id, drug_name, dose, frequency, reason) VALUES (?, ?, ?, ?, ?)",
-                (patient_id, m.get('name', ''), m.get('dose', ''), m.get('frequency', ''), m.get('reason', ''))
-            )
+    cursor.executemany(INSERT_DISEASE, disease_rows(patient_id, diseases))
+    cursor.executemany(INSERT_ALLERGY, allergy_rows(patient_id, allergies_list))
+    cursor.executemany(INSERT_MEDICATION, medication_rows(patient_id, medications))
 
     conn.commit()
     conn.close()
@@ -200,5 +308,7 @@ def add_visit(patient_id, visit_date, department, reason, diagnosis="", treatmen
            VALUES (?, ?, ?, ?, ?, ?, ?)""",
         (patient_id, visit_date, department, reason, diagnosis, treatment, doctor_notes)
     )
+    # Index it in the same transaction, so searches never have to
+    sync_visits_fts(conn)
     conn.commit()
     conn.close()
@@ -0,0 +1,185 @@
+"""
+records.py — Compact record types for patient data, contraindications, drug classes and alerts.
+Rows are built straight from the cursor (see from_row) into frozen, slotted
+dataclasses instead of one dict per row. Records keep the read-only mapping
+interface the UI, prompts and notebooks already use: record['name'],
+record.get('name', default), dict(record).
+"""
+
+import sys
+from dataclasses import dataclass, fields
+from enum import Enum
+
+
+class RiskLevel(str, Enum):
+    """Contraindication risk levels — one shared object per level, equal to its plain string."""
+    CRITICAL = 'critical'
+    HIGH = 'high'
+    MODERATE = 'moderate'
+
+    def __str__(self):
+        return self.value
+
+    @classmethod
+    def parse(cls, value):
+        """The shared member for a stored level (unknown levels as interned strings)."""
+        try:
+            return cls(value)
+        except ValueError:
+            return sys.intern(value) if isinstance(value, str) else value
+
+
+class Record:
+    """Read-only mapping access over a dataclass's fields."""
+    __slots__ = ()
+
+    @classmethod
+    def columns(cls):
+        """Column list for SELECT, in field order (what from_row expects)."""
+        return ", ".join(cls._fields)
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """sqlite3 row_factory: positional row → record, no intermediate dict."""
+        return cls(*row)
+
+    def __getitem__(self, key):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._fields else default
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(getattr(self, name) for name in self._fields)
+
+    def items(self):
+        return tuple((name, getattr(self, name)) for name in self._fields)
+
+
+def record(cls):
+    """Class decorator: frozen, slotted dataclass with the Record mapping interface."""
+    cls = dataclass(frozen=True, slots=True)(cls)
+    cls._fields = tuple(f.name for f in fields(cls))
+    return cls
+
+
+@record
+class Patient(Record):
+    patient_id: int
+    national_id: str
+    name: str
+    age: int
+    gender: str
+    blood_type: str
+    phone: str
+    emergency_contact: str
+
+
+@record
+class ChronicDisease(Record):
+    id: int
+    patient_id: int
+    disease_name: str
+    diagnosed_date: str
+    severity: str
+    notes: str
+
+
+@record
+class Allergy(Record):
+    id: int
+    patient_id: int
+    allergen: str
+    reaction_type: str
+    severity: str
+
+
+@record
+class Medication(Record):
+    id: int
+    patient_id: int
+    drug_name: str
+    dose: str
+    frequency: str
+    reason: str
+
+
+@record
+class Surgery(Record):
+    id: int
+    patient_id: int
+    surgery_name: str
+    surgery_date: str
+    notes: str
+
+
+@record
+class Visit(Record):
+    id: int
+    patient_id: int
+    visit_date: str
+    department: str
+    reason: str
+    diagnosis: str
+    treatment: str
+    doctor_notes: str
+
+
+@record
+class LabResult(Record):
+    id: int
+    patient_id: int
+    test_name: str
+    result_value: str
+    normal_range: str
+    test_date: str
+    is_abnormal: int
+
+
+@record
+class Contraindication(Record):
+    id: int
+    disease_name: str
+    contraindicated_substance: str
+    risk_level: RiskLevel
+    reason: str
+    source: str
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        # Disease names repeat across the whole formulary — share one string each
+        id_, disease_name, substance, risk_level, reason, source = row
+        return cls(id_, sys.intern(disease_name), substance, RiskLevel.parse(risk_level), reason, source)
+
+
+@record
+class DrugClassLink(Record):
+    """member_name (a drug or a sub-class) belongs to class_name."""
+    id: int
+    member_name: str
+    class_name: str
+
+
+@record
+class Alert(Record):
+    """A screening alert shown in the UI (type: critical / high / moderate)."""
+    type: str
+    title: str
+    message: str
+    details: str = ''
+    risk_level: str = None
+    confidence: str = 'high'
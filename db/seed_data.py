@@ -1,22 +1,38 @@
 """
-seed_data.py — Seed the database with 5 demo patients and contraindications.
+seed_data.py — Seed the database with 5 demo patients, contraindications and drug classes.
 Each patient has a specific clinical scenario designed for the hackathon demo.
+The app seeds only an empty database (seed_if_empty), so imported patients survive restarts.
 """
 
 import sqlite3
 import os
 from db.init_db import get_connection, init_database
 
+# Wipe and re-seed on every start, even when the database already holds patients
+RESEED = os.environ.get("MEDGEMMA_RESEED", "false").lower() == "true"
+
+
+def seed_if_empty():
+    """Seed the demo data when there are no patients yet (or always, with MEDGEMMA_RESEED=true)."""
+    conn = get_connection()
+    has_patients = conn.execute("SELECT 1 FROM patients LIMIT 1").fetchone() is not None
+    conn.close()
+    if has_patients and not RESEED:
+        print("ℹ️ Database already has patients — seeding skipped (MEDGEMMA_RESEED=true to reset)")
+        return False
+    seed_all()
+    return True
+
 
 def seed_all():
-    """Seed the database with all demo data."""
+    """Seed the database with all demo data (deletes every existing patient)."""
     conn = get_connection()
     cursor = conn.cursor()
 
-    # Clear existing data
+    # Clear existing data — and the import checkpoints, or re-importing would skip the wiped records
     for table in [
-        "contraindications", "lab_results", "visits", "surgeries",
-        "current_medications", "allergies", "chronic_diseases", "patients"
+        "drug_classes", "contraindications", "lab_results", "visits", "surgeries",
+        "current_medications", "allergies", "chronic_diseases", "patients", "import_checkpoints"
     ]:
         cursor.execute(f"DELETE FROM {table}")
 
@@ -216,9 +232,56 @@ def seed_all():
         contraindications_data
     )
 
+    # ══════════════════════════════════════════════════════════════
+    # فئات الأدوية — تربط الدواء بفئته حتى تنطبق موانع الفئة عليه
+    # (member → class؛ الفئة نفسها قد تنتمي لفئة أعم)
+    # ══════════════════════════════════════════════════════════════
+    # Names must not contain one another (the screener matches substrings):
+    # e.g. Ofloxacin ⊂ Levofloxacin, Prednisolone ⊂ Methylprednisolone
+    drug_classes_data = [
+        # NSAIDs — low-dose Aspirin is deliberately not a member: it has its own
+        # contraindications and is cardioprotective in coronary disease
+        ('Ibuprofen', 'NSAIDs'), ('Diclofenac', 'NSAIDs'), ('Naproxen', 'NSAIDs'),
+        ('Ketoprofen', 'NSAIDs'), ('Mefenamic acid', 'NSAIDs'), ('Indomethacin', 'NSAIDs'),
+        ('Piroxicam', 'NSAIDs'), ('Meloxicam', 'NSAIDs'), ('Ketorolac', 'NSAIDs'),
+        ('COX-2 inhibitors', 'NSAIDs'), ('Celecoxib', 'COX-2 inhibitors'), ('Etoricoxib', 'COX-2 inhibitors'),
+
+        # Beta-blockers
+        ('Bisoprolol', 'Beta-blockers'), ('Atenolol', 'Beta-blockers'), ('Metoprolol', 'Beta-blockers'),
+        ('Propranolol', 'Beta-blockers'), ('Carvedilol', 'Beta-blockers'), ('Nebivolol', 'Beta-blockers'),
+
+        # Fluoroquinolones
+        ('Ciprofloxacin', 'Fluoroquinolones'), ('Levofloxacin', 'Fluoroquinolones'),
+        ('Moxifloxacin', 'Fluoroquinolones'),
+
+        # Aminoglycosides
+        ('Gentamicin', 'Aminoglycosides'), ('Amikacin', 'Aminoglycosides'), ('Tobramycin', 'Aminoglycosides'),
+        ('Streptomycin', 'Aminoglycosides'), ('Neomycin', 'Aminoglycosides'),
+
+        # Corticosteroids
+        ('Prednisolone', 'Corticosteroids'), ('Prednisone', 'Corticosteroids'),
+        ('Dexamethasone', 'Corticosteroids'), ('Hydrocortisone', 'Corticosteroids'),
+
+        # Thiazide diuretics
+        ('Hydrochlorothiazide', 'Thiazide Diuretics'), ('Chlorthalidone', 'Thiazide Diuretics'),
+        ('Indapamide', 'Thiazide Diuretics'),
+
+        # Triptans
+        ('Sumatriptan', 'Triptans'), ('Rizatriptan', 'Triptans'), ('Zolmitriptan', 'Triptans'),
+
+        # Penicillins (for penicillin allergy)
+        ('Amoxicillin', 'Penicillin'), ('Ampicillin', 'Penicillin'), ('Flucloxacillin', 'Penicillin'),
+        ('Piperacillin', 'Penicillin'), ('Amoxicillin-Clavulanate', 'Amoxicillin'),
+    ]
+
+    cursor.executemany(
+        "INSERT INTO drug_classes (member_name, class_name) VALUES (?, ?)",
+        drug_classes_data
+    )
+
     conn.commit()
     conn.close()
-    print("✅ Seed data inserted successfully — 5 patients + contraindications table")
+    print("✅ Seed data inserted successfully — 5 patients + contraindications + drug classes")
 
 
 if __name__ == "__main__":
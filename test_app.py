@@ -24,6 +24,34 @@ print(f"   Patients count: {len(patients)}")
 for p in patients:
     print(f"   {p['patient_id']}. {p['name']} — {p['age']} سنة")
 
+from db.init_db import get_pool_stats
+get_patient_full_record(1)
+assert get_pool_stats()['opened'] == 1, "pooled connection was not reused"
+print("   ✅ one pooled connection reused across queries")
+
+# Bulk import: duplicates and invalid records skipped, re-running resumes from the checkpoint
+import json
+import tempfile
+from db.importer import import_file
+with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False, encoding="utf-8") as f:
+    for record in (
+        {"national_id": "30101010101010", "name": "مريض مستورد", "age": 40, "diseases": [{"name": "ربو"}]},
+        {"national_id": "29012345678901", "name": "مكرر"},
+        {"name": "بدون رقم قومي"},
+        {"national_id": "30101010101011", "name": "جرعة غير صالحة", "medications": [{"name": "X", "dose": {"mg": 5}}]},
+    ):
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+stats = import_file(f.name)
+assert (stats['imported'], stats['duplicates'], stats['invalid']) == (1, 1, 2)
+assert import_file(f.name)['resumed'] == 4
+# Startup seeding keeps imported patients; a full re-seed also forgets the checkpoints
+from db.seed_data import seed_if_empty
+assert seed_if_empty() is False
+seed_all()
+assert import_file(f.name)['imported'] == 1
+os.remove(f.name)
+print("   ✅ bulk import deduplicated, validated and resumable")
+
 # Test 4: Session Cache + Contraindication check
 print("\n🧠 Test 4: Session Cache + Contraindication check...")
 from ai.session_cache import SessionCache
@@ -36,6 +64,68 @@ for a in alerts:
     print(f"   🔴 {a['title']}")
     print(f"      {a['message']}")
 
+# Incremental refresh: only the table that changed is re-fetched
+from db.queries import add_visit
+assert cache.refresh() == []
+visits_before = len(cache.visits)
+cache.ai_summary = "ملخص"
+add_visit(3, "2026-01-01", "طوارئ", "متابعة")
+assert cache.refresh() == ['visits'] and len(cache.visits) == visits_before + 1
+assert cache.ai_summary == "ملخص"
+cache.ai_summary = None
+print("   ✅ refresh() reloaded only the visits table and kept the summary")
+
+# Full-text history: normalized spelling/article, only diagnosed visits, best match first
+history = cache.get_relevant_history("صعوبة في البلع")
+assert history and 'بلع' in history[0]['reason']
+print("   ✅ relevant history found through visits_fts")
+
+# Memoized context: entering vitals only appends to the stable record block
+record_context = cache.get_context_for_ai()
+cache.current_vitals = {'spo2': 91}
+assert cache.get_context_for_ai().startswith(record_context + "\n\n")
+print("   ✅ context record block memoized, vitals appended")
+
+# Drug classes: a brand-name beta-blocker hits the asthma patient's Beta-blockers rule
+asthma_cache = SessionCache(4)
+assert any('Bisoprolol' in a['title'] for a in asthma_cache.check_multiple_substances('Concor 5mg'))
+print("   ✅ Bisoprolol (Concor) caught through its drug class")
+
+# A sulfate salt is not a sulfa drug (patient 5 is allergic to sulfa drugs)
+assert SessionCache(5).check_multiple_substances('Magnesium sulfate 2g IV') == []
+print("   ✅ no sulfa alert for Magnesium sulfate")
+
+# Names match at word starts only: "industrial" and "اقتراب" do not mention dust (patient 4's allergy)
+assert asthma_cache.check_multiple_substances('industrial worker, اقتراب الموعد') == []
+assert any('غبار' in a['title'] for a in asthma_cache.check_multiple_substances('تعرض للغبار وبالتراب'))
+print("   ✅ no dust alert inside other words, prefixed Arabic still matched")
+
+# Latin names are whole words: "reciprocal" is not Cipro, "concordant" is not Concor
+assert SessionCache(3).check_multiple_substances('reciprocal tendon reflexes') == []
+assert asthma_cache.check_multiple_substances('concordant findings') == []
+print("   ✅ no Ciprofloxacin/Bisoprolol alert for reciprocal/concordant")
+
+# An exact hit is not also reported as a near-match of a similar name (patient 2: diabetes)
+prednisone_alerts = SessionCache(2).check_multiple_substances('prednisone 40mg')
+assert [a['title'] for a in prednisone_alerts] == ['خطر عالي: تعارض Prednisone مع سكري نوع 2']
+print("   ✅ exact Prednisone match without a «≈ prednisolone» alert")
+
+# Misspellings still alert, one level lower and marked low confidence
+[near] = SessionCache(3).check_multiple_substances('Magnesuim 2g IV')
+assert near['confidence'] == 'low' and near['type'] == 'high' and 'Magnesium' in near['title']
+assert any(a['confidence'] == 'low' and 'Penicillin' in a['title']
+           for a in SessionCache(2).check_multiple_substances('Amoxicilin 1g'))
+print("   ✅ Magnesuim / Amoxicilin caught as low-confidence near-matches")
+
+# Live screening: each edit re-screens only new segments and reports only a changed alert set
+checker = SessionCache(3).get_incremental_checker('medications_given')
+assert checker.update("Magnesium 2g") and len(checker.alerts) == 1
+assert checker.update("Magnesium 2g, Gentamicin 80mg") and len(checker.alerts) == 2
+assert checker.screened_segments == 2
+assert not checker.update("Magnesium 2g, Gentamicin 80mg, محلول ملحي")
+assert checker.screened_segments == 3 and len(checker.alerts) == 2
+print("   ✅ incremental checker screened only new segments, no update without new alerts")
+
 # Test 5: MedGemma Mock
 print("\n🧠 Test 5: MedGemma mock inference...")
 os.environ['MEDGEMMA_MOCK'] = 'true'
@@ -45,8 +135,106 @@ load_medgemma()
 response = ask_medgemma("ملخص سريع عن مريضة سارة خالد Myasthenia Gravis", system_prompt=SYSTEM_PROMPT)
 print(f"   Response preview: {response[:100]}...")
 
-# Test 6: Gradio import
-print("\n🎨 Test 6: Gradio import...")
+# Response cache: a miss, then a memory hit for the same key
+from ai.response_cache import ResponseCache, make_key
+response_cache = ResponseCache(path=None)
+key = make_key("mock", SYSTEM_PROMPT, "", "سؤال", 64, {})
+assert response_cache.get(key) is None
+response_cache.put(key, "جواب")
+assert response_cache.get(key) == "جواب"
+assert (response_cache.stats()['memory_hits'], response_cache.stats()['misses']) == (1, 1)
+
+# Only deterministic decoding is cached: sampled backends (cache_params() is None) get no key
+import ai.response_cache
+from ai.medgemma_client import get_backend, _response_cache_key
+
+
+class _SampledBackend:
+    model_id = "sampled"
+
+    def cache_params(self):
+        return None
+
+
+ai.response_cache.RESPONSE_CACHE_ENABLED = True
+assert _response_cache_key(get_backend(), "سؤال", SYSTEM_PROMPT, 64, "") is not None
+assert _response_cache_key(_SampledBackend(), "سؤال", SYSTEM_PROMPT, 64, "") is None
+ai.response_cache.RESPONSE_CACHE_ENABLED = False
+print("   ✅ response cache hit/miss counted, sampled decoding not cached")
+
+# Inference queue: critical requests jump the queue; a full queue rejects all but critical ones
+import asyncio
+import threading
+from ai.inference_queue import InferenceQueue, QueueFullError
+
+
+async def _run_inference_queue():
+    queue = InferenceQueue(workers=1, max_pending=2, critical_workers=0)
+    release = threading.Event()
+    order = []
+    blocker = queue.submit("🟢 عادي", release.wait)
+    await blocker.wait_started()
+    routine = queue.submit("🟢 عادي", order.append, "routine")
+    critical = queue.submit("⚫ حرج", order.append, "critical")
+    assert (critical.position(), routine.position()) == (0, 1)
+    try:
+        queue.submit("🟡 متوسط", order.append, "rejected")
+        raise AssertionError("full queue accepted a non-critical request")
+    except QueueFullError:
+        pass
+    late_critical = queue.submit("⚫ حرج", order.append, "late critical")
+    release.set()
+    for ticket in (blocker, routine, critical, late_critical):
+        await ticket.result()
+    return order, queue.stats()['rejected']
+
+
+assert asyncio.run(_run_inference_queue()) == (["critical", "late critical", "routine"], 1)
+print("   ✅ inference queue ran critical requests first and rejected overflow")
+
+# Test 6: HTTP backend against a local OpenAI-compatible stub
+print("\n🌐 Test 6: HTTP inference backend...")
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ai.backends import OpenAIHTTPBackend
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        answer = f"echo: {body['messages'][-1]['content']}"
+        if body.get('stream'):
+            events = [{'choices': [{'delta': {'content': word + ' '}}]} for word in answer.split()]
+            data = "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\n"
+            content_type = "text/event-stream"
+        else:
+            data = json.dumps({'choices': [{'message': {'content': answer}}]})
+            content_type = "application/json"
+        payload = data.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+backend = OpenAIHTTPBackend(f"http://127.0.0.1:{server.server_address[1]}", model="stub")
+assert backend.generate("hello", system_prompt=SYSTEM_PROMPT) == "echo: hello"
+assert "".join(backend.stream("hello world")).strip() == "echo: hello world"
+assert backend._pool.opened == 1, "keep-alive connection was not reused"
+print("   ✅ generate + stream over one pooled connection")
+backend.close()
+server.shutdown()
+
+# Test 7: Gradio import
+print("\n🎨 Test 7: Gradio import...")
 try:
     import gradio as gr
     print(f"   Gradio version: {gr.__version__}")
@@ -3,9 +3,10 @@ chat_ui.py — Simple Chat Interface for direct model interaction.
 """
 
 import gradio as gr
-from ai.medgemma_client import ask_medgemma
+from ai.medgemma_client import stream_medgemma_async
+from ai.inference_queue import QueueFullError, CHAT_PRIORITY
 
-def respond(message, history):
+async def respond(message, history):
     """
     Generate a response from MedGemma without any system prompt using ChatInterface.
     history is the list of [user_msg, bot_msg] pairs provided by ChatInterface, 
@@ -31,8 +32,18 @@ def respond(message, history):
     # But ask_medgemma does its own tokenization. 
     
     # Let's try sending just the message first as it's the safest interpretation of "raw".
-    response = ask_medgemma(message, system_prompt="")
-    return response
+    # Yield the growing response so the first tokens show up immediately.
+    # Free chat runs at the lowest priority so it never delays a patient task.
+    response = ""
+    try:
+        async for position, chunk in stream_medgemma_async(message, system_prompt="", priority=CHAT_PRIORITY):
+            if chunk is None:
+                yield f"⏳ في قائمة الانتظار — عدد الطلبات قبلك: {position}"
+                continue
+            response += chunk
+            yield response
+    except QueueFullError:
+        yield "⚠️ النظام مشغول حالياً — حاول مرة أخرى بعد قليل."
 
 def create_chat_ui():
     """Create the Chat Interface tab."""
@@ -47,4 +58,6 @@ def create_chat_ui():
             description="هذه واجهة محادثة مباشرة مع نموذج MedGemma بدون أي System Prompt.",
             examples=["مرحباً", "من أنت؟", "تحدث عن الطب"],
             cache_examples=False,
+            # Queued by the InferenceQueue at CHAT_PRIORITY, not one at a time by Gradio
+            concurrency_limit=None,
         )
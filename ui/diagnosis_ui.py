@@ -7,26 +7,29 @@ import gradio as gr
 from ui.components import (
     CUSTOM_CSS, create_header, create_alert_html, get_gradio_theme
 )
-from ai.analyzer import run_diagnosis_loop, check_vitals_simple
+from ai.analyzer import stream_diagnosis_loop, check_vitals_simple
 from ai.medgemma_client import ask_medgemma
 from ai.prompts import SYSTEM_PROMPT
 
 
-def _get_cache():
-    """Get the current session cache."""
+def _get_cache(request):
+    """Get this session's current patient cache."""
     from ui.reception_ui import get_current_cache
-    return get_current_cache()
+    return get_current_cache(request)
 
 
-def on_load_diagnosis_data():
+def on_load_diagnosis_data(request: gr.Request):
     """Load current patient data and form inputs for diagnosis."""
-    cache = _get_cache()
+    cache = _get_cache(request)
     if cache is None:
         return (
             "<div style='text-align:center;color:#dc2626;padding:30px;'>⚠️ لم يتم اختيار مريض</div>",
             "", ""
         )
 
+    # Pick up visits/labs/etc. written since the cache was loaded (cheap when unchanged)
+    cache.refresh()
+
     # Build input summary
     p = cache.patient_info
     summary_parts = []
@@ -72,14 +75,16 @@ def on_load_diagnosis_data():
     return input_summary, "", contra_html
 
 
-def on_run_diagnosis(chief_complaint, additional_notes, transcript):
-    """Run the diagnostic detective loop."""
-    cache = _get_cache()
+async def on_run_diagnosis(chief_complaint, additional_notes, transcript, request: gr.Request):
+    """Run the diagnostic detective loop, streaming the log as it is generated."""
+    cache = _get_cache(request)
     if cache is None:
-        return "⚠️ لم يتم اختيار مريض — ارجع لواجهة الاستقبال", ""
+        yield "⚠️ لم يتم اختيار مريض — ارجع لواجهة الاستقبال", ""
+        return
 
     if not chief_complaint or not chief_complaint.strip():
-        return "⚠️ يرجى إدخال الشكوى الرئيسية", ""
+        yield "⚠️ يرجى إدخال الشكوى الرئيسية", ""
+        return
 
     # Compile form data
     form_data = f"""
@@ -94,15 +99,21 @@ def on_run_diagnosis(chief_complaint, additional_notes, transcript):
         for u in cache.session_updates:
             form_data += f"  • {u.get('field', '')}: {u.get('value', '')}\n"
 
-    # Run the diagnosis loop
-    ai_result, substance_alerts = run_diagnosis_loop(
+    # Run the diagnosis loop — red alerts are shown before the first token
+    red_alerts_html = None
+    async for ai_result, substance_alerts in stream_diagnosis_loop(
         cache,
         chief_complaint,
         form_data,
         transcript or ""
-    )
+    ):
+        if red_alerts_html is None:
+            red_alerts_html = _build_red_alerts_html(cache, substance_alerts)
+        yield ai_result or "🧠 جارٍ التشخيص...", red_alerts_html
+
 
-    # Build red alerts HTML
+def _build_red_alerts_html(cache, substance_alerts):
+    """Build the red alerts panel from text alerts and the patient's contraindications."""
     red_alerts_html = ""
 
     # Substance alerts from the text
@@ -127,7 +138,7 @@ def on_run_diagnosis(chief_complaint, additional_notes, transcript):
     if not red_alerts_html:
         red_alerts_html = create_alert_html('success', 'لا توجد تحذيرات حرجة', 'لم يتم اكتشاف أي تعارضات أو مخاطر')
 
-    return ai_result, red_alerts_html
+    return red_alerts_html
 
 
 def create_diagnosis_ui():
@@ -193,25 +204,28 @@ def create_diagnosis_ui():
                 red_alerts_display = gr.HTML()
 
         # ── Event Handlers ──
+        # No Gradio concurrency limit — the triage InferenceQueue orders and bounds the LLM work
         load_diag_btn.click(
             fn=on_load_diagnosis_data,
-            outputs=[input_summary, diagnosis_log, red_alerts_display]
+            outputs=[input_summary, diagnosis_log, red_alerts_display],
+            concurrency_limit=None
         )
 
         run_diag_btn.click(
             fn=on_run_diagnosis,
             inputs=[diag_complaint, diag_notes, diag_transcript],
-            outputs=[diagnosis_log, red_alerts_display]
+            outputs=[diagnosis_log, red_alerts_display],
+            concurrency_limit=None
         )
 
 
 if __name__ == "__main__":
     from db.init_db import init_database
-    from db.seed_data import seed_all
+    from db.seed_data import seed_if_empty
     from ai.medgemma_client import load_medgemma
 
     init_database()
-    seed_all()
+    seed_if_empty()
     load_medgemma()
 
     with gr.Blocks(theme=get_gradio_theme(), css=CUSTOM_CSS, title="Gemma-Health Sentinel — التشخيص") as demo:
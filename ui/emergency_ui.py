@@ -3,25 +3,30 @@ emergency_ui.py — Emergency department screen for Gemma-Health Sentinel.
 Digital ER form + AI sidebar with real-time contraindication checking.
 """
 
+import asyncio
+
 import gradio as gr
 from ui.components import (
     CUSTOM_CSS, create_header, create_patient_banner_html,
     create_alert_html, get_gradio_theme
 )
-from ai.analyzer import check_vitals, check_vitals_simple, analyze_conversation, generate_suggestions
+from ai.analyzer import (
+    check_vitals, check_vitals_simple, stream_conversation_analysis, stream_suggestions, await_summary
+)
+from ai.incremental_checker import SCREEN_DEBOUNCE_SECONDS
 from ai.medgemma_client import ask_medgemma
 from ai.prompts import SYSTEM_PROMPT
 
 
-def _get_cache():
-    """Get the current session cache from the reception module."""
+def _get_cache(request):
+    """Get this session's current patient cache from the reception module."""
     from ui.reception_ui import get_current_cache
-    return get_current_cache()
+    return get_current_cache(request)
 
 
-def on_load_patient():
+async def on_load_patient(request: gr.Request):
     """Load the current patient's data into the emergency form."""
-    cache = _get_cache()
+    cache = _get_cache(request)
     if cache is None:
         return (
             "<div style='text-align:center;color:#dc2626;padding:30px;font-size:16px;'>"
@@ -32,6 +37,9 @@ def on_load_patient():
             "",  # red_alerts
         )
 
+    # Pick up visits/labs/etc. written since the cache was loaded (cheap when unchanged)
+    cache.refresh()
+
     # Patient banner
     banner_data = cache.get_patient_banner_data()
     visit_reason = ""
@@ -44,8 +52,8 @@ def on_load_patient():
 
     banner_html = create_patient_banner_html(banner_data, visit_reason, priority)
 
-    # AI Summary
-    ai_summary = cache.ai_summary or "لم يتم توليد ملخص بعد"
+    # AI Summary — waits for the background job started at reception if still running
+    ai_summary = await await_summary(cache) or "لم يتم توليد ملخص بعد"
 
     # Pre-fill past history from DB
     diseases = cache.chronic_diseases
@@ -80,17 +88,59 @@ def on_load_patient():
                     f"المرض: {ci['disease_name']} | المصدر: {ci.get('source', '')}"
                 )
 
+    # The patient's own medications against their diseases/allergies (incl. drug classes)
+    medication_alerts = cache.check_current_medications()
+    if medication_alerts:
+        red_alerts += "<h4 style='color:#dc2626;text-align:right;'>💊 تعارض في الأدوية الحالية:</h4>"
+        for a in medication_alerts:
+            red_alerts += create_alert_html(a['type'], a['title'], a['message'], a.get('details', ''))
+
     return banner_html, ai_summary, past_history, current_meds, red_alerts
 
 
-def on_check_substance(substance_text):
-    """Check medications/substances against patient contraindications."""
-    cache = _get_cache()
-    if cache is None or not substance_text or not substance_text.strip():
+async def on_check_substance(substance_text, request: gr.Request):
+    """Check medications/substances against patient contraindications (live, debounced)."""
+    return await _screen_field('substance_taken', substance_text, request)
+
+
+async def on_substance_blur(substance_text, request: gr.Request):
+    """Final check when the field loses focus — no debounce."""
+    return _screen_now('substance_taken', substance_text, request)
+
+
+async def _screen_field(field, text, request):
+    """
+    Screen a textbox on change: wait out the debounce window, skip the event
+    if a newer keystroke arrived, re-screen only the edited lines and send
+    HTML only when the alerts changed.
+    """
+    cache = _get_cache(request)
+    if cache is None:
         return ""
 
-    alerts = cache.check_multiple_substances(substance_text)
+    checker = cache.get_incremental_checker(field)
+    seq = checker.begin()
+    await asyncio.sleep(SCREEN_DEBOUNCE_SECONDS)
+    if not checker.is_latest(seq) or not checker.update(text):
+        return gr.update()
+    return _substance_alerts_html(text, checker.alerts)
+
 
+def _screen_now(field, text, request):
+    # Called from async handlers only: checkers are not thread-safe, so all of
+    # their state stays on the event loop with _screen_field
+    cache = _get_cache(request)
+    if cache is None:
+        return ""
+    checker = cache.get_incremental_checker(field)
+    checker.begin()  # supersedes any change event still waiting out the debounce
+    checker.update(text)
+    return _substance_alerts_html(text, checker.alerts)
+
+
+def _substance_alerts_html(text, alerts):
+    if not text or not text.strip():
+        return ""
     if not alerts:
         return create_alert_html('success', 'لا توجد تعارضات', 'لم يتم اكتشاف أي تعارض مع المواد المذكورة')
 
@@ -100,9 +150,10 @@ def on_check_substance(substance_text):
     return html
 
 
-def on_check_vitals(systolic, diastolic, heart_rate, spo2, temp, resp_rate, gcs):
+def on_check_vitals(systolic, diastolic, heart_rate, spo2, temp, resp_rate, gcs,
+                    request: gr.Request):
     """Validate vital signs and generate alerts."""
-    cache = _get_cache()
+    cache = _get_cache(request)
 
     vitals = {
         'systolic_bp': systolic,
@@ -133,37 +184,37 @@ def on_check_vitals(systolic, diastolic, heart_rate, spo2, temp, resp_rate, gcs)
     return vitals_text, alerts_html
 
 
-def on_analyze_conversation(transcript):
-    """Analyze doctor-patient conversation."""
-    cache = _get_cache()
+async def on_analyze_conversation(transcript, request: gr.Request):
+    """Analyze doctor-patient conversation, streaming the AI analysis."""
+    cache = _get_cache(request)
     if cache is None:
-        return "⚠️ لم يتم اختيار مريض", ""
+        yield "⚠️ لم يتم اختيار مريض", ""
+        return
 
     if not transcript or not transcript.strip():
-        return "لم يتم تقديم نص محادثة", ""
-
-    result = analyze_conversation(transcript, cache)
-    if isinstance(result, tuple):
-        ai_analysis, substance_alerts = result
-    else:
-        ai_analysis = result
-        substance_alerts = []
-
-    # Generate alerts HTML
-    alerts_html = ""
-    if substance_alerts:
-        alerts_html = "<h4 style='color:#dc2626;text-align:right;'>🔴 تنبيهات من المحادثة:</h4>"
-        for a in substance_alerts:
-            alerts_html += create_alert_html(a['type'], a['title'], a['message'], a.get('details', ''))
-
-    return ai_analysis, alerts_html
-
-
-def on_update_analysis(chief_complaint, hpi, medications_given, substance_taken):
-    """Update AI analysis based on current form data."""
-    cache = _get_cache()
+        yield "لم يتم تقديم نص محادثة", ""
+        return
+
+    alerts_html = None
+    async for ai_analysis, substance_alerts in stream_conversation_analysis(transcript, cache):
+        # Generate alerts HTML once — they do not change while the AI streams
+        if alerts_html is None:
+            alerts_html = ""
+            if substance_alerts:
+                alerts_html = "<h4 style='color:#dc2626;text-align:right;'>🔴 تنبيهات من المحادثة:</h4>"
+                for a in substance_alerts:
+                    alerts_html += create_alert_html(a['type'], a['title'], a['message'], a.get('details', ''))
+
+        yield ai_analysis or "🧠 جارٍ تحليل المحادثة...", alerts_html
+
+
+async def on_update_analysis(chief_complaint, hpi, medications_given, substance_taken,
+                             request: gr.Request):
+    """Update AI analysis based on current form data, streaming the suggestions."""
+    cache = _get_cache(request)
     if cache is None:
-        return "⚠️ لم يتم اختيار مريض"
+        yield "⚠️ لم يتم اختيار مريض"
+        return
 
     clinical_data = f"""
 الشكوى الرئيسية: {chief_complaint}
@@ -173,13 +224,19 @@ def on_update_analysis(chief_complaint, hpi, medications_given, substance_taken)
 """
     vitals_text = check_vitals_simple(cache.current_vitals) if cache.current_vitals else ""
 
-    suggestions = generate_suggestions(cache, clinical_data, vitals_text)
-    return suggestions
+    yield "🧠 جارٍ تجهيز الاقتراحات..."
+    async for suggestions in stream_suggestions(cache, clinical_data, vitals_text):
+        yield suggestions
+
 
+async def on_medications_given_change(meds_text, request: gr.Request):
+    """Check administered medications against patient data (live, debounced)."""
+    return await _screen_field('medications_given', meds_text, request)
 
-def on_medications_given_change(meds_text):
-    """Check administered medications against patient data."""
-    return on_check_substance(meds_text)
+
+async def on_medications_given_blur(meds_text, request: gr.Request):
+    """Final check of administered medications when the field loses focus."""
+    return _screen_now('medications_given', meds_text, request)
 
 
 def create_emergency_ui():
@@ -361,10 +418,14 @@ def create_emergency_ui():
                 conversation_alerts = gr.HTML()
 
         # ── Event Handlers ──
+        # LLM-bound events have no Gradio concurrency limit: Gradio's FIFO would
+        # otherwise serialize them before the triage InferenceQueue could reorder
+        # them (it bounds the load itself and rejects overflow with QueueFullError)
         load_btn.click(
             fn=on_load_patient,
             outputs=[patient_banner, ai_summary_display, past_history,
-                     current_meds_display, red_alerts_display]
+                     current_meds_display, red_alerts_display],
+            concurrency_limit=None
         )
 
         check_vitals_btn.click(
@@ -373,28 +434,48 @@ def create_emergency_ui():
             outputs=[vitals_status, vitals_alerts]
         )
 
+        # Live screening: only the last event of a typing burst runs (debounced
+        # in the handler, which mostly sleeps — hence no concurrency limit)
         substance_taken.change(
             fn=on_check_substance,
             inputs=[substance_taken],
+            outputs=[substance_alerts],
+            trigger_mode="always_last",
+            concurrency_limit=None,
+            show_progress="hidden"
+        )
+        substance_taken.blur(
+            fn=on_substance_blur,
+            inputs=[substance_taken],
             outputs=[substance_alerts]
         )
 
         medications_given.change(
             fn=on_medications_given_change,
             inputs=[medications_given],
+            outputs=[med_alerts],
+            trigger_mode="always_last",
+            concurrency_limit=None,
+            show_progress="hidden"
+        )
+        medications_given.blur(
+            fn=on_medications_given_blur,
+            inputs=[medications_given],
             outputs=[med_alerts]
         )
 
         update_analysis_btn.click(
             fn=on_update_analysis,
             inputs=[chief_complaint, hpi, medications_given, substance_taken],
-            outputs=[suggestions_display]
+            outputs=[suggestions_display],
+            concurrency_limit=None
         )
 
         analyze_btn.click(
             fn=on_analyze_conversation,
             inputs=[transcript_input],
-            outputs=[conversation_analysis, conversation_alerts]
+            outputs=[conversation_analysis, conversation_alerts],
+            concurrency_limit=None
         )
 
         save_btn.click(
@@ -406,11 +487,11 @@ def create_emergency_ui():
 
 if __name__ == "__main__":
     from db.init_db import init_database
-    from db.seed_data import seed_all
+    from db.seed_data import seed_if_empty
     from ai.medgemma_client import load_medgemma
 
     init_database()
-    seed_all()
+    seed_if_empty()
     load_medgemma()
 
     with gr.Blocks(theme=get_gradio_theme(), css=CUSTOM_CSS, title="Gemma-Health Sentinel — الطوارئ") as demo:
@@ -5,21 +5,17 @@ Patient selection/creation, patient card display, and transfer to ER.
 
 import gradio as gr
 from db.init_db import init_database, get_connection
-from db.seed_data import seed_all
+from db.seed_data import seed_if_empty
 from db.queries import (
-    get_all_patients_summary, get_patient_full_record, add_new_patient
+    get_all_patients_summary, add_new_patient
 )
 from ai.session_cache import SessionCache
-from ai.medgemma_client import ask_medgemma, load_medgemma
-from ai.prompts import SYSTEM_PROMPT, SUMMARY_PROMPT
+from ai.session_registry import get_session_registry, session_id
+from ai.medgemma_client import load_medgemma
+from ai.analyzer import precompute_summary, await_summary
 from ui.components import CUSTOM_CSS, create_header, get_gradio_theme
 from utils.helpers import format_patient_card_html
 
-# ── Global State ──
-_current_cache = None
-_current_patient_id = None
-
-
 def _get_patient_choices():
     """Get formatted patient list for dropdown."""
     # Patient-specific emojis
@@ -40,31 +36,35 @@ def _get_patient_choices():
     return choices
 
 
-def on_patient_select(patient_choice):
-    """Handle patient selection from dropdown."""
-    global _current_cache, _current_patient_id
-
+async def on_patient_select(patient_choice, request: gr.Request):
+    """Handle patient selection from dropdown — card right away, AI summary in on_summary_ready."""
     if patient_choice is None:
         return "", "<div style='text-align:center;color:#94a3b8;padding:40px;'>اختر مريضاً من القائمة</div>", ""
 
     patient_id = patient_choice
-    _current_patient_id = patient_id
 
-    # Create session cache (loads all data once)
-    _current_cache = SessionCache(patient_id)
+    # This workstation's cache for the patient (loads all data once, reused on re-select)
+    cache = get_session_registry().select(session_id(request), patient_id, SessionCache)
+    cache.refresh()
+
+    # Start the AI summary in the background, then show the card right away
+    precompute_summary(cache)
+    card_html = format_patient_card_html(cache.get_full_record())
+    return "🧠 AI يجهّز ملخص الحالة...", card_html, "✅ تم تحميل بيانات المريض — جاري تجهيز ملخص AI"
 
-    # Generate patient card HTML
-    record = get_patient_full_record(patient_id)
-    card_html = format_patient_card_html(record)
 
-    # Generate AI summary
-    ai_status = "🧠 AI يجهّز ملخص الحالة..."
-    context = _current_cache.get_context_for_ai()
-    prompt = SUMMARY_PROMPT.format(patient_context=context)
-    ai_summary = ask_medgemma(prompt, system_prompt=SYSTEM_PROMPT)
-    _current_cache.ai_summary = ai_summary
+async def on_summary_ready(patient_choice, request: gr.Request):
+    """Show the precomputed AI summary of the selected patient once it is ready."""
+    cache = get_current_cache(request)
+    if patient_choice is None or cache is None or cache.patient_id != patient_choice:
+        # Nothing selected, or another patient was selected meanwhile (its own event shows it)
+        return gr.update(), gr.update()
 
-    return ai_summary, card_html, "✅ تم تحميل بيانات المريض وتجهيز ملخص AI"
+    ai_summary = await await_summary(cache)
+    if ai_summary is None:
+        return ("⚠️ تعذّر توليد الملخص حالياً — سيُعاد المحاولة عند التحويل للطوارئ.",
+                "⚠️ تم تحميل بيانات المريض بدون ملخص AI")
+    return ai_summary, "✅ تم تحميل بيانات المريض وتجهيز ملخص AI"
 
 
 def on_add_patient(national_id, name, age, gender, blood_type, phone,
@@ -108,47 +108,51 @@ def on_add_patient(national_id, name, age, gender, blood_type, phone,
         return f"❌ خطأ: {str(e)}", _get_patient_choices()
 
 
-def on_transfer_to_er(visit_reason, priority, notes):
+async def on_transfer_to_er(visit_reason, priority, notes, request: gr.Request):
     """Handle transfer to emergency department."""
-    global _current_cache
-
-    if _current_cache is None:
+    cache = get_current_cache(request)
+    if cache is None:
         return "❌ يرجى اختيار مريض أولاً"
 
     if not visit_reason or not visit_reason.strip():
         return "❌ يرجى إدخال سبب الزيارة"
 
     # Store visit info in session cache
-    _current_cache.current_complaint = visit_reason
-    _current_cache.add_session_update('visit_reason', visit_reason)
-    _current_cache.add_session_update('priority', priority)
-    _current_cache.add_session_update('reception_notes', notes)
+    cache.current_complaint = visit_reason
+    cache.add_session_update('visit_reason', visit_reason)
+    cache.add_session_update('priority', priority)
+    cache.add_session_update('reception_notes', notes)
 
     # Record the visit
     from utils.helpers import get_date
     from db.queries import add_visit
     add_visit(
-        _current_cache.patient_id,
+        cache.patient_id,
         get_date(),
         'طوارئ',
         visit_reason,
         doctor_notes=notes or ''
     )
 
+    # Reload the visits table only (the summary started at selection is kept),
+    # then make sure the ER doctor finds a summary ready
+    cache.refresh()
+    precompute_summary(cache)
+
     return f"""✅ تم تسجيل وتحويل المريض للطوارئ بنجاح!
 
 📋 تفاصيل التحويل:
-• المريض: {_current_cache.patient_info.get('name', '')}
+• المريض: {cache.patient_info.get('name', '')}
 • سبب الزيارة: {visit_reason}
 • الأولوية: {priority}
 
-🧠 ملخص AI جاهز لطبيب الطوارئ
+🧠 ملخص AI {'جاهز' if cache.ai_summary else 'قيد التجهيز'} لطبيب الطوارئ
 ➡️ انتقل لتبويب "🚨 الطوارئ" للمتابعة"""
 
 
-def get_current_cache():
-    """Get the current session cache (used by emergency/diagnosis UIs)."""
-    return _current_cache
+def get_current_cache(request=None):
+    """Get this browser session's current patient cache (used by emergency/diagnosis UIs)."""
+    return get_session_registry().current(session_id(request))
 
 
 def create_reception_ui():
@@ -267,10 +271,18 @@ def create_reception_ui():
                 add_result = gr.Textbox(label="النتيجة", interactive=False)
 
         # ── Event Handlers ──
+        # The card event is quick; the summary wait runs as its own event with no
+        # concurrency limit, so one patient's LLM summary never delays another selection
         patient_dropdown.change(
             fn=on_patient_select,
             inputs=[patient_dropdown],
-            outputs=[ai_summary, patient_card, status_text]
+            outputs=[ai_summary, patient_card, status_text],
+            concurrency_limit=None
+        ).then(
+            fn=on_summary_ready,
+            inputs=[patient_dropdown],
+            outputs=[ai_summary, status_text],
+            concurrency_limit=None
         )
 
         transfer_btn.click(
@@ -291,7 +303,7 @@ def create_reception_ui():
 if __name__ == "__main__":
     # Initialize DB
     init_database()
-    seed_all()
+    seed_if_empty()
     load_medgemma()
 
     with gr.Blocks(theme=get_gradio_theme(), css=CUSTOM_CSS, title="Gemma-Health Sentinel — الاستقبال") as demo:
@@ -2,8 +2,21 @@
 helpers.py — General utility functions for Gemma-Health Sentinel.
 """
 
+import re
 from datetime import datetime
 
+# Harakat, tanween, shadda, sukun, superscript alef — and tatweel
+_ARABIC_MARKS = re.compile(r"[\u064B-\u0652\u0670\u0640]")
+_ARABIC_LETTER_VARIANTS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي',
+    'ؤ': 'و',
+    'ة': 'ه',
+})
+_SEPARATORS = re.compile(r"[\s\-_/]+")
+# Definite article, with an attached و/ف/ب/ك/ل — "والصداع" and "صداع" index alike
+_ARABIC_ARTICLE = re.compile(r"(?<!\w)(?:[وفبكل]?ال|لل)(?=\w\w)")
+
 
 def get_timestamp():
     """Get current timestamp as formatted string."""
@@ -15,6 +28,26 @@ def get_date():
     return datetime.now().strftime("%Y-%m-%d")
 
 
+def normalize_arabic(text):
+    """
+    Normalize text for matching: lowercase, strip diacritics/tatweel, unify
+    alef/ya/ta-marbuta variants and collapse separators to single spaces.
+    """
+    if not text:
+        return ""
+    text = _ARABIC_MARKS.sub("", text.lower()).translate(_ARABIC_LETTER_VARIANTS)
+    return _SEPARATORS.sub(" ", text).strip()
+
+
+def normalize_search_text(text):
+    """
+    normalize_arabic plus light stemming (definite article and its attached
+    prefixes stripped) — applied to full-text indexed text and to its queries.
+    Used by db.queries.sync_visits_fts to index visits.
+    """
+    return _ARABIC_ARTICLE.sub("", normalize_arabic(text))
+
+
 def format_patient_label(patient):
     """Format patient name for dropdown display with emoji indicators."""
     pid = patient.get('patient_id', '?')